@@ -1,7 +1,12 @@
 import numpy as np
 import math
+import time
 
 PENALTY = -4
+# Default round budget of a negotiation, a trading that runs out of rounds fails
+MAX_ROUNDS = 100
+# Maximum number of decisions kept in a workspace's decision cache
+DECISION_CACHE_SIZE = 100000
 
 
 def V(OSeller, OBuyer, i=-1):
@@ -40,6 +45,449 @@ def U(v, p):
     return v.dot(p)
 
 
+# Preallocated buffers for the value functions
+class Workspace:
+    """Buffers and delta template shared by all ToM agents with the same number of bins.
+
+    The methods compute the same values as V and U, with the same floating
+    point operations, but write them into the preallocated buffers instead of
+    allocating new arrays. The results are only valid until the next call.
+    """
+
+    def __init__(self, n_deltas, n_contexts):
+        """Workspace constructor
+
+                Arguments:
+                        n_deltas {integer} -- number of bins for deltas interval
+                        n_contexts {integer} -- number of bins for contexts interval
+                """
+        self.n_deltas = n_deltas
+        self.n_contexts = n_contexts
+
+        # shared by the agents, so it must not be modified in place
+        self.possibleDeltas = np.arange(1 / (n_deltas + 1), 1, 1 / (n_deltas + 1))
+        self.possibleDeltas.setflags(write=False)
+        n = np.size(self.possibleDeltas)
+
+        self.sellerOffers = np.empty(n)
+        self.buyerOffers = np.empty(n)
+        self.values = np.empty([n, n])
+        self.penalised = np.empty([n, n], dtype=bool)
+        self.utilities = np.empty(n)
+        self.offerValues = np.empty(n)
+        self.offerPenalised = np.empty(n, dtype=bool)
+
+        # decisions taken under the uniform prior, keyed by
+        # (order, direction, context, offerSeller, offerBuyer)
+        self.decisions = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __reduce__(self):
+        # copies and pickles resolve to the shared workspace of the process
+        return workspace, (self.n_deltas, self.n_contexts)
+
+    def cachedDecision(self, key):
+        """Decision taken earlier under the uniform prior
+
+                Arguments:
+                        key {tuple} -- (order, direction, context, offerSeller, offerBuyer)
+
+                Returns:
+                        tuple -- the (offer, action) decision, None if it is not cached
+                """
+        decision = self.decisions.get(key)
+        if decision is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return decision
+
+    def storeDecision(self, key, decision):
+        """Remember a decision taken under the uniform prior
+
+                Arguments:
+                        key {tuple} -- (order, direction, context, offerSeller, offerBuyer)
+                        decision {tuple} -- the (offer, action) decision
+                """
+        if len(self.decisions) >= DECISION_CACHE_SIZE:
+            self.decisions.clear()
+        self.decisions[key] = decision
+
+    def bestResponse(self, offerSeller, offerBuyer, direction, p):
+        """Best action of a zero order agent, argmax U(V(offerSeller - deltas, offerBuyer + deltas, direction), p)
+
+                Arguments:
+                        offerSeller {double} -- offer made by seller in previous round
+                        offerBuyer {double} -- offer made by buyer in previous round
+                        direction {-1 or 1} -- point of view (if -1 value is computed for buyer, if 1 for seller)
+                        p {numpy.array} -- probability distribution of the opponent's deltas
+
+                Returns:
+                        integer -- index of the delta maximising the expected value
+                """
+        np.subtract(offerSeller, self.possibleDeltas, out=self.sellerOffers)
+        np.add(offerBuyer, self.possibleDeltas, out=self.buyerOffers)
+
+        # V: every row holds the buyer offers, penalised where seller > buyer
+        v = self.values
+        np.multiply(direction, self.buyerOffers, out=v)
+        np.greater(self.sellerOffers[:, None], self.buyerOffers, out=self.penalised)
+        np.copyto(v, PENALTY, where=self.penalised)
+        if direction < 0:
+            v = v.T
+
+        # U
+        np.dot(v, p, out=self.utilities)
+        return np.argmax(self.utilities)
+
+    def respond(self, direction, predictedOffer, offerSeller, offerBuyer):
+        """Decision of a ToM1 agent against the predicted offer of its opponent, see ToM1.__call__
+
+                Arguments:
+                        direction {-1 or 1} -- direction of the deciding agent
+                        predictedOffer {double} -- predicted offer of the opponent
+                        offerSeller {double} -- offer made by seller in previous round
+                        offerBuyer {double} -- offer made by buyer in previous round
+
+                Returns:
+                        double -- offer made
+                        integer -- index of delta bin used
+                """
+        if direction > 0:
+            sellerDeltas = np.subtract(self.possibleDeltas, offerSeller, out=self.sellerOffers)
+            buyerDeltas = predictedOffer
+        else:
+            buyerDeltas = np.add(self.possibleDeltas, offerBuyer, out=self.buyerOffers)
+            sellerDeltas = predictedOffer
+
+        action = self.bestOffer(sellerDeltas, buyerDeltas, direction)
+        # Return offer with respect to optimal action
+        return (offerSeller if direction > 0 else offerBuyer) - \
+               direction * self.possibleDeltas[action], action
+
+    def bestOffer(self, sellerOffers, buyerOffers, direction):
+        """Best action against a single predicted offer, argmax V(sellerOffers, buyerOffers, direction)
+
+                Arguments:
+                        sellerOffers {double or numpy.array} -- seller offer(s), one of the two is an array
+                        buyerOffers {double or numpy.array} -- buyer offer(s), one of the two is an array
+                        direction {-1 or 1} -- point of view (if -1 value is computed for buyer, if 1 for seller)
+
+                Returns:
+                        integer -- index of the offer with the highest value
+                """
+        v = self.offerValues
+        np.multiply(direction, buyerOffers, out=v)
+        np.greater(sellerOffers, buyerOffers, out=self.offerPenalised)
+        np.copyto(v, PENALTY, where=self.offerPenalised)
+        return np.argmax(v)
+
+
+_WORKSPACES = {}
+
+
+def workspace(n_deltas, n_contexts):
+    """Workspace shared by all ToM agents with the given number of bins
+
+            Arguments:
+                    n_deltas {integer} -- number of bins for deltas interval
+                    n_contexts {integer} -- number of bins for contexts interval
+
+            Returns:
+                    Workspace -- the shared workspace, created on first use
+            """
+    key = (n_deltas, n_contexts)
+    if key not in _WORKSPACES:
+        _WORKSPACES[key] = Workspace(n_deltas, n_contexts)
+    return _WORKSPACES[key]
+
+
+def decisionCacheStats():
+    """Hit and miss counters of the decision caches of all workspaces
+
+            Returns:
+                    dictionary -- 'hits', 'misses' and 'size' (number of cached decisions)
+            """
+    return {'hits': sum(w.hits for w in _WORKSPACES.values()),
+            'misses': sum(w.misses for w in _WORKSPACES.values()),
+            'size': sum(len(w.decisions) for w in _WORKSPACES.values())}
+
+
+def clearDecisionCache():
+    """Empty the decision caches of all workspaces and reset their counters
+    """
+    for w in _WORKSPACES.values():
+        w.decisions.clear()
+        w.hits = 0
+        w.misses = 0
+
+
+# Central storage of the zero order beliefs
+class BeliefPool:
+    """Belief tables of all Beliefs0 objects with the same number of bins.
+
+    Every table has a slot holding, per context, the index of the row with
+    its observation counts. Row 0 is the uniform prior, shared read-only by
+    all tables: a table gets a private copy of a row only when that context
+    is first observed, so the memory of a table grows with the number of
+    contexts it has actually seen. Rows keep their total and a cached
+    normalised copy, and the rows and slots of released tables are recycled.
+    The pool outlives the models of the process: the tables of agents that
+    die are released by the model, those of the survivors when the model is
+    closed (EvolutionaryModel.close), anything else holds on to its rows.
+    When no table is left the pool shrinks back to its initial capacity.
+
+    Everything lives in contiguous arrays so vectorised code can gather the
+    beliefs of many agents at once. The arrays may be reallocated when the
+    pool grows or shrinks, so views of them must not be kept.
+    """
+
+    def __init__(self, n_deltas, n_contexts, capacity=1024):
+        """BeliefPool constructor
+
+                Arguments:
+                        n_deltas {integer} -- number of bins for deltas interval
+                        n_contexts {integer} -- number of bins for contexts interval
+                        capacity {integer} -- initial number of tables (and of rows)
+                """
+        self.n_deltas = n_deltas
+        self.n_contexts = n_contexts
+        self.capacity = max(int(capacity), 1)
+        self._reset()
+
+    def _reset(self):
+        """Empty the pool, with arrays of the initial capacity
+        """
+        capacity = self.capacity
+        # tables
+        self.size = 0
+        self.free = []
+        self.rowSlot = np.zeros([capacity, self.n_contexts], dtype=np.int32)
+        # rows, row 0 is the prior
+        self.rows = 1
+        self.freeRows = []
+        self.counts = np.ones([capacity, self.n_deltas])
+        self.totals = np.sum(self.counts, axis=1)
+        self.p = np.empty([capacity, self.n_deltas])
+        self.clean = np.zeros(capacity, dtype=bool)
+
+    def _grow(self, names, used):
+        """Double the length of a group of arrays
+
+                Arguments:
+                        names {tuple} -- attribute names of the arrays
+                        used {integer} -- number of leading entries in use
+                """
+        for name in names:
+            old = getattr(self, name)
+            new = np.empty((2 * len(old),) + old.shape[1:], dtype=old.dtype)
+            new[:used] = old[:used]
+            setattr(self, name, new)
+
+    def allocate(self):
+        """Slot of a fresh table, all its contexts reading the prior
+
+                Returns:
+                        integer -- the slot
+                """
+        if self.free:
+            slot = self.free.pop()
+        else:
+            if self.size == len(self.rowSlot):
+                self._grow(('rowSlot',), self.size)
+            slot = self.size
+            self.size += 1
+        self.rowSlot[slot] = 0
+        return slot
+
+    def release(self, slot):
+        """Recycle a table that is no longer used, with its private rows
+
+                Arguments:
+                        slot {integer} -- slot to release
+                """
+        rows = self.rowSlot[slot]
+        self.freeRows.extend(rows[rows != 0].tolist())
+        self.free.append(slot)
+        # once the last table is gone shrink back to the initial capacity, so
+        # a process running model after model (a sweep worker) does not keep
+        # the arrays of its largest population
+        if len(self.free) == self.size and max(len(self.rowSlot), len(self.counts)) > self.capacity:
+            self._reset()
+
+    def materialise(self, slot, context):
+        """Private row of a table for a context, copied from the prior on first use
+
+                Arguments:
+                        slot {integer} -- slot of the table
+                        context {integer} -- index of the context bin
+
+                Returns:
+                        integer -- index of the row
+                """
+        row = self.rowSlot[slot, context]
+        if row:
+            return row
+        if self.freeRows:
+            row = self.freeRows.pop()
+        else:
+            if self.rows == len(self.counts):
+                self._grow(('counts', 'totals', 'p', 'clean'), self.rows)
+            row = self.rows
+            self.rows += 1
+        self.counts[row] = self.counts[0]
+        self.totals[row] = self.totals[0]
+        self.clean[row] = False
+        self.rowSlot[slot, context] = row
+        return row
+
+    def privateRows(self):
+        """Number of rows in use besides the prior
+
+                Returns:
+                        integer -- number of private rows
+                """
+        return self.rows - 1 - len(self.freeRows)
+
+    def __reduce__(self):
+        # copies and pickles resolve to the shared pool of the process
+        return beliefPool, (self.n_deltas, self.n_contexts)
+
+
+_BELIEF_POOLS = {}
+
+
+def beliefPool(n_deltas, n_contexts):
+    """Belief pool shared by all Beliefs0 objects with the given number of bins
+
+            Arguments:
+                    n_deltas {integer} -- number of bins for deltas interval
+                    n_contexts {integer} -- number of bins for contexts interval
+
+            Returns:
+                    BeliefPool -- the shared pool, created on first use
+            """
+    key = (n_deltas, n_contexts)
+    if key not in _BELIEF_POOLS:
+        _BELIEF_POOLS[key] = BeliefPool(n_deltas, n_contexts)
+    return _BELIEF_POOLS[key]
+
+
+# Negotiation outcomes
+AGREED = 'agreed'
+REJECTED = 'rejected'
+INVALID = 'invalid'
+OUT_OF_ROUNDS = 'out of rounds'
+
+
+# Instrumentation of the negotiations
+class NegotiationStats:
+    """Rounds histogram, timing and outcomes of the negotiations, per ToM order pairing."""
+
+    def __init__(self):
+        """NegotiationStats constructor
+                """
+        # pairing -> {rounds: number of negotiations}
+        self.rounds = {}
+        # pairing -> [number of negotiations, total seconds, max seconds]
+        self.seconds = {}
+        # pairing -> {outcome: number of negotiations}
+        self.outcomes = {}
+
+    @staticmethod
+    def pairing(order, opponentOrder):
+        """Name of a ToM order pairing, e.g. 'ToM0/ToM1'
+
+                Arguments:
+                        order {integer} -- ToM order of one agent
+                        opponentOrder {integer} -- ToM order of the other agent
+
+                Returns:
+                        string -- the pairing, lowest order first
+                """
+        return 'ToM%d/ToM%d' % (min(order, opponentOrder), max(order, opponentOrder))
+
+    def record(self, order, opponentOrder, rounds, seconds, outcome):
+        """Record a negotiation
+
+                Arguments:
+                        order {integer} -- ToM order of the seller
+                        opponentOrder {integer} -- ToM order of the buyer
+                        rounds {integer} -- number of rounds played
+                        seconds {double} -- time the negotiation took
+                        outcome {string} -- how the negotiation ended (AGREED, REJECTED, ...)
+                """
+        pairing = self.pairing(order, opponentOrder)
+        histogram = self.rounds.setdefault(pairing, {})
+        histogram[rounds] = histogram.get(rounds, 0) + 1
+        timing = self.seconds.setdefault(pairing, [0, 0.0, 0.0])
+        timing[0] += 1
+        timing[1] += seconds
+        timing[2] = max(timing[2], seconds)
+        outcomes = self.outcomes.setdefault(pairing, {})
+        outcomes[outcome] = outcomes.get(outcome, 0) + 1
+
+    def histogram(self, pairing):
+        """Rounds-per-negotiation histogram of a pairing
+
+                Arguments:
+                        pairing {string} -- e.g. 'ToM0/ToM1'
+
+                Returns:
+                        dictionary -- number of negotiations per number of rounds, sorted by rounds
+                """
+        return dict(sorted(self.rounds.get(pairing, {}).items()))
+
+    def summary(self):
+        """Summary of the negotiations of every pairing
+
+                Returns:
+                        dictionary -- per pairing: negotiations, mean/max rounds, mean/max seconds and outcomes
+                """
+        summary = {}
+        for pairing in sorted(self.rounds):
+            histogram = self.rounds[pairing]
+            n, total, longest = self.seconds[pairing]
+            summary[pairing] = {
+                'negotiations': n,
+                'mean_rounds': sum(r * c for r, c in histogram.items()) / n,
+                'max_rounds': max(histogram),
+                'mean_seconds': total / n,
+                'max_seconds': longest,
+                'outcomes': dict(self.outcomes[pairing])}
+        return summary
+
+
+# Negotiation instrumentation in use, None when the negotiations are not recorded
+negotiationStats = None
+
+
+def recordNegotiations(stats=None):
+    """Start (or stop) recording the negotiations of the process
+
+            Arguments:
+                    stats {NegotiationStats} -- where to record, a new one if None
+
+            Returns:
+                    NegotiationStats -- the stats the negotiations are recorded in
+            """
+    global negotiationStats
+    negotiationStats = stats if stats is not None else NegotiationStats()
+    return negotiationStats
+
+
+def stopRecordingNegotiations():
+    """Stop recording the negotiations
+
+            Returns:
+                    NegotiationStats -- the stats the negotiations were recorded in (None if there were none)
+            """
+    global negotiationStats
+    stats, negotiationStats = negotiationStats, None
+    return stats
+
+
 class Beliefs0:
     """Zero order beliefs"""
 
@@ -52,7 +500,19 @@ class Beliefs0:
                         n_contexts {integer} -- number of bins for contexts interval
                 """
 
-        self.b = np.ones([n_contexts, n_deltas])
+        # the table lives in the shared pool, it starts as the uniform prior
+        self.pool = beliefPool(n_deltas, n_contexts)
+        self.slot = self.pool.allocate()
+
+    @property
+    def b(self):
+        """Observation counts, a (n_contexts, n_deltas) copy gathered from the pool"""
+        return self.pool.counts[self.pool.rowSlot[self.slot]]
+
+    @property
+    def total(self):
+        """Row totals of the observation counts, a copy gathered from the pool"""
+        return self.pool.totals[self.pool.rowSlot[self.slot]]
 
     def __call__(self, context, delta=None):
         """Get probability of a(ll) delta(s) bin(s) given a context bin
@@ -68,15 +528,32 @@ class Beliefs0:
 
                         __call__(self, context):
                         numpy.array of doubles -- the probability of each possible delta bin for the given context
+                        (a cached row, it must not be modified)
                 """
 
-        p = self.b[context]
-        s = np.sum(p)
+        pool = self.pool
+        row = pool.rowSlot[self.slot, context]
+        p = pool.p[row]
+        if not pool.clean[row]:
+            np.divide(pool.counts[row], pool.totals[row], out=p)
+            pool.clean[row] = True
 
         if not delta:
-            return p / s
+            return p
+
+        return p[delta]
 
-        return p[delta] / s
+    def isDirty(self, context):
+        """Whether the beliefs of a context were updated since they were the uniform prior
+
+                Arguments:
+                        self {Beliefs0 object} -- beliefs on which method is called
+                        context {integer} -- index of context bin
+
+                Returns:
+                        boolean -- True once the context has a private row in the pool
+                """
+        return self.pool.rowSlot[self.slot, context] != 0
 
     def observe(self, context, delta):
         """Update beliefs
@@ -86,7 +563,30 @@ class Beliefs0:
                         context {integer} -- index of observed context bin
                         delta {integer} -- index of observed delta bin
                 """
-        self.b[context, delta] += 1
+        pool = self.pool
+        row = pool.materialise(self.slot, context)
+        pool.counts[row, delta] += 1
+        pool.totals[row] += 1
+        pool.clean[row] = False
+
+    def release(self):
+        """Give the table back to the pool, the beliefs must not be used afterwards
+        """
+        self.pool.release(self.slot)
+        self.slot = None
+
+    def __getstate__(self):
+        return {'pool': self.pool, 'b': self.b}
+
+    def __setstate__(self, state):
+        # a copy gets its own slot, with private rows where it differs from the prior
+        self.pool = pool = state['pool']
+        self.slot = pool.allocate()
+        for context, counts in enumerate(state['b']):
+            if (counts != pool.counts[0]).any():
+                row = pool.materialise(self.slot, context)
+                pool.counts[row] = counts
+                pool.totals[row] = np.sum(counts)
 
 
 class ToMAgent:
@@ -114,8 +614,8 @@ class ToMAgent:
         self.direction = None
         self.computeContext = context
 
-        self.possibleDeltas = np.arange(
-            1 / (n_deltas + 1), 1, 1 / (n_deltas + 1))
+        self.workspace = workspace(n_deltas, n_contexts)
+        self.possibleDeltas = self.workspace.possibleDeltas
         self.n_deltas = n_deltas
         self.n_contexts = n_contexts
 
@@ -145,6 +645,19 @@ class ToMAgent:
                 """
         pass
 
+    def release(self):
+        """Method to give the agent's beliefs back to the belief pool, when its owner dies
+        """
+        pass
+
+    def baseBeliefs(self):
+        """Zero order beliefs the agent decides and learns with
+
+                Returns:
+                        Beliefs0 -- the beliefs at the end of the agent's chain of models
+                """
+        return self.model.beliefs
+
     def setDirection(self, newDirection, opponent=None):
         """Setter for direction field
 
@@ -156,12 +669,13 @@ class ToMAgent:
 
         self.direction = newDirection
 
-    def play(self, opponent):
+    def play(self, opponent, maxRounds=None):
         """Method to let an agnet play with its opponent a full round of offers
 
                 Arguments:
                         self -- first agent trading
                         opponent -- other agent trading
+                        maxRounds {integer} -- round budget (MAX_ROUNDS if None), the trading fails when it runs out
 
                 Returns:
                         double -- concluded price at the end of the trading (None if the trading was not successfull)
@@ -173,14 +687,41 @@ class ToMAgent:
         opponent.setDirection(-1 * self.direction, self)
 
         if self.direction < 0:
-            return opponent.play(self)
+            return opponent.play(self, maxRounds)
 
         # The seller handles the trade (if I get here I am the seller)
+        if negotiationStats is None:
+            return self.sell(opponent, maxRounds)[0]
+        start = time.perf_counter()
+        price, rounds, outcome = self.sell(opponent, maxRounds)
+        negotiationStats.record(self.order, opponent.order, rounds, time.perf_counter() - start, outcome)
+        return price
+
+    def sell(self, opponent, maxRounds=None):
+        """Method to run the offers of a trading, from the seller's side
+
+                Arguments:
+                        self -- selling agent, its direction is set
+                        opponent -- buying agent, its direction is set
+                        maxRounds {integer} -- round budget (MAX_ROUNDS if None), the trading fails when it runs out
+
+                Returns:
+                        double -- concluded price at the end of the trading (None if the trading was not successfull)
+                        integer -- number of rounds played
+                        string -- outcome of the trading (AGREED, REJECTED, INVALID or OUT_OF_ROUNDS)
+                """
+        if maxRounds is None:
+            maxRounds = MAX_ROUNDS
+
         my_offer = 1.0
         opponent_offer = 0.0
+        rounds = 0
 
         while (my_offer > opponent_offer):
 
+            if rounds == maxRounds:
+                return None, rounds, OUT_OF_ROUNDS
+
             # Get binned context
             context = self.computeContext(my_offer, opponent_offer)
             context = math.floor(context * (self.n_contexts - 1))
@@ -191,11 +732,12 @@ class ToMAgent:
             my_new, deltaMe = self(my_offer, opponent_offer, context)
 
             if opponent_offer >= 1 or opponent_offer < 0 or my_offer <= 0 or my_offer > 1:
-                return None
+                return None, rounds, INVALID
 
             # Learn
             opponent.learn(deltaMe, deltaOpponent, context)
             self.learn(deltaMe, deltaOpponent, context)
+            rounds += 1
 
             # Update offer values
             opponent_offer = opponent_new
@@ -204,12 +746,13 @@ class ToMAgent:
         # Add stop condition if offer of buyer is lower then the minimum price of the seller.
         # If this is the case there is no exchange
         if opponent_offer * opponent.outer.wealth <= self.outer.owner:
-            return None
+            return None, rounds, REJECTED
 
-        return opponent_offer
+        return opponent_offer, rounds, AGREED
 
 
 class ToM0(ToMAgent):
+    order = 0
 
     def __init__(
             self,
@@ -246,17 +789,26 @@ class ToM0(ToMAgent):
                         integer -- index of delta bin used
                 """
 
+        # Under the uniform prior the decision only depends on the key
+        prior = not self.beliefs.isDirty(context)
+        if prior:
+            key = (0, self.direction, context, offerSeller, offerBuyer)
+            decision = self.workspace.cachedDecision(key)
+            if decision is not None:
+                return decision
+
         # Compute p dist over opponent's actions
         p = self.beliefs(context)
 
-        # Get value of each agent-opponent action pair
-        v = V(offerSeller - self.possibleDeltas, offerBuyer + self.possibleDeltas, self.direction)
-
-        # Compute optimal action (the index of the delta to use)
-        action = np.argmax(U(v, p))
+        # Compute optimal action (the index of the delta to use) from the
+        # value of each agent-opponent action pair, see V and U
+        action = self.workspace.bestResponse(offerSeller, offerBuyer, self.direction, p)
         # Return offer with respect to optimal action
-        return (offerSeller if self.direction > 0 else offerBuyer) - \
-               self.direction * self.possibleDeltas[action], action
+        decision = (offerSeller if self.direction > 0 else offerBuyer) - \
+                   self.direction * self.possibleDeltas[action], action
+        if prior:
+            self.workspace.storeDecision(key, decision)
+        return decision
 
     def learn(self, deltaSeller, deltaBuyer, context):
         """Method to updated agent's beliefs
@@ -273,8 +825,22 @@ class ToM0(ToMAgent):
         else:
             self.beliefs.observe(context, self.n_deltas - 1 - deltaSeller)
 
+    def release(self):
+        """Method to give the agent's beliefs back to the belief pool, when its owner dies
+        """
+        self.beliefs.release()
+
+    def baseBeliefs(self):
+        """Zero order beliefs the agent decides and learns with
+
+                Returns:
+                        Beliefs0 -- the agent's own beliefs
+                """
+        return self.beliefs
+
 
 class ToM1(ToMAgent):
+    order = 1
 
     def __init__(
             self,
@@ -323,24 +889,128 @@ class ToM1(ToMAgent):
                         integer -- index of delta bin used
                 """
 
+        # Under the uniform prior the decision only depends on the key
+        prior = not self.model.beliefs.isDirty(context)
+        if prior:
+            key = (1, self.direction, context, offerSeller, offerBuyer)
+            decision = self.workspace.cachedDecision(key)
+            if decision is not None:
+                return decision
+
         # Predict action of opponent
         opponent_action, _ = self.model(offerSeller, offerBuyer, context)
 
-        if self.direction > 0:
-            sellerDeltas = self.possibleDeltas - offerSeller
-            buyerDeltas = opponent_action
-        else:
-            buyerDeltas = self.possibleDeltas + offerBuyer
-            sellerDeltas = opponent_action
+        # Compute optimal action (the index of the delta to use) from the
+        # values of each of your actions, see V
+        decision = self.workspace.respond(self.direction, opponent_action, offerSeller, offerBuyer)
+        if prior:
+            self.workspace.storeDecision(key, decision)
+        return decision
 
-        # Compute values for each of your actions
-        v = V(sellerDeltas, buyerDeltas, self.direction)
+    def learn(self, deltaSeller, deltaBuyer, context):
+        """Method to updated agent's beliefs
 
-        # Compute optimal action (the index of the delta to use)
-        action = np.argmax(v)
-        # Return offer with respect to optimal action
-        return (offerSeller if self.direction > 0 else offerBuyer) - \
-               self.direction * self.possibleDeltas[action], action
+                Arguments:
+                        self {ToMAgent} -- agent whose beliefs are being updated
+                        deltaSeller {integer} -- index of bin of delta used by the seller
+                        deltaBuyer {integer} -- integer of bin of delta used by the buyer
+                        context {integer} -- integer of bin of current context
+                """
+
+        self.model.learn(deltaSeller, deltaBuyer, context)
+
+    def release(self):
+        """Method to give the agent's beliefs back to the belief pool, when its owner dies
+        """
+        self.model.release()
+
+
+class ToMk(ToMAgent):
+    """Theory of mind of any order k >= 1.
+
+    Like ToM1, a ToMk agent predicts the offer of its opponent and makes the
+    best offer against it, but the opponent is modelled as a ToM(k-1) agent,
+    which models the agent as a ToM(k-2) agent and so on. The chain of nested
+    models ends in zero order beliefs, which are the only beliefs kept: a
+    ToM0 model whose direction is (-1)^k times the agent's.
+    """
+
+    def __init__(
+            self,
+            n_deltas,
+            n_contexts,
+            outer,
+            order=2,
+            context=lambda offerSeller, offerBuyer: offerSeller - offerBuyer):
+        """General constructor for any order of theory of mind
+
+                Arguments:
+                        self {ToMk object} -- constructed object
+                        n_deltas {integer} -- number of bins for deltas interval
+                        n_contexts {integer} -- number of bins for contexts interval
+                        outer {Agent.Agent} -- agent containing ToMAgent object
+                        order {integer} -- theory of mind order k, at least 1
+                        context {lambda (double, double) -> double} -- function defining how context is computed from the offer of the seller and the buyer
+                """
+
+        if order < 1:
+            raise ValueError('ToMk needs an order of at least 1, use ToM0 for order 0')
+        super(ToMk, self).__init__(n_deltas, n_contexts, outer, context)
+        self.order = order
+        self.model = ToM0(n_deltas, n_contexts, None, None)
+
+    def setDirection(self, newDirection, opponent=None):
+        """Setter for direction field
+
+                Arguments:
+                        self {ToMAgent} -- agent whose direction is being set
+                        newDirection {-1 or 1} -- new value of direction field
+                        opponent {ToMAgent} -- opponent (other end of direction)
+                        """
+
+        super(ToMk, self).setDirection(newDirection, opponent)
+
+        # the zero order model at the end of the chain models the opponent
+        # for odd orders and the agent itself for even orders
+        self.model.outer = opponent if self.order % 2 else self
+        self.model.setDirection(self.direction * (-1) ** self.order)
+
+    def __call__(self, offerSeller, offerBuyer, context):
+        """Method to get the agent's action (agent performs a decision)
+
+                Arguments:
+                        self {ToMAgent} -- agent performing the action
+                        offerSeller {dobule} -- offer made by seller in previous round
+                        offerBuyer {dobule} -- offer made by buyer in previous round
+                        context {integer} -- index of current context's bin
+
+                Returns:
+                        double -- offer made
+                        integer -- index of delta bin used
+                """
+
+        # Under the uniform prior the decision only depends on the key
+        prior = not self.model.beliefs.isDirty(context)
+        if prior:
+            key = (self.order, self.direction, context, offerSeller, offerBuyer)
+            decision = self.workspace.cachedDecision(key)
+            if decision is not None:
+                return decision
+
+        # Walk up the chain of nested models: the prediction of every level
+        # is computed once and reused by the level above it, instead of every
+        # level re-evaluating the levels below, so a decision costs k + 1
+        # evaluations
+        offer, action = self.model(offerSeller, offerBuyer, context)
+        direction = self.model.direction
+        for level in range(1, self.order + 1):
+            direction = -direction
+            offer, action = self.workspace.respond(direction, offer, offerSeller, offerBuyer)
+
+        decision = (offer, action)
+        if prior:
+            self.workspace.storeDecision(key, decision)
+        return decision
 
     def learn(self, deltaSeller, deltaBuyer, context):
         """Method to updated agent's beliefs
@@ -353,3 +1023,8 @@ class ToM1(ToMAgent):
                 """
 
         self.model.learn(deltaSeller, deltaBuyer, context)
+
+    def release(self):
+        """Method to give the agent's beliefs back to the belief pool, when its owner dies
+        """
+        self.model.release()
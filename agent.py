@@ -1,19 +1,7 @@
 from mesa import Agent
 import strategies
-import random
-import configparser
 import ToM
-
-# Load the configuration file
-CONFIG = configparser.ConfigParser()
-CONFIG.read('./config/config.ini')
-CONFIG_MODEL = CONFIG['model']
-CONFIG_RESULTS = CONFIG['results']
-WEALTH_TYPE = CONFIG_MODEL['initial_wealth_type']
-FIXED_WEALTH_VALUE = int(CONFIG_MODEL['fixed_wealth_value'])
-PROPERTY_INFLATION_PRICE = float(CONFIG_MODEL['property_buy_price_percentage'])
-FIXED_PROPERTY_VALUE = int(CONFIG_MODEL['fixed_property_value'])
-VERBOSE = CONFIG_RESULTS['verbose_mode']
+import eventlog
 
 N_DELTAS = 10
 N_CONTEXTS = 10
@@ -34,14 +22,79 @@ class EvolutionaryAgent(Agent):
             owner {integer} -- value of property owned by agent
         """
         super().__init__(unique_id, model)
-        self.wealth = wealth
+        # the agent only counts towards the model's aggregates once it is added
+        self.alive = False
         self.strategy = initialStrategy
-        self.owner = owner
+        self.strategyCode = model.strategyCode[initialStrategy]
+        self._wealth = wealth
+        self._owner = owner
+
+        # The ToM order of agents that are not ToM traders is a coin flip,
+        # it is drawn even if the ToM state is built lazily so the random
+        # stream stays the same
+        self.tomOrder = strategies.tomOrder(self.strategy)
+        if self.tomOrder is None:
+            if model.tom == 'tom-only':
+                self.tomOrder = 0
+            else:
+                self.tomOrder = 1 if self.random.random() >= 0.5 else 0
+        self._ToMAgent = None
+        if model.tom == 'eager':
+            self._ToMAgent = self.buildToM()
+
+    def buildToM(self):
+        """Build the agent's ToM state
 
-        if  self.strategy=='traderToM1' or (self.strategy!='traderToM0' and random.random() >= 0.5) :
-            self.ToMAgent = ToM.ToM1(N_DELTAS, N_CONTEXTS, self)
-        else:
-            self.ToMAgent = ToM.ToM0(N_DELTAS, N_CONTEXTS, self)
+        Returns:
+            ToM.ToMAgent -- ToM agent of the agent's ToM order
+        """
+        if self.tomOrder == 0:
+            return ToM.ToM0(N_DELTAS, N_CONTEXTS, self)
+        if self.tomOrder == 1:
+            return ToM.ToM1(N_DELTAS, N_CONTEXTS, self)
+        return ToM.ToMk(N_DELTAS, N_CONTEXTS, self, self.tomOrder)
+
+    @property
+    def ToMAgent(self):
+        # built on first use, most agents never negotiate
+        if self._ToMAgent is None:
+            self._ToMAgent = self.buildToM()
+        return self._ToMAgent
+
+    def hasToM(self):
+        """Whether the agent's ToM state was built
+
+        Returns:
+            boolean -- True once the agent has a ToM agent
+        """
+        return self._ToMAgent is not None
+
+    def releaseToM(self):
+        """Give the ToM state back to the belief pool, when the agent dies
+        """
+        if self._ToMAgent is not None:
+            self._ToMAgent.release()
+            self._ToMAgent = None
+
+    @property
+    def wealth(self):
+        return self._wealth
+
+    @wealth.setter
+    def wealth(self, value):
+        if self.alive:
+            self.model.aggregates.change(self.strategyCode, value - self._wealth, 0)
+        self._wealth = value
+
+    @property
+    def owner(self):
+        return self._owner
+
+    @owner.setter
+    def owner(self, value):
+        if self.alive:
+            self.model.aggregates.change(self.strategyCode, 0, value - self._owner)
+        self._owner = value
 
     def getTotalWealth(self):
         """Get total wealth owned by agent
@@ -56,9 +109,10 @@ class EvolutionaryAgent(Agent):
         """
         current_wealth = self.wealth
         # Property value is set from config file
-        if WEALTH_TYPE == 'fixed':
+        config = self.model.config
+        if config.initial_wealth_type == 'fixed':
             updated_wealth = current_wealth
-            updated_owner = FIXED_PROPERTY_VALUE
+            updated_owner = config.fixed_property_value
         else:
             updated_wealth = round(0.2 * current_wealth)
             updated_owner = round(0.8 * current_wealth)
@@ -77,22 +131,15 @@ class EvolutionaryAgent(Agent):
     def move(self):
         """Move to a random surrounding tile
         """
-        possible_steps = self.model.grid.get_neighborhood(
-            self.pos,
-            moore=True,
-            include_center=False
-        )
-        new_position = self.random.choice(possible_steps)
+        new_position = self.model.grid.randomNeighbour(self.pos, self.random)
         self.model.grid.move_agent(self, new_position)
 
     def interact(self):
         """If another agent is on the same tile, interact with it
         """
-        cellmates = self.model.grid.get_cell_list_contents([self.pos])
-        # don't fight against yourself
-        cellmates.remove(self)
-        if len(cellmates) > 1:
-            other = self.random.choice(cellmates)
+        # don't fight against yourself, only interact on tiles shared by at least three agents
+        other = self.model.grid.randomCellmate(self, self.random)
+        if other is not None:
             self.chooseInteraction(other)
 
     def chooseInteraction(self, other):
@@ -109,165 +156,137 @@ class EvolutionaryAgent(Agent):
     def chooseOwnerIntruderInteraction(self, owner, intruder):
         """Handle all interaction scenarios for various strategies
 
+        The kind of interaction is looked up in the model's owner x intruder
+        dispatch table, see strategies.interactionTable.
+
         Arguments:
             owner {Agent} -- Owner of the cell
             intruder {Agent} -- Agent intruding the cell
         """
+        kind = self.model.interactionTable[owner.strategyCode, intruder.strategyCode]
+        strategies.emulateInteraction(kind, owner, intruder)
 
-        estimated_buying_price = owner.owner + (PROPERTY_INFLATION_PRICE * owner.owner)
-
-        if owner.strategy == 'dove':
-            # check if intruder is dove/hawk/possessor/trader
-            if intruder.strategy == 'dove':
-                # dove-dove
-                strategies.emulateDoveDoveStrategy(owner, intruder)
-            elif intruder.strategy == 'hawk':
-                # dove-hawk
-                strategies.emulateHawkDoveStrategy(intruder, owner)
-            elif intruder.strategy == 'possessor':
-                # dove-possessor == dove-dove
-                strategies.emulateDoveDoveStrategy(owner, intruder)
-            elif intruder.strategy == 'trader':
-                # dove-trader
-                strategies.emulateDoveDoveStrategy(owner, intruder)
-            elif intruder.strategy == 'traderToM0':
-                # dove-trader
-                strategies.emulateDoveDoveStrategy(owner, intruder)
-            elif intruder.strategy == 'traderToM1':
-                # dove-trader
-                strategies.emulateDoveDoveStrategy(owner, intruder)
-
-        elif owner.strategy == 'hawk':
-            # check if intruder is dove/hawk/possessor/trader
-            if intruder.strategy == 'dove':
-                # hawk-dove
-                strategies.emulateHawkDoveStrategy(owner, intruder)
-            elif intruder.strategy == 'hawk':
-                # hawk-hawk
-                strategies.emulateHawkHawkStrategy(owner, intruder)
-            elif intruder.strategy == 'possessor':
-                # hawk-possessor == hawk-dove
-                strategies.emulateHawkDoveStrategy(owner, intruder)
-            elif intruder.strategy == 'trader':
-                # hawk-traderm == hawk-possessor == hawk-dove
-                strategies.emulateHawkDoveStrategy(owner, intruder)
-            elif intruder.strategy == 'traderToM0':
-                # hawk-traderm == hawk-possessor == hawk-dove
-                strategies.emulateHawkDoveStrategy(owner, intruder)
-            elif intruder.strategy == 'traderToM1':
-                # hawk-traderm == hawk-possessor == hawk-dove
-                strategies.emulateHawkDoveStrategy(owner, intruder)
-
-        elif owner.strategy == 'possessor':
-            # check if intruder is dove/hawk/possessor/trader
-            if intruder.strategy == 'dove':
-                # possessor-dove
-                strategies.emulateHawkDoveStrategy(owner, intruder)
-            elif intruder.strategy == 'hawk':
-                # possessor-hawk
-                strategies.emulateHawkHawkStrategy(owner, intruder)
-            elif intruder.strategy == 'possessor':
-                # possessor-possessor
-                strategies.emulateHawkDoveStrategy(owner, intruder)
-            elif intruder.strategy == 'trader':
-                # possessor-trader
-                strategies.emulateHawkDoveStrategy(owner, intruder)
-            elif intruder.strategy == 'traderToM0':
-                # hawk-traderm == hawk-possessor == hawk-dove
-                strategies.emulateHawkDoveStrategy(owner, intruder)
-            elif intruder.strategy == 'traderToM1':
-                # hawk-traderm == hawk-possessor == hawk-dove
-                strategies.emulateHawkDoveStrategy(owner, intruder)
-
-        elif owner.strategy == 'trader':
-            # check if intruder is dove/hawk/possessor/trader
-            if intruder.strategy == 'dove':
-                # trader-dove
-                strategies.emulateHawkDoveStrategy(owner, intruder)
-            elif intruder.strategy == 'hawk':
-                # trader-hawk
-                strategies.emulateHawkHawkStrategy(owner, intruder)
-            elif intruder.strategy == 'possessor':
-                # trader-possessor
-                strategies.emulateHawkDoveStrategy(owner, intruder)
-
-            elif intruder.strategy == 'trader':
-                # trader-trader
-                if estimated_buying_price < intruder.wealth:
-                    strategies.emulateTradersStrategy(owner, intruder)
-
-            elif intruder.strategy == 'traderToM0' or intruder.strategy == 'traderToM1':
-                #trader no ToM - trader with ToM
-                if estimated_buying_price < intruder.wealth:
-                    strategies.emulateTraderToMStrategy(owner, intruder)
-
-        elif owner.strategy == 'traderToM0' or owner.strategy == 'traderToM1':
-            # check if intruder is dove/hawk/possessor/trader
-            if intruder.strategy == 'dove':
-                # trader-dove
-                strategies.emulateHawkDoveStrategy(owner, intruder)
-            elif intruder.strategy == 'hawk':
-                # trader-hawk
-                strategies.emulateHawkHawkStrategy(owner, intruder)
-            elif intruder.strategy == 'possessor':
-                # trader-possessor
-                strategies.emulateHawkDoveStrategy(owner, intruder)
-            elif intruder.strategy == 'trader':
-                # trader with ToM-trader
-                if estimated_buying_price < intruder.wealth:
-                    strategies.emulateToMTraderStrategy(owner, intruder)
-
-            elif intruder.strategy == 'traderToM0' or intruder.strategy == 'traderToM1':
-                # trader no ToM - trader with ToM
-                if estimated_buying_price < intruder.wealth:
-                    strategies.emulateToMToMStrategy(owner, intruder)
-
-    def saySomething(self, something):
+    def saySomething(self, something, *args):
         """Agent can speak
 
+        The message is only formatted when it is printed.
+
         Arguments:
-            something {string} -- what to say
+            something {string} -- what to say, a %-format string if args are given
+            args -- values formatted into the message
         """
-        if VERBOSE == 'on':
-            print(something)
+        if self.model.config.verbose:
+            print(something % args if args else something)
 
-    def reproduce(self):
-        """Agent can reproduce another agent with it's own strategy
+    def spawn(self):
+        """Create an offspring with the agent's own strategy, without adding it to the model yet
 
         Returns:
             object -- Reproduced agent
         """
         # generate agent with same strategy as parent
-        self.saySomething('I am a ' + self.strategy +
-              str(self.unique_id) + ' and I am reproducing')
+        self.saySomething('I am a %s%d and I am reproducing', self.strategy, self.unique_id)
         new_unique_id = self.model.latest_id + 1
         self.model.latest_id += 1
 
         # Initial Wealth is set from config - to a random number OR fixed amount
-        if WEALTH_TYPE == 'fixed':
-            initialWealth = FIXED_WEALTH_VALUE
+        config = self.model.config
+        if config.initial_wealth_type == 'fixed':
+            initialWealth = config.fixed_wealth_value
         else:
-            initialWealth = random.randrange(int(CONFIG_MODEL['initial_wealth_range_lower']), int(
-                CONFIG_MODEL['initial_wealth_range_upper']))
+            initialWealth = self.random.randrange(config.initial_wealth_range_lower,
+                                                  config.initial_wealth_range_upper)
 
-        a = EvolutionaryAgent(new_unique_id, self.model,
-                              self.strategy, initialWealth, 0)
+        if self.model.eventLog is not None:
+            self.model.eventLog.record(eventlog.BIRTH, -1, new_unique_id, self.unique_id, initialWealth)
+        return type(self)(new_unique_id, self.model,
+                          self.strategy, initialWealth, 0)
 
+    def reproduce(self):
+        """Agent can reproduce another agent with it's own strategy
+
+        Returns:
+            object -- Reproduced agent
+        """
+        a = self.spawn()
         # the reproduced agent will stay on the same position as the parent
-        self.model.grid.place_agent(a, self.pos)
-        self.model.schedule.add(a)
+        self.model.addAgent(a, self.pos)
         return a
 
     def die(self):
         """Death
         """
-        self.saySomething('I am a ' + self.strategy +
-              str(self.unique_id) + ' and I am dead')
-        self.model.grid._remove_agent(self.pos, self)
-        self.model.schedule.remove(self)
+        self.model.removeAgents([self])
 
     def step(self):
         """Agent action to be performed per tick of the model
         """
         self.move()
         self.interact()
+
+
+# An evolutionary agent backed by the model's struct-of-arrays state
+class ArrayAgent(EvolutionaryAgent):
+    """Thin object view on one slot of the model's AgentState arrays."""
+
+    def __init__(self, unique_id, model, initialStrategy, wealth, owner):
+        """Agent constructor method, see EvolutionaryAgent
+
+        Arguments:
+            unique_id {integer} -- unique agent ID
+            model {mesa_object} -- mesa_object model with an AgentState
+            initialStrategy {string} -- strategy of the agent (dove/hawk/...)
+            wealth {integer} -- wealth/money with the agent
+            owner {integer} -- value of property owned by agent
+        """
+        self.unique_id = unique_id
+        self._state = model.state
+        self.slot = self._state.allocate(self, model.strategyCode[initialStrategy])
+        super().__init__(unique_id, model, initialStrategy, 0, 0)
+        self._state.wealth[self.slot] = wealth
+        self._state.owner[self.slot] = owner
+
+    @property
+    def alive(self):
+        return bool(self._state.alive[self.slot])
+
+    @alive.setter
+    def alive(self, value):
+        self._state.alive[self.slot] = value
+
+    @property
+    def wealth(self):
+        return self._state.wealth[self.slot].item()
+
+    @wealth.setter
+    def wealth(self, value):
+        if self._state.alive[self.slot]:
+            self.model.aggregates.change(
+                self.strategyCode, value - self._state.wealth[self.slot].item(), 0)
+        self._state.wealth[self.slot] = value
+
+    @property
+    def owner(self):
+        return self._state.owner[self.slot].item()
+
+    @owner.setter
+    def owner(self, value):
+        if self._state.alive[self.slot]:
+            self.model.aggregates.change(
+                self.strategyCode, 0, value - self._state.owner[self.slot].item())
+        self._state.owner[self.slot] = value
+
+    @property
+    def pos(self):
+        x = self._state.x[self.slot]
+        if x < 0:
+            return None
+        return (int(x), int(self._state.y[self.slot]))
+
+    @pos.setter
+    def pos(self, value):
+        if value is None:
+            self._state.x[self.slot] = -1
+            self._state.y[self.slot] = -1
+        else:
+            self._state.x[self.slot], self._state.y[self.slot] = value
@@ -0,0 +1,160 @@
+import numpy as np
+
+
+# Struct-of-arrays storage of the agents' state
+class AgentState:
+    """Parallel arrays holding the state of every agent, indexed by agent slot."""
+
+    def __init__(self, n_strategies, capacity=1024):
+        """AgentState constructor
+
+        Arguments:
+            n_strategies {integer} -- number of strategy codes in use
+            capacity {integer} -- initial number of agent slots
+        """
+        self.n_strategies = n_strategies
+        self.size = 0
+        self.free = []
+
+        capacity = max(int(capacity), 1)
+        self.uid = np.full(capacity, -1, dtype=np.int64)
+        self.wealth = np.zeros(capacity, dtype=np.float64)
+        self.owner = np.zeros(capacity, dtype=np.float64)
+        self.strategy = np.zeros(capacity, dtype=np.int16)
+        self.x = np.full(capacity, -1, dtype=np.int32)
+        self.y = np.full(capacity, -1, dtype=np.int32)
+        self.alive = np.zeros(capacity, dtype=bool)
+        # object view of each slot, used to hand agents back to the object API
+        self.agents = [None] * capacity
+
+    def _grow(self):
+        """Double the number of agent slots
+        """
+        capacity = 2 * len(self.alive)
+        for name, fill in (('uid', -1), ('wealth', 0), ('owner', 0), ('strategy', 0),
+                           ('x', -1), ('y', -1), ('alive', False)):
+            old = getattr(self, name)
+            new = np.full(capacity, fill, dtype=old.dtype)
+            new[:self.size] = old[:self.size]
+            setattr(self, name, new)
+        self.agents.extend([None] * (capacity - len(self.agents)))
+
+    def allocate(self, agent, code):
+        """Give an agent a slot, reusing the slot of a dead agent if there is one
+
+        Arguments:
+            agent {Agent} -- agent the slot belongs to
+            code {integer} -- strategy code of the agent
+
+        Returns:
+            integer -- the agent's slot
+        """
+        if self.free:
+            slot = self.free.pop()
+        else:
+            if self.size == len(self.alive):
+                self._grow()
+            slot = self.size
+            self.size += 1
+        self.uid[slot] = agent.unique_id
+        self.strategy[slot] = code
+        self.wealth[slot] = 0
+        self.owner[slot] = 0
+        self.x[slot] = -1
+        self.y[slot] = -1
+        # the slot only counts as alive once the agent is added to the model
+        self.alive[slot] = False
+        self.agents[slot] = agent
+        return slot
+
+    def release(self, slot):
+        """Free the slot of a dead agent
+
+        Arguments:
+            slot {integer} -- slot to free
+        """
+        self.alive[slot] = False
+        self.agents[slot] = None
+        self.free.append(slot)
+
+    def living(self, code=None):
+        """Slots of the living agents, in order of their unique id
+
+        Arguments:
+            code {integer} -- optional strategy code to restrict the slots to
+
+        Returns:
+            numpy.array -- slots of the living agents
+        """
+        mask = self.alive[:self.size]
+        if code is not None:
+            mask = mask & (self.strategy[:self.size] == code)
+        slots = np.flatnonzero(mask)
+        return slots[np.argsort(self.uid[slots], kind='stable')]
+
+    def totalWealth(self, slots=None):
+        """Wealth plus property value of agents
+
+        Arguments:
+            slots {numpy.array} -- optional slots, defaults to all slots in use
+
+        Returns:
+            numpy.array -- total wealth per slot
+        """
+        if slots is None:
+            slots = slice(0, self.size)
+        return self.wealth[slots] + self.owner[slots]
+
+    def strategyTotals(self):
+        """Number of living agents and their total wealth per strategy code
+
+        Returns:
+            numpy.array -- population per strategy code
+            numpy.array -- total wealth per strategy code
+        """
+        alive = self.alive[:self.size]
+        codes = self.strategy[:self.size][alive]
+        population = np.bincount(codes, minlength=self.n_strategies)
+        wealth = np.bincount(codes, weights=self.totalWealth()[alive],
+                             minlength=self.n_strategies)
+        return population, wealth
+
+    def poorest(self, code, k):
+        """Slots of the k agents of a strategy with the least total wealth
+
+        Uses a partial selection (numpy.partition) instead of a full sort.
+        Ties are broken by unique id, like a stable sort of the agents in
+        schedule order.
+
+        Arguments:
+            code {integer} -- strategy code
+            k {integer} -- number of agents to select
+
+        Returns:
+            numpy.array -- slots ordered from poorest to richest
+        """
+        slots = self.living(code)
+        if k <= 0:
+            return slots[:0]
+        wealth = self.totalWealth(slots)
+        if k < len(slots):
+            # everything below the k-th smallest wealth, topped up with the
+            # agents at that wealth that come first in unique id order
+            kth = np.partition(wealth, k - 1)[k - 1]
+            below = np.flatnonzero(wealth < kth)
+            ties = np.flatnonzero(wealth == kth)[:k - len(below)]
+            chosen = np.concatenate([below, ties])
+            slots, wealth = slots[chosen], wealth[chosen]
+        order = np.lexsort((self.uid[slots], wealth))
+        return slots[order]
+
+    def view(self, slots):
+        """Object view of a set of slots
+
+        Arguments:
+            slots {numpy.array} -- slots to look up
+
+        Returns:
+            list -- the agents occupying the slots
+        """
+        return [self.agents[slot] for slot in slots]
@@ -0,0 +1,192 @@
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+import matplotlib.pyplot as plt
+from scipy import stats
+
+from resultstore import ResultReader
+
+# Statistics aggregated over the runs, in the order of the result columns
+QUANTITIES = ('wealth', 'population')
+
+
+# Per (step, strategy) statistics over the runs of a job
+class StepStatistics:
+    """Mean, standard deviation and confidence interval of every quantity, per step and strategy.
+
+    Every array is indexed [step, strategy code]. The standard deviation is
+    the sample standard deviation over the runs, the confidence interval is
+    the half-width of the Student t interval of the mean; both are NaN where
+    fewer than two runs reached the step.
+    """
+
+    def __init__(self, strategies, runs, mean, m2, confidence=0.95):
+        """StepStatistics constructor
+
+        Arguments:
+            strategies {list} -- strategy names, indexed by strategy code
+            runs {numpy.array} -- number of runs per step and strategy
+            mean {dictionary} -- mean per step and strategy, keyed by quantity
+            m2 {dictionary} -- sum of squared deviations from the mean, keyed by quantity
+            confidence {float} -- confidence level of the intervals
+        """
+        self.strategies = list(strategies)
+        self.runs = runs
+        self.confidence = confidence
+        self.mean = mean
+        self.std = {}
+        self.ci = {}
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t = np.where(runs > 1, stats.t.ppf(0.5 + confidence / 2, runs - 1), np.nan)
+            for quantity in QUANTITIES:
+                self.std[quantity] = np.where(runs > 1, np.sqrt(m2[quantity] / (runs - 1)), np.nan)
+                self.ci[quantity] = t * self.std[quantity] / np.sqrt(runs)
+
+    @property
+    def steps(self):
+        return self.runs.shape[0]
+
+    def toDataFrame(self):
+        """Flatten the statistics into a table, one row per step and strategy
+
+        Returns:
+            pandas.DataFrame -- step, strategy, runs and the mean, std and ci of every quantity
+        """
+        steps, n_strategies = self.runs.shape
+        data = {
+            'step': np.repeat(np.arange(steps), n_strategies),
+            'strategy': np.tile(np.array(self.strategies, dtype=object), steps),
+            'runs': self.runs.reshape(-1),
+        }
+        for quantity in QUANTITIES:
+            data[quantity + '_mean'] = self.mean[quantity].reshape(-1)
+            data[quantity + '_std'] = self.std[quantity].reshape(-1)
+            data[quantity + '_ci'] = self.ci[quantity].reshape(-1)
+        return pd.DataFrame(data)
+
+
+def aggregate(path, confidence=0.95):
+    """Aggregate a result file over its runs, in one pass over its chunks
+
+    Every chunk is reduced per (step, strategy) with bincount and merged into
+    the running count, mean and sum of squared deviations (Chan et al.'s
+    parallel update), so the file is never held in memory as a whole.
+
+    Arguments:
+        path {string} -- result file, see resultstore.ResultWriter
+        confidence {float} -- confidence level of the intervals
+
+    Returns:
+        StepStatistics -- the aggregated statistics
+    """
+    reader = ResultReader(path)
+    n_strategies = len(reader.strategies)
+    runs = np.zeros(0)
+    mean = {quantity: np.zeros(0) for quantity in QUANTITIES}
+    m2 = {quantity: np.zeros(0) for quantity in QUANTITIES}
+
+    for run, step, strategy, wealth, population in reader.chunks():
+        if not len(step):
+            continue
+        cell = step.astype(np.int64) * n_strategies + strategy
+        size = (int(step.max()) + 1) * n_strategies
+        if size > len(runs):
+            # later steps showed up, pad the accumulators
+            runs = np.pad(runs, (0, size - len(runs)))
+            for quantity in QUANTITIES:
+                mean[quantity] = np.pad(mean[quantity], (0, size - len(mean[quantity])))
+                m2[quantity] = np.pad(m2[quantity], (0, size - len(m2[quantity])))
+
+        chunkRuns = np.bincount(cell, minlength=len(runs)).astype(np.float64)
+        total = runs + chunkRuns
+        for quantity, values in (('wealth', wealth), ('population', population)):
+            values = values.astype(np.float64)
+            chunkMean = np.divide(np.bincount(cell, weights=values, minlength=len(runs)), chunkRuns,
+                                  out=np.zeros(len(runs)), where=chunkRuns > 0)
+            chunkM2 = np.bincount(cell, weights=(values - chunkMean[cell]) ** 2, minlength=len(runs))
+            delta = chunkMean - mean[quantity]
+            share = np.divide(chunkRuns, total, out=np.zeros(len(runs)), where=total > 0)
+            mean[quantity] = mean[quantity] + delta * share
+            m2[quantity] = m2[quantity] + chunkM2 + delta ** 2 * runs * share
+        runs = total
+
+    shape = (len(runs) // n_strategies, n_strategies)
+    return StepStatistics(reader.strategies, runs.astype(np.int64).reshape(shape),
+                          {quantity: mean[quantity].reshape(shape) for quantity in QUANTITIES},
+                          {quantity: m2[quantity].reshape(shape) for quantity in QUANTITIES},
+                          confidence)
+
+
+def plot(statistics, output_folder):
+    """Write the aggregated plots: population and wealth over time, final population histogram
+
+    The curves show the mean over the runs, with the confidence interval as
+    a band (and as error bars on the histogram).
+
+    Arguments:
+        statistics {StepStatistics} -- aggregated statistics
+        output_folder {string} -- folder the plots are written to
+    """
+    steps = np.arange(statistics.steps)
+
+    # 1. Strategy population over time
+    # 2. Strategy wealth over time
+    for quantity, label, title, name in (
+            ('population', 'Population', 'Strategy population at each step', 'aggregated_population_plot.png'),
+            ('wealth', 'Wealth', 'Strategy wealth accumulated at each step', 'aggregated_wealth_plot.png')):
+        plt.figure()
+        for code, strategy in enumerate(statistics.strategies):
+            mean = statistics.mean[quantity][:, code]
+            ci = statistics.ci[quantity][:, code]
+            line, = plt.plot(steps, mean, label=(strategy))
+            plt.fill_between(steps, mean - ci, mean + ci, color=line.get_color(), alpha=0.2, linewidth=0)
+        plt.ylabel(label)
+        plt.xlabel('Simulation Steps')
+        plt.title(title)
+        plt.legend()
+        plt.tight_layout()
+        plt.savefig(os.path.join(output_folder, name))
+        plt.close()
+
+    # 3. Population histogram
+    y_pos = np.arange(len(statistics.strategies))
+    plt.figure()
+    plt.bar(y_pos, statistics.mean['population'][-1], yerr=statistics.ci['population'][-1],
+            align='center', alpha=0.5)
+    plt.xticks(y_pos, statistics.strategies)
+    plt.ylabel('Population')
+    plt.xlabel('Strategies')
+    plt.title('Population composition - end of simulation')
+    plt.tight_layout()
+    plt.savefig(os.path.join(output_folder, 'aggregated_histogram_plot.png'))
+    plt.close()
+
+
+def aggregateResults(path, output_folder, confidence=0.95):
+    """Aggregate a result file, write the statistics table and the plots
+
+    Arguments:
+        path {string} -- result file
+        output_folder {string} -- folder the table (aggregated_statistics.csv) and the plots are written to
+        confidence {float} -- confidence level of the intervals
+
+    Returns:
+        StepStatistics -- the aggregated statistics
+    """
+    statistics = aggregate(path, confidence)
+    statistics.toDataFrame().to_csv(os.path.join(output_folder, 'aggregated_statistics.csv'), index=False)
+    plot(statistics, output_folder)
+    return statistics
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Aggregate the runs of a result file and plot them')
+    parser.add_argument('results', help='result file written by the simulation')
+    parser.add_argument('--output', help='output folder, defaults to the folder of the result file')
+    parser.add_argument('--confidence', type=float, default=0.95, help='confidence level of the intervals')
+    args = parser.parse_args()
+    aggregateResults(args.results, args.output or os.path.dirname(os.path.abspath(args.results)),
+                     args.confidence)
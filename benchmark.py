@@ -0,0 +1,475 @@
+import argparse
+import datetime
+import gc
+import json
+import math
+import platform
+import random
+import sys
+import time
+import timeit
+import tracemalloc
+
+import numpy as np
+from scipy import stats
+
+import ToM
+import strategies
+from model import EvolutionaryModel
+from simconfig import SimulationConfig
+
+N_DELTAS = 10
+N_CONTEXTS = 10
+
+# Scaling tiers of the suite: number of agents, grid width and height
+TIERS = {
+    'small': (300, 20, 20),
+    'medium': (3000, 60, 60),
+    'large': (30000, 300, 300),
+    'huge': (100000, 1000, 1000),
+}
+
+# Negotiations timed per sample of the play benchmark
+N_PLAYS = 200
+
+# Bumped whenever the layout of the baseline files changes
+BASELINE_VERSION = 1
+
+
+# Stand-in for the agent owning a ToM agent, decisions only read its direction
+class Owner:
+    owner = 0
+    wealth = 0
+
+
+def makeDecisionMaker(order):
+    """ToM agent of the given order, set up as a seller
+
+    Arguments:
+        order {integer} -- theory of mind order (0 or 1)
+
+    Returns:
+        ToM.ToMAgent -- the agent
+    """
+    agent = (ToM.ToM1 if order == 1 else ToM.ToM0)(N_DELTAS, N_CONTEXTS, Owner())
+    agent.setDirection(1, Owner())
+    return agent
+
+
+def denseDecision(agent, offerSeller, offerBuyer, context):
+    """Decision of a ToM0/ToM1 agent evaluated without any cache, as before they were added
+
+    The beliefs row is normalised and the value functions V and U are
+    allocated on every call, and there is no decision cache.
+
+    Arguments:
+        agent {ToM.ToMAgent} -- ToM0 or ToM1 agent, its direction is set
+        offerSeller {double} -- offer made by seller in previous round
+        offerBuyer {double} -- offer made by buyer in previous round
+        context {integer} -- index of current context's bin
+
+    Returns:
+        double -- offer made
+        integer -- index of delta bin used
+    """
+    if agent.order == 1:
+        predicted, _ = denseDecision(agent.model, offerSeller, offerBuyer, context)
+        if agent.direction > 0:
+            v = ToM.V(agent.possibleDeltas - offerSeller, predicted, agent.direction)
+        else:
+            v = ToM.V(predicted, agent.possibleDeltas + offerBuyer, agent.direction)
+        action = np.argmax(v)
+    else:
+        pool, slot = agent.beliefs.pool, agent.beliefs.slot
+        counts = pool.counts[pool.rowSlot[slot, context]]
+        p = counts / np.sum(counts)
+        v = ToM.V(offerSeller - agent.possibleDeltas, offerBuyer + agent.possibleDeltas, agent.direction)
+        action = np.argmax(ToM.U(v, p))
+    return (offerSeller if agent.direction > 0 else offerBuyer) - \
+        agent.direction * agent.possibleDeltas[action], action
+
+
+def benchmarkDecisions(order, n_calls=20000, repeat=5):
+    """Time ToM0/ToM1 decisions with the decision cache, warm and invalidated belief caches
+
+    Uncached: the decision of an agent that observed the context once,
+    evaluated without any cache (see denseDecision), the baseline of the
+    others. Prior: the beliefs of the context were never updated, the
+    decision is a lookup in the decision cache. Warm: the context was
+    observed once, the same context is decided over and over and the
+    normalised beliefs are a lookup. Cold: the context is observed before
+    every decision, as in a negotiation round, so the beliefs row is
+    normalised again each time.
+
+    Arguments:
+        order {integer} -- theory of mind order (0 or 1)
+        n_calls {integer} -- decisions per measurement
+        repeat {integer} -- measurements, the fastest is reported
+
+    Returns:
+        dictionary -- microseconds per decision, keyed by 'uncached', 'prior', 'warm' and 'cold'
+    """
+    agent = makeDecisionMaker(order)
+    beliefs = agent.model.beliefs if order == 1 else agent.beliefs
+    context = N_CONTEXTS // 2
+
+    def decide():
+        agent(0.8, 0.3, context)
+
+    def observeAndDecide():
+        beliefs.observe(context, 0)
+        agent(0.8, 0.3, context)
+
+    def observe():
+        beliefs.observe(context, 0)
+
+    def measure(run):
+        return min(timeit.repeat(run, number=n_calls, repeat=repeat)) / n_calls * 1e6
+
+    timings = {'prior': measure(decide)}
+    beliefs.observe(context, 0)
+    # the caches must not change the decision
+    assert denseDecision(agent, 0.8, 0.3, context) == agent(0.8, 0.3, context)
+    timings['uncached'] = measure(lambda: denseDecision(agent, 0.8, 0.3, context))
+    timings['warm'] = measure(decide)
+    # the cold loop also pays for the observation, leave it out of the decision
+    timings['cold'] = measure(observeAndDecide) - measure(observe)
+    agent.release()
+    return timings
+
+
+def benchmarkMemory(n_agents, n_observed=(0, 1, 3)):
+    """Memory footprint per ToM0 agent, for agents that observed a few contexts
+
+    The objects allocated for the agents are counted with tracemalloc, and
+    the belief pool for the slots and rows the agents use. The pool is
+    shared by the whole process, it is grown to hold the agents beforehand
+    so its spare capacity is left out; the agents are released after each
+    measurement.
+
+    Arguments:
+        n_agents {integer} -- number of agents
+        n_observed {tuple} -- numbers of contexts every agent observes
+
+    Returns:
+        dictionary -- bytes per agent, keyed by the number of observed contexts
+    """
+    def build(observed):
+        agents = [ToM.ToM0(N_DELTAS, N_CONTEXTS, None) for _ in range(n_agents)]
+        for agent in agents:
+            for context in range(observed):
+                agent.beliefs.observe(context, 0)
+        return agents
+
+    def release(agents):
+        for agent in agents:
+            agent.release()
+
+    pool = ToM.beliefPool(N_DELTAS, N_CONTEXTS)
+    slotBytes = pool.rowSlot[0].nbytes
+    rowBytes = pool.counts[0].nbytes + pool.totals.itemsize + pool.p[0].nbytes + pool.clean.itemsize
+    footprint = {}
+    # an emptied pool shrinks back (see BeliefPool.release), a table kept
+    # alive holds on to the capacity grown before the measurement
+    anchor = ToM.ToM0(N_DELTAS, N_CONTEXTS, None)
+    for observed in n_observed:
+        release(build(observed))
+        rows = pool.privateRows()
+        tracemalloc.start()
+        agents = build(observed)
+        objects = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        used = n_agents * slotBytes + (pool.privateRows() - rows) * rowBytes
+        footprint[observed] = (objects + used) / n_agents
+        release(agents)
+    anchor.release()
+    return footprint
+
+
+def _timed(run):
+    """Seconds taken by one call, with the garbage collector paused like timeit does"""
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        start = time.perf_counter()
+        run()
+        return time.perf_counter() - start
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def _sampleStep(model, sample):
+    return _timed(model.step)
+
+
+def _sampleNaturalSelection(model, sample):
+    # the agents move and interact first, so there is something to select
+    model.schedule.step()
+    return _timed(lambda: strategies.naturalSelection(model))
+
+
+def _sampleInteract(model, sample):
+    agents = list(model.schedule.agents)
+    for agent in agents:
+        agent.move()
+
+    def interactAll():
+        for agent in agents:
+            # like the scheduler, skip agents that died in an earlier interaction
+            if agent.alive:
+                agent.interact()
+
+    seconds = _timed(interactAll)
+    strategies.naturalSelection(model)
+    return seconds
+
+
+def _samplePlay(model, sample):
+    traders = [agent for agent in model.schedule.agents if strategies.tomOrder(agent.strategy) is not None]
+    sellers = [agent for agent in traders if agent.owner > 0]
+    buyers = [agent for agent in traders if agent.owner == 0]
+    if not sellers or not buyers:
+        raise ValueError('The play benchmark needs ToM traders with and without property')
+    rng = random.Random(sample)
+    pairs = [(rng.choice(sellers).ToMAgent, rng.choice(buyers).ToMAgent) for _ in range(N_PLAYS)]
+    maxRounds = model.config.max_negotiation_rounds
+
+    def playAll():
+        for seller, buyer in pairs:
+            seller.play(buyer, maxRounds)
+
+    return _timed(playAll)
+
+
+# Benchmarked entry points, each sample times one call of:
+#   step -- EvolutionaryModel.step
+#   naturalSelection -- strategies.naturalSelection after the agents moved and interacted
+#   interact -- EvolutionaryAgent.interact of every agent, after all of them moved
+#   play -- N_PLAYS negotiations of ToMAgent.play between random ToM traders
+CASES = {
+    'step': _sampleStep,
+    'naturalSelection': _sampleNaturalSelection,
+    'interact': _sampleInteract,
+    'play': _samplePlay,
+}
+
+
+def benchmarkCase(case, tier, samples=10, warmup=1, seed=1, engine='object'):
+    """Time one benchmark case on a freshly built, seeded model of a tier
+
+    The samples are taken one after the other on the same model, so they
+    follow the same trajectory on every machine and every run of the suite.
+
+    Arguments:
+        case {string} -- name of the case, see CASES
+        tier {string} -- name of the tier, see TIERS
+        samples {integer} -- number of timed samples
+        warmup {integer} -- number of samples taken first and thrown away
+        seed {integer} -- seed of the model
+        engine {string} -- agent engine of the model
+
+    Returns:
+        list -- seconds per sample
+    """
+    n_agents, width, height = TIERS[tier]
+    ToM.clearDecisionCache()
+    model = EvolutionaryModel(n_agents, width, height, seed=seed, engine=engine, config=SimulationConfig())
+    sample = CASES[case]
+    try:
+        seconds = [sample(model, k) for k in range(warmup + samples)]
+    finally:
+        model.close()
+    return seconds[warmup:]
+
+
+def runSuite(cases=None, tiers=None, samples=10, warmup=1, seed=1, engine='object', log=None):
+    """Run the benchmark suite
+
+    Arguments:
+        cases {list} -- names of the cases to run, None runs all of them
+        tiers {list} -- names of the tiers to run, None runs all of them
+        samples {integer} -- number of timed samples per case and tier
+        warmup {integer} -- number of samples thrown away first
+        seed {integer} -- seed of the models
+        engine {string} -- agent engine of the models
+        log {file} -- optional stream the progress is written to
+
+    Returns:
+        dictionary -- the results, as saved in a baseline file (see saveBaseline)
+    """
+    results = {
+        'version': BASELINE_VERSION,
+        'created': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+        'seed': seed,
+        'samples': samples,
+        'warmup': warmup,
+        'engine': engine,
+        'benchmarks': {},
+    }
+    for tier in tiers or TIERS:
+        n_agents, width, height = TIERS[tier]
+        for case in cases or CASES:
+            seconds = benchmarkCase(case, tier, samples, warmup, seed, engine)
+            results['benchmarks'][case + '@' + tier] = {
+                'case': case, 'tier': tier, 'agents': n_agents, 'width': width, 'height': height,
+                'seconds': seconds,
+            }
+            if log is not None:
+                log.write('%-24s %12.6f s (min %.6f s)\n' % (case + '@' + tier, np.mean(seconds), min(seconds)))
+                log.flush()
+    return results
+
+
+def saveBaseline(results, path):
+    """Write the results of a suite run to a JSON baseline file
+
+    Arguments:
+        results {dictionary} -- results returned by runSuite
+        path {string} -- baseline file
+    """
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=1)
+
+
+def loadBaseline(path):
+    """Read a baseline file
+
+    Arguments:
+        path {string} -- baseline file
+
+    Returns:
+        dictionary -- the results, see runSuite
+
+    Raises:
+        ValueError -- if the file was written by another version of the suite
+    """
+    with open(path) as f:
+        results = json.load(f)
+    if results.get('version') != BASELINE_VERSION:
+        raise ValueError('Unsupported baseline version: ' + str(results.get('version')))
+    return results
+
+
+def welchTest(baseline, current):
+    """One-sided Welch t-test of whether the current samples are slower than the baseline
+
+    Arguments:
+        baseline {list} -- seconds per sample of the baseline
+        current {list} -- seconds per sample of the current run
+
+    Returns:
+        float -- t statistic
+        float -- p-value of the current mean not being larger than the baseline mean
+    """
+    m1, m2 = np.mean(baseline), np.mean(current)
+    if np.var(baseline) + np.var(current) == 0:
+        # no spread at all, the means either differ or they don't
+        return (math.copysign(math.inf, m2 - m1) if m2 != m1 else 0.0), (0.0 if m2 > m1 else 1.0)
+    t, p = stats.ttest_ind(current, baseline, equal_var=False)
+    # one-sided p-value from the two-sided one
+    return t, (p / 2 if t > 0 else 1 - p / 2)
+
+
+def compare(baseline, current, alpha=0.01, threshold=0.05):
+    """Compare two suite runs benchmark by benchmark
+
+    A benchmark is flagged 'slower' when its mean time grew by more than the
+    threshold and Welch's t-test finds the growth significant at level
+    alpha, and 'faster' in the mirrored case. Both need at least two samples.
+
+    Arguments:
+        baseline {dictionary} -- results of the baseline run
+        current {dictionary} -- results of the current run
+        alpha {float} -- significance level of the one-sided tests
+        threshold {float} -- smallest relative change of the mean that is flagged
+
+    Returns:
+        list -- per benchmark present in both runs a dictionary with its name,
+                the baseline and current mean, the relative change, the p-value of
+                a slowdown and the verdict ('slower', 'faster' or '')
+    """
+    rows = []
+    for name, entry in baseline['benchmarks'].items():
+        if name not in current['benchmarks']:
+            continue
+        before = entry['seconds']
+        after = current['benchmarks'][name]['seconds']
+        change = np.mean(after) / np.mean(before) - 1
+        pSlower = welchTest(before, after)[1]
+        pFaster = welchTest(after, before)[1]
+        verdict = ''
+        if change > threshold and pSlower < alpha:
+            verdict = 'slower'
+        elif change < -threshold and pFaster < alpha:
+            verdict = 'faster'
+        rows.append({'name': name, 'baseline': float(np.mean(before)), 'current': float(np.mean(after)),
+                     'change': float(change), 'p': float(pSlower), 'verdict': verdict})
+    return rows
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmarks of the model')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run = commands.add_parser('run', help='run the benchmark suite and save the results as a baseline')
+    run.add_argument('--cases', nargs='*', choices=list(CASES), help='cases to run (default: all)')
+    run.add_argument('--tiers', nargs='*', choices=list(TIERS), help='tiers to run (default: all)')
+    run.add_argument('--samples', type=int, default=10, help='timed samples per case and tier')
+    run.add_argument('--warmup', type=int, default=1, help='samples thrown away first')
+    run.add_argument('--seed', type=int, default=1, help='seed of the models')
+    run.add_argument('--engine', default='object', choices=['object', 'array'], help='agent engine of the models')
+    run.add_argument('--output', default='benchmark.json', help='baseline file to write')
+
+    comparison = commands.add_parser('compare', help='flag significant slowdowns against a baseline')
+    comparison.add_argument('baseline', help='baseline file')
+    comparison.add_argument('current', help='results file of the run to check')
+    comparison.add_argument('--alpha', type=float, default=0.01, help='significance level of the t-tests')
+    comparison.add_argument('--threshold', type=float, default=0.05, help='smallest relative change flagged')
+
+    micro = commands.add_parser('micro', help='micro-benchmarks of the ToM decisions and belief memory')
+    micro.add_argument('--calls', type=int, default=20000, help='decisions per measurement')
+    micro.add_argument('--agents', type=int, nargs='*', default=[10000, 100000, 1000000],
+                       help='population sizes of the memory benchmark')
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        results = runSuite(args.cases, args.tiers, args.samples, args.warmup, args.seed, args.engine, sys.stdout)
+        saveBaseline(results, args.output)
+        print('Results written to ' + args.output)
+
+    elif args.command == 'compare':
+        baseline = loadBaseline(args.baseline)
+        current = loadBaseline(args.current)
+        for key in ('engine', 'seed', 'python', 'numpy', 'platform'):
+            if baseline[key] != current[key]:
+                print('warning: %s differs (%s vs %s)' % (key, baseline[key], current[key]))
+        rows = compare(baseline, current, args.alpha, args.threshold)
+        print('%-24s %12s %12s %8s %8s' % ('benchmark', 'baseline s', 'current s', 'change', 'p'))
+        for row in rows:
+            print('%-24s %12.6f %12.6f %+7.1f%% %8.4f %s' % (row['name'], row['baseline'], row['current'],
+                                                           100 * row['change'], row['p'], row['verdict']))
+        slower = [row['name'] for row in rows if row['verdict'] == 'slower']
+        if slower:
+            print('%d significant slowdown(s): %s' % (len(slower), ', '.join(slower)))
+            sys.exit(1)
+
+    else:
+        for order in (0, 1):
+            timings = benchmarkDecisions(order, args.calls)
+            print('ToM%d.__call__: %.2f us uncached, %.2f us under the prior, %.2f us cached, '
+                  '%.2f us after observe (%.1fx / %.1fx / %.1fx faster)'
+                  % (order, timings['uncached'], timings['prior'], timings['warm'], timings['cold'],
+                     timings['uncached'] / timings['prior'], timings['uncached'] / timings['warm'],
+                     timings['uncached'] / timings['cold']))
+
+        # a dense table with its normalised copy would take 2 * contexts * deltas doubles
+        print('Memory per ToM0 agent (dense tables: %d bytes of beliefs)' % (2 * 8 * N_CONTEXTS * N_DELTAS))
+        for n_agents in args.agents:
+            footprint = benchmarkMemory(n_agents)
+            print('%8d agents: ' % n_agents + ', '.join(
+                '%d bytes with %d contexts observed' % (size, observed) for observed, size in footprint.items()))
@@ -0,0 +1,184 @@
+import json
+import os
+
+import numpy as np
+
+from model import EvolutionaryModel
+from collector import StatisticsCollector
+from simconfig import SimulationConfig
+
+# Version of the checkpoint layout, bumped whenever the arrays change
+FORMAT_VERSION = 2
+
+# Collector columns, in the order of StatisticsCollector.columns()
+COLLECTOR_COLUMNS = ('run', 'step', 'strategy', 'wealth', 'population')
+
+
+def save(model, path):
+    """Write the complete state of a model to a checkpoint file
+
+    The agents are dumped as arrays in schedule order, the beliefs of the
+    agents' ToM state as the rows that differ from the uniform prior, next to
+    the random number generator states, the running strategy totals and the
+    statistics the model's collector holds in memory. Rows the collector
+    already flushed to its file are not part of the checkpoint.
+
+    The file is an uncompressed numpy .npz archive, written next to path and
+    renamed into place, so an interrupted save never leaves a truncated
+    checkpoint behind.
+
+    Arguments:
+        model {EvolutionaryModel} -- model to save, between two steps
+        path {string} -- checkpoint file
+    """
+    agents = model.schedule.agents
+    n = len(agents)
+    state = model.state
+    if state is not None:
+        # gather straight from the AgentState arrays
+        slots = np.fromiter((agent.slot for agent in agents), dtype=np.int64, count=n)
+        arrays = {
+            'uid': state.uid[slots],
+            'strategy': state.strategy[slots],
+            'wealth': state.wealth[slots],
+            'owner': state.owner[slots],
+            'pos': np.stack([state.x[slots], state.y[slots]], axis=1),
+        }
+    else:
+        arrays = {
+            'uid': np.fromiter((agent.unique_id for agent in agents), dtype=np.int64, count=n),
+            'strategy': np.fromiter((agent.strategyCode for agent in agents), dtype=np.int16, count=n),
+            'wealth': np.fromiter((agent.wealth for agent in agents), dtype=np.float64, count=n),
+            'owner': np.fromiter((agent.owner for agent in agents), dtype=np.float64, count=n),
+            'pos': np.array([agent.pos for agent in agents], dtype=np.int32).reshape(-1, 2),
+        }
+    arrays['tomOrder'] = np.fromiter((agent.tomOrder for agent in agents), dtype=np.int16, count=n)
+
+    # ToM state: which agents built it, and the private rows of their beliefs
+    built = np.flatnonzero(np.fromiter((agent.hasToM() for agent in agents), dtype=bool, count=n))
+    arrays['tomBuilt'] = built
+    beliefsAgent, beliefsContext = np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    beliefsCounts = np.zeros([0, 0])
+    if len(built):
+        tables = [agents[i].ToMAgent.baseBeliefs() for i in built]
+        pool = tables[0].pool
+        rows = pool.rowSlot[np.array([beliefs.slot for beliefs in tables], dtype=np.int64)]
+        j, beliefsContext = np.nonzero(rows)
+        beliefsAgent = built[j]
+        beliefsCounts = pool.counts[rows[j, beliefsContext]]
+    arrays['beliefsAgent'] = beliefsAgent
+    arrays['beliefsContext'] = beliefsContext
+    arrays['beliefsCounts'] = beliefsCounts
+
+    version, internal, gauss = model.random.getstate()
+    arrays['random'] = np.array(internal, dtype=np.uint32)
+
+    collector = model.collector
+    if collector is not None:
+        for name, column in zip(COLLECTOR_COLUMNS, collector.columns()):
+            arrays['collector_' + name] = column
+
+    meta = {
+        'format': FORMAT_VERSION,
+        'N': model.num_agents,
+        'width': model.grid.width,
+        'height': model.grid.height,
+        'run': model.run,
+        'seed': model._seed,
+        'engine': model.engine,
+        'space': model.space,
+        'activation': model.activation,
+        'tom': model.tom,
+        'check_aggregates': model.check_aggregates,
+        'config': model.config.toDict(),
+        'latest_id': model.latest_id,
+        'steps': model.schedule.steps,
+        'time': model.schedule.time,
+        'running': model.running,
+        'random': [version, gauss],
+        'np_random': model.np_random.bit_generator.state,
+        # the running totals keep their exact values (and int/float types)
+        'aggregates': [model.aggregates.count, model.aggregates.wealth, model.aggregates.property],
+        'collector': None if collector is None else collector.strategies,
+    }
+    arrays['meta'] = np.array(json.dumps(meta))
+
+    temporary = path + '.tmp'
+    with open(temporary, 'wb') as f:
+        np.savez(f, **arrays)
+    os.replace(temporary, path)
+
+
+def load(path, collector=None):
+    """Rebuild a model from a checkpoint file, see save
+
+    The restored model continues exactly like the saved one would have:
+    stepping it gives the same trajectory, draw for draw.
+
+    Arguments:
+        path {string} -- checkpoint file
+        collector {StatisticsCollector} -- optional collector for the restored
+            model, the saved statistics are appended to it (a new collector is
+            created if None and the saved model had one)
+
+    Returns:
+        EvolutionaryModel -- the restored model
+
+    Raises:
+        ValueError -- if the checkpoint was written by another format version
+    """
+    with np.load(path, allow_pickle=False) as data:
+        meta = json.loads(str(data['meta']))
+        if meta['format'] != FORMAT_VERSION:
+            raise ValueError('Unsupported checkpoint format: ' + str(meta['format']))
+
+        model = EvolutionaryModel(
+            meta['N'], meta['width'], meta['height'], run=meta['run'], seed=meta['seed'],
+            engine=meta['engine'], space=meta['space'], activation=meta['activation'],
+            tom=meta['tom'], check_aggregates=meta['check_aggregates'], populate=False,
+            config=SimulationConfig.fromDict(meta['config']))
+
+        # Agents, added in schedule order
+        agents = []
+        tomOrders = data['tomOrder'].tolist()
+        for uid, code, wealth, owner, tomOrder in zip(
+                data['uid'].tolist(), data['strategy'].tolist(), data['wealth'].tolist(),
+                data['owner'].tolist(), tomOrders):
+            agent = model.agentClass(uid, model, model.strategyList[code], wealth, owner)
+            # construction drew (and maybe built) a ToM order of its own
+            agent.releaseToM()
+            agent.tomOrder = tomOrder
+            agents.append(agent)
+        model.addAgents(agents, [tuple(pos) for pos in data['pos'].tolist()])
+
+        # ToM state, with the observed beliefs
+        for i in data['tomBuilt'].tolist():
+            agents[i].ToMAgent
+        if len(data['beliefsAgent']):
+            pool = agents[int(data['beliefsAgent'][0])].ToMAgent.baseBeliefs().pool
+            for i, context, counts in zip(data['beliefsAgent'].tolist(),
+                                          data['beliefsContext'].tolist(), data['beliefsCounts']):
+                row = pool.materialise(agents[i].ToMAgent.baseBeliefs().slot, context)
+                pool.counts[row] = counts
+                pool.totals[row] = np.sum(counts)
+
+        count, wealth, property = meta['aggregates']
+        model.aggregates.count = count
+        model.aggregates.wealth = wealth
+        model.aggregates.property = property
+        model.latest_id = meta['latest_id']
+        model.schedule.steps = meta['steps']
+        model.schedule.time = meta['time']
+        model.running = meta['running']
+
+        # Random streams last, building the agents drew from them
+        version, gauss = meta['random']
+        model.random.setstate((version, tuple(data['random'].tolist()), gauss))
+        model.np_random.bit_generator.state = meta['np_random']
+
+        if meta['collector'] is not None:
+            if collector is None:
+                collector = StatisticsCollector(meta['collector'], capacity=len(data['collector_run']))
+            collector.extend(tuple(data['collector_' + name] for name in COLLECTOR_COLUMNS))
+        model.collector = collector
+    return model
@@ -0,0 +1,161 @@
+import numpy as np
+import pandas as pd
+
+# Columns of the statistics table, in output order
+COLUMNS = ['run', 'step', 'strategy', 'wealth', 'population']
+
+
+# Collects per-step strategy statistics into typed column buffers
+class StatisticsCollector:
+    """Columnar collector of run/step/strategy/wealth/population rows."""
+
+    def __init__(self, strategyList, capacity=4096, path=None, chunk_size=None, sink=None):
+        """Collector constructor
+
+        Arguments:
+            strategyList {list} -- names of the strategies to collect, in output order
+            capacity {integer} -- initial number of rows to preallocate
+            path {string} -- optional csv file that flushed chunks are appended to
+            chunk_size {integer} -- optional number of rows per chunk, full chunks are flushed as they fill up
+            sink {ResultWriter} -- optional writer that flushed chunks are written to, instead of path
+        """
+        self.strategies = list(strategyList)
+        self.path = path
+        self.sink = sink
+        self.chunk_size = chunk_size
+        self.size = 0
+        self.flushed = 0
+
+        capacity = max(int(capacity), len(self.strategies))
+        self.run = np.empty(capacity, dtype=np.int32)
+        self.step = np.empty(capacity, dtype=np.int32)
+        self.strategy = np.empty(capacity, dtype=np.int16)
+        self.wealth = np.empty(capacity, dtype=np.float64)
+        self.population = np.empty(capacity, dtype=np.int64)
+
+    def _reserve(self, rows):
+        """Make sure the buffers can take another block of rows
+
+        Arguments:
+            rows {integer} -- number of rows about to be appended
+        """
+        needed = self.size + rows
+        capacity = len(self.run)
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        for name in ('run', 'step', 'strategy', 'wealth', 'population'):
+            old = getattr(self, name)
+            new = np.empty(capacity, dtype=old.dtype)
+            new[:self.size] = old[:self.size]
+            setattr(self, name, new)
+
+    def append(self, run, step, wealth, population):
+        """Append the statistics of one step, one row per strategy
+
+        Arguments:
+            run {integer} -- index of the simulation run
+            step {integer} -- index of the step within the run
+            wealth {array-like} -- total wealth per strategy, in strategy order
+            population {array-like} -- number of agents per strategy, in strategy order
+        """
+        n = len(self.strategies)
+        self._reserve(n)
+        rows = slice(self.size, self.size + n)
+        self.run[rows] = run
+        self.step[rows] = step
+        self.strategy[rows] = np.arange(n)
+        self.wealth[rows] = wealth
+        self.population[rows] = population
+        self.size += n
+
+        if self.chunk_size is not None:
+            while self.size >= self.chunk_size:
+                self.flush(self.chunk_size)
+
+    def collect(self, model):
+        """Collect the statistics of the step the model has just taken
+
+        Arguments:
+            model {EvolutionaryModel} -- model to collect the statistics from
+        """
+        population, wealth = model.strategyTotals()
+        codes = [model.strategyCode[strategy] for strategy in self.strategies]
+        self.append(model.run, model.schedule.steps - 1,
+                    np.asarray(wealth)[codes], np.asarray(population)[codes])
+
+    def columns(self):
+        """Compact copy of the rows held in memory, cheap to send between processes
+
+        Returns:
+            tuple -- run, step, strategy, wealth and population arrays
+        """
+        rows = slice(0, self.size)
+        return (self.run[rows].copy(), self.step[rows].copy(), self.strategy[rows].copy(),
+                self.wealth[rows].copy(), self.population[rows].copy())
+
+    def extend(self, columns):
+        """Append rows produced by columns() of a collector with the same strategies
+
+        Arguments:
+            columns {tuple} -- run, step, strategy, wealth and population arrays
+        """
+        run, step, strategy, wealth, population = columns
+        n = len(run)
+        self._reserve(n)
+        rows = slice(self.size, self.size + n)
+        self.run[rows] = run
+        self.step[rows] = step
+        self.strategy[rows] = strategy
+        self.wealth[rows] = wealth
+        self.population[rows] = population
+        self.size += n
+
+        if self.chunk_size is not None:
+            while self.size >= self.chunk_size:
+                self.flush(self.chunk_size)
+
+    def toDataFrame(self, rows=None):
+        """Convert the rows held in memory into a DataFrame
+
+        Arguments:
+            rows {integer} -- optional number of leading rows to convert, all by default
+
+        Returns:
+            pandas.DataFrame -- the collected rows with COLUMNS as columns
+        """
+        rows = slice(0, self.size if rows is None else rows)
+        names = np.array(self.strategies, dtype=object)
+        return pd.DataFrame({
+            'run': self.run[rows],
+            'step': self.step[rows],
+            'strategy': names[self.strategy[rows]],
+            'wealth': self.wealth[rows],
+            'population': self.population[rows]}, columns=COLUMNS)
+
+    def flush(self, rows=None):
+        """Write rows held in memory to the sink (or append them to the csv file) and drop them from the buffers
+
+        Arguments:
+            rows {integer} -- optional number of leading rows to write, all by default
+        """
+        if self.sink is None and self.path is None:
+            raise ValueError('StatisticsCollector has no sink or path to flush to')
+        rows = self.size if rows is None else min(rows, self.size)
+        if rows == 0:
+            return
+        if self.sink is not None:
+            self.sink.write(tuple(getattr(self, name)[:rows] for name in COLUMNS))
+        else:
+            # The first chunk starts a fresh file, later chunks are appended to it
+            first = self.flushed == 0
+            self.toDataFrame(rows).to_csv(
+                self.path, mode='w' if first else 'a', header=first, index=False)
+        self.flushed += rows
+        # keep the rows that did not make it into the chunk
+        remaining = self.size - rows
+        for name in COLUMNS:
+            column = getattr(self, name)
+            column[:remaining] = column[rows:self.size]
+        self.size = remaining
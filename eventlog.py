@@ -0,0 +1,289 @@
+import argparse
+import json
+import os
+import struct
+
+import numpy as np
+import pandas as pd
+
+# File signature and layout version
+MAGIC = b'EVEVENTS'
+VERSION = 1
+
+# Event kinds
+INTERACTION = 0
+TRADE = 1
+FIGHT = 2
+BIRTH = 3
+DEATH = 4
+KINDS = ('interaction', 'trade', 'fight', 'birth', 'death')
+
+# Columns of an event record and their on-disk type, little endian:
+#   step -- index of the step, as in the statistics
+#   kind -- event kind (INTERACTION, TRADE, ...)
+#   interaction -- owner/intruder interaction kind (strategies.HAWK_DOVE, ...), -1 for births and deaths
+#   agent -- unique id of the owner (interaction), seller (trade), winner (fight), newborn (birth) or dead agent (death)
+#   other -- unique id of the intruder (interaction), buyer (trade), loser (fight), parent (birth), -1 for deaths
+#   value -- property value (interaction), price paid by the buyer (trade), fight cost (fight),
+#            initial wealth (birth) or total wealth (death)
+COLUMNS = ('step', 'kind', 'interaction', 'agent', 'other', 'value')
+DTYPES = {
+    'step': np.dtype('<i4'),
+    'kind': np.dtype('<i1'),
+    'interaction': np.dtype('<i1'),
+    'agent': np.dtype('<i8'),
+    'other': np.dtype('<i8'),
+    'value': np.dtype('<f8'),
+}
+
+_LENGTH = struct.Struct('<Q')
+
+
+# Structured log of the interactions, trades, fights, births and deaths of a run
+class EventLog:
+    """Fixed-width event records in a preallocated columnar ring buffer.
+
+    With a path the buffer is spilled to the file as a chunk whenever it is
+    full (and on flush/close); the file has the layout of a result file
+    (see resultstore.py): a header, then chunks of a record count followed
+    by the raw array of every column. Without a path the buffer keeps the
+    last capacity events, older ones are overwritten.
+
+    Attach it to a model (EvolutionaryModel(event_log=...)), the model sets
+    the step of the records. Without an event log the model only pays a
+    None check where an event happens.
+    """
+
+    def __init__(self, path=None, capacity=65536, run=0, start=0):
+        """EventLog constructor, creates (or truncates) the file
+
+        Arguments:
+            path {string} -- optional file the events are spilled to
+            capacity {integer} -- number of records the buffer holds
+            run {integer} -- index of the run, stored in the header
+            start {integer} -- first step logged, when a run is resumed from a checkpoint (see loadEvents)
+        """
+        self.path = path
+        self.capacity = int(capacity)
+        self.run = run
+        self.start = start
+        # step the events being recorded belong to
+        self.step = start
+        # next record to write, number of records held and records lost to the ring
+        self.head = 0
+        self.size = 0
+        self.dropped = 0
+        self.spilled = 0
+        self.buffers = {name: np.empty(self.capacity, dtype=DTYPES[name]) for name in COLUMNS}
+        self.file = None
+        if path is not None:
+            header = json.dumps({
+                'version': VERSION,
+                'columns': [[name, DTYPES[name].str] for name in COLUMNS],
+                'kinds': list(KINDS),
+                'run': run,
+                'start': start,
+            }).encode()
+            self.file = open(path, 'wb')
+            self.file.write(MAGIC + _LENGTH.pack(len(header)) + header)
+
+    def record(self, kind, interaction, agent, other, value):
+        """Record one event of the current step
+
+        Arguments:
+            kind {integer} -- event kind (INTERACTION, TRADE, ...)
+            interaction {integer} -- interaction kind, -1 if there is none
+            agent {integer} -- unique id of the agent, see COLUMNS
+            other {integer} -- unique id of the other agent, -1 if there is none
+            value {float} -- value of the event, see COLUMNS
+        """
+        i = self.head
+        buffers = self.buffers
+        buffers['step'][i] = self.step
+        buffers['kind'][i] = kind
+        buffers['interaction'][i] = interaction
+        buffers['agent'][i] = agent
+        buffers['other'][i] = other
+        buffers['value'][i] = value
+        self._advance(1)
+
+    def recordMany(self, kind, interaction, agents, others, values):
+        """Record a batch of events of the same kind, of the current step
+
+        Arguments:
+            kind {integer} -- event kind
+            interaction {integer or numpy.array} -- interaction kind, per event or for all of them
+            agents {numpy.array} -- unique id of the agent of every event
+            others {numpy.array} -- unique id of the other agent of every event
+            values {numpy.array} -- value of every event
+        """
+        n = len(agents)
+        interaction = np.broadcast_to(interaction, (n,))
+        done = 0
+        while done < n:
+            take = min(self.capacity - self.head, n - done)
+            rows = slice(self.head, self.head + take)
+            batch = slice(done, done + take)
+            self.buffers['step'][rows] = self.step
+            self.buffers['kind'][rows] = kind
+            self.buffers['interaction'][rows] = interaction[batch]
+            self.buffers['agent'][rows] = agents[batch]
+            self.buffers['other'][rows] = others[batch]
+            self.buffers['value'][rows] = values[batch]
+            self._advance(take)
+            done += take
+
+    def _advance(self, n):
+        """Account for n records written at head"""
+        self.head += n
+        if self.size + n > self.capacity:
+            self.dropped += self.size + n - self.capacity
+        self.size = min(self.size + n, self.capacity)
+        if self.head == self.capacity:
+            if self.file is not None:
+                self.flush()
+            else:
+                self.head = 0
+
+    def events(self):
+        """The events held in the buffer, oldest first
+
+        Returns:
+            dictionary -- array of every column
+        """
+        order = (np.arange(self.size) + self.head - self.size) % self.capacity
+        return {name: self.buffers[name][order] for name in COLUMNS}
+
+    def flush(self):
+        """Spill the buffered events to the file as one chunk and empty the buffer
+
+        Raises:
+            ValueError -- if the log has no file
+        """
+        if self.file is None:
+            raise ValueError('The event log has no file to spill to')
+        if self.size:
+            events = self.events()
+            self.file.write(_LENGTH.pack(self.size))
+            for name in COLUMNS:
+                self.file.write(events[name].tobytes())
+            self.spilled += self.size
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.head = 0
+        self.size = 0
+
+    def close(self):
+        """Spill the remaining events and close the file
+        """
+        if self.file is not None and not self.file.closed:
+            self.flush()
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# Lazy reader of the files written by EventLog
+class EventReader:
+    """Reads an event file one chunk at a time."""
+
+    def __init__(self, path):
+        """EventReader constructor, reads the header
+
+        Arguments:
+            path {string} -- event file
+
+        Raises:
+            ValueError -- if the file is not an event file of a supported version
+        """
+        self.path = path
+        with open(path, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(path + ' is not an event file')
+            length, = _LENGTH.unpack(f.read(_LENGTH.size))
+            header = json.loads(f.read(length))
+            self.offset = f.tell()
+        if header['version'] != VERSION:
+            raise ValueError('Unsupported event file version: ' + str(header['version']))
+        self.columns = [(name, np.dtype(dtype)) for name, dtype in header['columns']]
+        self.kinds = header['kinds']
+        self.run = header['run']
+        self.start = header['start']
+        self.rowSize = sum(dtype.itemsize for name, dtype in self.columns)
+
+    def chunks(self):
+        """Iterate over the chunks, a truncated last chunk is skipped
+
+        Returns:
+            generator -- dictionary of the arrays of every column, per chunk
+        """
+        with open(self.path, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            end = f.tell()
+            f.seek(self.offset)
+            while True:
+                position = f.tell()
+                if end - position < _LENGTH.size:
+                    return
+                n, = _LENGTH.unpack(f.read(_LENGTH.size))
+                if end - position - _LENGTH.size < n * self.rowSize:
+                    # truncated by an interrupted write
+                    return
+                yield {name: np.fromfile(f, dtype=dtype, count=n) for name, dtype in self.columns}
+
+    def load(self):
+        """Read all events into arrays
+
+        Returns:
+            dictionary -- array of every column
+        """
+        chunks = list(self.chunks())
+        if not chunks:
+            return {name: np.zeros(0, dtype=dtype) for name, dtype in self.columns}
+        return {name: np.concatenate([chunk[name] for chunk in chunks]) for name, dtype in self.columns}
+
+    def toDataFrame(self):
+        """Read all events into a DataFrame, with the kind names decoded
+
+        Returns:
+            pandas.DataFrame -- one row per event with COLUMNS as columns
+        """
+        data = self.load()
+        data['kind'] = pd.Categorical.from_codes(data['kind'], categories=self.kinds)
+        return pd.DataFrame(data, columns=COLUMNS)
+
+
+def loadEvents(paths):
+    """Load the events of one run, spread over the files of its resumed parts
+
+    A run resumed from a checkpoint logs to a new file starting at the
+    checkpoint's step; the events an earlier file holds from that step on
+    were logged before the interruption and are replaced by the new ones.
+
+    Arguments:
+        paths {list} -- event files of the run
+
+    Returns:
+        dictionary -- array of every column, in step order
+    """
+    readers = sorted((EventReader(path) for path in paths), key=lambda reader: reader.start)
+    parts = []
+    for k, reader in enumerate(readers):
+        events = reader.load()
+        if k + 1 < len(readers):
+            keep = events['step'] < readers[k + 1].start
+            events = {name: column[keep] for name, column in events.items()}
+        parts.append(events)
+    return {name: np.concatenate([part[name] for part in parts]) for name in COLUMNS}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Convert an event file to csv')
+    parser.add_argument('events', help='event file written by the simulation')
+    parser.add_argument('csv', help='csv file to write')
+    args = parser.parse_args()
+    EventReader(args.events).toDataFrame().to_csv(args.csv, index=False)
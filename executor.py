@@ -0,0 +1,254 @@
+from concurrent.futures import ProcessPoolExecutor
+import glob
+import hashlib
+import json
+import os
+import numpy as np
+
+from model import EvolutionaryModel
+from collector import StatisticsCollector
+from eventlog import EventLog
+from resultstore import ResultReader, reopenResults
+import checkpoint
+
+
+def makeSeeds(num_runs, seed=None):
+    """Derive one independent seed per run
+
+    Arguments:
+        num_runs {integer} -- number of runs
+        seed {integer} -- optional root seed, None draws fresh entropy
+
+    Returns:
+        list -- one integer seed per run
+    """
+    return [int(s) for s in np.random.SeedSequence(seed).generate_state(num_runs)]
+
+
+def persistedRootSeed(path, settings=None):
+    """Root seed kept in a file, drawn and written the first time
+
+    Checkpoints and event files are named after the seed of their run, so
+    runs resumed without a configured root seed must draw the seeds of the
+    interrupted attempt again. The file also holds a hash of the settings
+    the seed was drawn for; with other settings a new seed is drawn, so the
+    runs get new names instead of resuming from checkpoints they can't use.
+
+    Arguments:
+        path {string} -- file holding the root seed
+        settings {dictionary} -- optional JSON serialisable settings the seed belongs to
+
+    Returns:
+        integer -- the root seed, see makeSeeds
+    """
+    digest = hashlib.sha256(json.dumps(settings, sort_keys=True).encode()).hexdigest()
+    if os.path.exists(path):
+        with open(path) as f:
+            kept = json.load(f)
+        if kept['settings'] == digest:
+            return kept['seed']
+    seed = np.random.SeedSequence().entropy
+    temporary = path + '.tmp'
+    with open(temporary, 'w') as f:
+        json.dump({'seed': seed, 'settings': digest}, f)
+    os.replace(temporary, path)
+    return seed
+
+
+def removeStaleRuns(folder, seeds):
+    """Delete the checkpoints, event or result files of runs that are not part of a job
+
+    Arguments:
+        folder {string} -- folder holding the files of the runs, named run<run>-seed<seed>...
+        seeds {list} -- seed per run of the job
+    """
+    current = ['run%d-seed%d' % (run, seed) for run, seed in enumerate(seeds)]
+    for path in glob.glob(os.path.join(folder, 'run*-seed*')):
+        name = os.path.basename(path)
+        if not any(name.startswith(prefix + '.') or name.startswith(prefix + '-') for prefix in current):
+            os.remove(path)
+
+
+def eventPath(event_folder, run, seed, start=0):
+    """Event file of a run, or of the part of a run resumed at a later step
+
+    Arguments:
+        event_folder {string} -- folder holding the event files
+        run {integer} -- index of the run
+        seed {integer} -- seed of the run
+        start {integer} -- step the part starts at
+
+    Returns:
+        string -- the path, all files of a run match run<run>-seed<seed>*.events
+    """
+    if start == 0:
+        return os.path.join(event_folder, 'run%d-seed%d.events' % (run, seed))
+    return os.path.join(event_folder, 'run%d-seed%d-from%d.events' % (run, seed, start))
+
+
+def resultPath(result_folder, run, seed):
+    """Result file a run streams its statistics to
+
+    Arguments:
+        result_folder {string} -- folder holding the result files of the runs
+        run {integer} -- index of the run
+        seed {integer} -- seed of the run
+
+    Returns:
+        string -- the path
+    """
+    return os.path.join(result_folder, 'run%d-seed%d.bin' % (run, seed))
+
+
+def runSimulation(run, seed, config, checkpoint_every=0, checkpoint_folder=None, event_folder=None,
+                  result_folder=None):
+    """Run a single simulation with its own random stream
+
+    With checkpointing enabled the model is saved every checkpoint_every
+    steps and at the end of the run. If the run's checkpoint already exists
+    the run resumes from it instead of starting over, and gives exactly the
+    statistics of an uninterrupted run.
+
+    With an event folder the run's events are logged to eventPath; a resumed
+    run logs to a new file starting at the checkpoint's step, load the files
+    of a run with eventlog.loadEvents.
+
+    With a result folder the statistics are streamed to the run's result
+    file (resultPath) every config.chunk_rows rows and before every
+    checkpoint, instead of being held in memory until the run ends; a
+    resumed run appends to the file, without the rows written after the
+    checkpoint.
+
+    Arguments:
+        run {integer} -- index of the run
+        seed {integer} -- seed of the run's random number generator
+        config {SimulationConfig} -- settings of the simulation
+        checkpoint_every {integer} -- steps between checkpoints, 0 disables checkpointing
+        checkpoint_folder {string} -- folder holding the checkpoints, one file per run and seed
+        event_folder {string} -- optional folder the events of the run are logged to
+        result_folder {string} -- optional folder the statistics of the run are streamed to
+
+    Returns:
+        tuple -- collected statistics as produced by StatisticsCollector.columns(),
+                 or the path of the run's result file with a result folder
+
+    Raises:
+        ValueError -- if the run's checkpoint was written with other model settings
+    """
+    if result_folder is None:
+        capacity = config.steps * len(config.active_strategies)
+    else:
+        capacity = config.chunk_rows
+    collector = StatisticsCollector(config.active_strategies, capacity=capacity)
+    path = None
+    if checkpoint_every:
+        path = os.path.join(checkpoint_folder, 'run%d-seed%d.npz' % (run, seed))
+    if path is not None and os.path.exists(path):
+        model = checkpoint.load(path, collector=collector)
+        # a run may be resumed to run for more steps, but not with other settings
+        if dict(model.config.modelOptions(), steps=config.steps) != config.modelOptions():
+            model.close()
+            raise ValueError('Checkpoint ' + path + ' was written with other model settings')
+    else:
+        model = EvolutionaryModel(collector=collector, run=run, seed=seed, config=config)
+
+    writer = None
+    if result_folder is not None:
+        # the rows a checkpoint holds come after the rows on file
+        step = int(collector.step[0]) if collector.size else model.schedule.steps
+        writer = reopenResults(resultPath(result_folder, run, seed), config.active_strategies, step)
+        collector.sink = writer
+        collector.chunk_size = config.chunk_rows
+        collector.flush()
+
+    log = None
+    if event_folder is not None:
+        start = model.schedule.steps
+        if start == 0:
+            # starting over, the resumed parts of an earlier attempt are stale
+            for stale in glob.glob(os.path.join(event_folder, 'run%d-seed%d-from*.events' % (run, seed))):
+                os.remove(stale)
+        log = EventLog(eventPath(event_folder, run, seed, start), run=run, start=start)
+        model.eventLog = log
+    try:
+        while model.schedule.steps < config.steps:
+            model.step()
+            if path is not None and (model.schedule.steps % checkpoint_every == 0
+                                     or model.schedule.steps == config.steps):
+                # every event and statistics row before the checkpoint is on
+                # disk before it is written
+                if log is not None:
+                    log.flush()
+                if writer is not None:
+                    collector.flush()
+                checkpoint.save(model, path)
+        if writer is not None:
+            collector.flush()
+    finally:
+        if log is not None:
+            log.close()
+        if writer is not None:
+            writer.close()
+        model.close()
+    if writer is not None:
+        return writer.path
+    return collector.columns()
+
+
+def _runSimulation(args):
+    return runSimulation(*args)
+
+
+def runSimulations(num_runs, config, seeds=None, processes=None, collector=None,
+                   checkpoint_every=0, checkpoint_folder=None, event_folder=None, result_folder=None):
+    """Run independent simulations, in parallel worker processes if requested
+
+    The statistics are merged in run order, so the result only depends on the
+    seeds and not on the number of processes. With a result folder the runs
+    stream their statistics to their own result files as they go, and these
+    are merged chunk by chunk; they are deleted once merged unless they are
+    needed to resume from the checkpoints.
+
+    Arguments:
+        num_runs {integer} -- number of runs
+        config {SimulationConfig} -- settings of the simulations
+        seeds {list} -- optional seed per run, see makeSeeds
+        processes {integer} -- number of worker processes, None uses all cores and 1 runs in this process
+        collector {StatisticsCollector} -- optional collector to merge the statistics into
+        checkpoint_every {integer} -- steps between checkpoints of every run, 0 disables checkpointing
+        checkpoint_folder {string} -- folder holding the checkpoints, see runSimulation
+        event_folder {string} -- optional folder the events of every run are logged to, see runSimulation
+        result_folder {string} -- optional folder the statistics of every run are streamed to, see runSimulation
+
+    Returns:
+        StatisticsCollector -- collector holding the statistics of all runs
+    """
+    if seeds is None:
+        seeds = makeSeeds(num_runs)
+    if len(seeds) != num_runs:
+        raise ValueError('Expected %d seeds, got %d' % (num_runs, len(seeds)))
+    if collector is None:
+        collector = StatisticsCollector(
+            config.active_strategies, capacity=num_runs * config.steps * len(config.active_strategies))
+
+    def merge(result):
+        if result_folder is None:
+            collector.extend(result)
+            return
+        for chunk in ResultReader(result).chunks():
+            collector.extend(chunk)
+        if not checkpoint_every:
+            os.remove(result)
+
+    jobs = [(run, seeds[run], config, checkpoint_every, checkpoint_folder, event_folder, result_folder)
+            for run in range(num_runs)]
+    if processes == 1:
+        for job in jobs:
+            merge(runSimulation(*job))
+        return collector
+
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        # map yields in submission order, i.e. in run order
+        for result in pool.map(_runSimulation, jobs):
+            merge(result)
+    return collector
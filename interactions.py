@@ -0,0 +1,179 @@
+import numpy as np
+
+import strategies
+import eventlog
+
+
+def formEncounters(cells, rng):
+    """Pair up agents that share a cell, for the two-phase step
+
+    The agents of every cell are shuffled and paired off, an odd agent out
+    stays idle. Like in the sequential step, where an agent only interacts
+    if it has at least two cellmates, only cells holding three or more
+    agents form encounters. Every agent takes part in at most one encounter.
+
+    Arguments:
+        cells {numpy.array} -- cell id of each agent
+        rng {numpy.random.Generator} -- random number generator for the shuffles
+
+    Returns:
+        numpy.array -- indices (into cells) of the first agent of each encounter
+        numpy.array -- indices (into cells) of the second agent of each encounter
+    """
+    cells = np.asarray(cells)
+    n = len(cells)
+    if n == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty
+    # group the agents by cell, in random order within a cell
+    order = np.lexsort((rng.random(n), cells))
+    sortedCells = cells[order]
+    starts = np.concatenate([[0], np.flatnonzero(np.diff(sortedCells)) + 1])
+    sizes = np.diff(np.concatenate([starts, [n]]))
+    rank = np.arange(n) - np.repeat(starts, sizes)
+    size = np.repeat(sizes, sizes)
+    first = np.flatnonzero((rank % 2 == 0) & (rank + 1 < size) & (size >= 3))
+    return order[first], order[first + 1]
+
+
+def orientEncounters(state, first, second):
+    """Split encounters into owner/intruder pairs, like EvolutionaryAgent.chooseInteraction
+
+    Only encounters where exactly one of the agents owns property lead to an
+    interaction, the others are dropped.
+
+    Arguments:
+        state {AgentState} -- state of the agents
+        first {numpy.array} -- slots of the first agent of each encounter
+        second {numpy.array} -- slots of the second agent of each encounter
+
+    Returns:
+        numpy.array -- slots of the owners
+        numpy.array -- slots of the intruders
+    """
+    first = np.asarray(first, dtype=np.int64)
+    second = np.asarray(second, dtype=np.int64)
+    firstOwns = state.owner[first] > 0
+    secondOwns = state.owner[second] > 0
+    keep = firstOwns != secondOwns
+    owners = np.where(firstOwns, first, second)[keep]
+    intruders = np.where(firstOwns, second, first)[keep]
+    return owners, intruders
+
+
+def resolveEncounters(model, first, second):
+    """Resolve all encounters formed in a step at once
+
+    The hawk/dove/possessor/trader outcomes are applied with vectorised
+    updates of the model's AgentState, the ToM-ToM trades are negotiated
+    together in lock step. An agent may take part in at most one encounter
+    of the batch, the encounters are then independent of each other.
+
+    Models without an AgentState fall back to EvolutionaryAgent.chooseInteraction
+    for every encounter.
+
+    Arguments:
+        model {EvolutionaryModel} -- model the agents live in
+        first {list} -- slots (agents for the object engine) of the first agent of each encounter
+        second {list} -- slots (agents for the object engine) of the second agent of each encounter
+    """
+    state = model.state
+    if state is None:
+        for a, b in zip(first, second):
+            a.chooseInteraction(b)
+        return
+
+    owners, intruders = orientEncounters(state, first, second)
+    if model.profiler is not None:
+        model.profiler.count('encounters', len(owners))
+    if len(owners) == 0:
+        return
+    participants = np.concatenate([owners, intruders])
+    if len(np.unique(participants)) != len(participants):
+        raise ValueError('An agent takes part in more than one encounter')
+
+    # Snapshot of the participants, to update the running strategy totals at the end
+    codes = state.strategy[participants]
+    wealthBefore = state.wealth[participants]
+    ownerBefore = state.owner[participants]
+
+    kinds = model.interactionTable[state.strategy[owners], state.strategy[intruders]]
+    value = state.owner[owners]
+
+    # Trades only happen if the intruder can afford the estimated buying price
+    estimated_buying_price = value + model.config.property_buy_price_percentage * value
+    affordable = estimated_buying_price < state.wealth[intruders]
+    if model.profiler is not None:
+        model.profiler.count('fights', int(np.count_nonzero(kinds == strategies.HAWK_HAWK)))
+        model.profiler.count('trades', int(np.count_nonzero(np.isin(kinds, strategies.TRADES) & affordable)))
+    log = model.eventLog
+    if log is not None:
+        happens = (kinds != strategies.NO_INTERACTION) & (~np.isin(kinds, strategies.TRADES) | affordable)
+        log.recordMany(eventlog.INTERACTION, kinds[happens], state.uid[owners[happens]],
+                       state.uid[intruders[happens]], value[happens])
+
+    # Hawk owner vs dove intruder: the dove has nothing to lose
+    # Dove owner vs hawk intruder: the hawk takes the property
+    pick = kinds == strategies.DOVE_HAWK
+    o, i = owners[pick], intruders[pick]
+    state.owner[i] = state.owner[o]
+    state.owner[o] = 0
+
+    # Dove vs dove: a random dove retreats
+    pick = kinds == strategies.DOVE_DOVE
+    o, i = owners[pick], intruders[pick]
+    ownerWins = model.np_random.random(len(o)) < 0.5
+    state.owner[i] = np.where(ownerWins, 0, value[pick])
+    state.owner[o] = np.where(ownerWins, value[pick], 0)
+
+    # Hawk vs hawk: a random hawk wins, both pay the fight cost
+    pick = kinds == strategies.HAWK_HAWK
+    o, i = owners[pick], intruders[pick]
+    h = strategies.getFightCosts(value[pick], model.np_random, model.config.game_type)
+    ownerWins = model.np_random.random(len(o)) < 0.5
+    state.wealth[o] -= h
+    state.wealth[i] -= h
+    state.owner[i] = np.where(ownerWins, 0, value[pick])
+    state.owner[o] = np.where(ownerWins, value[pick], 0)
+    fighters = np.concatenate([o, i])
+    dead = fighters[state.wealth[fighters] < 0]
+    if log is not None:
+        log.recordMany(eventlog.FIGHT, strategies.HAWK_HAWK, state.uid[np.where(ownerWins, o, i)],
+                       state.uid[np.where(ownerWins, i, o)], h)
+
+    # Trader vs trader: the price is halfway the estimated buying price
+    pick = (kinds == strategies.TRADE) & affordable
+    o, i = owners[pick], intruders[pick]
+    x = value[pick] + np.round((estimated_buying_price[pick] - value[pick]) / 2)
+    state.owner[o] = 0
+    state.wealth[o] += x
+    state.owner[i] = x
+    state.wealth[i] -= x
+    if log is not None:
+        log.recordMany(eventlog.TRADE, strategies.TRADE, state.uid[o], state.uid[i], x)
+
+    # Trader without ToM vs trader with ToM, either way round
+    for kind, ownerShare, intruderShare in ((strategies.TRADER_TOM, 1, 3),
+                                            (strategies.TOM_TRADER, 3, 1)):
+        pick = (kinds == kind) & affordable
+        o, i = owners[pick], intruders[pick]
+        v = value[pick]
+        x = np.round((estimated_buying_price[pick] - v) / 4)
+        state.owner[o] = 0
+        state.wealth[o] += v + ownerShare * x
+        state.owner[i] = v + intruderShare * x
+        state.wealth[i] -= v + intruderShare * x
+        if log is not None:
+            log.recordMany(eventlog.TRADE, kind, state.uid[o], state.uid[i], v + intruderShare * x)
+
+    model.aggregates.changeMany(codes, state.wealth[participants] - wealthBefore,
+                                state.owner[participants] - ownerBefore)
+
+    # ToM vs ToM: negotiated in lock step, the agents update the totals themselves
+    pick = (kinds == strategies.TOM_TOM) & affordable
+    strategies.emulateToMToMStrategies(state.view(owners[pick]), state.view(intruders[pick]),
+                                       model.config.max_negotiation_rounds)
+
+    # Die if wealth is negative
+    for agent in state.view(dead):
+        agent.die()
@@ -1,78 +1,356 @@
 from mesa import Model
 from mesa.time import RandomActivation
-from mesa.space import MultiGrid
+from spatial import MooreMultiGrid, TorusGrid
 from mesa.datacollection import DataCollector
 from mesa.visualization.modules import CanvasGrid
 from mesa.visualization.ModularVisualization import ModularServer
-from agent import EvolutionaryAgent
+from agent import EvolutionaryAgent, ArrayAgent
+from agentstate import AgentState
+from population import StrategyAggregates, StrategyIndex
 import strategies
-import random
-import configparser
+import interactions
+import eventlog
 import math
-
-# Load the configuration file
-CONFIG = configparser.ConfigParser()
-CONFIG.read("./config/config.ini")
-CONFIG_MODEL = CONFIG['model']
-WEALTH_TYPE = CONFIG_MODEL['initial_wealth_type']
-FIXED_WEALTH_VALUE = int(CONFIG_MODEL['fixed_wealth_value'])
-strategyList = CONFIG_MODEL['active_strategies'].split(',')
+import numpy as np
+from simconfig import SimulationConfig
 
 
 # Main model which controls the agents
 class EvolutionaryModel(Model):
     """A model with some number of agents."""
 
-    def __init__(self, N, width, height):
+    def __init__(self, N=None, width=None, height=None, collector=None, run=0, seed=None, engine='object',
+                 space='multigrid', activation='sequential', tom='lazy', check_aggregates=False,
+                 populate=True, config=None, profiler=None, event_log=None):
         """Contructor function
 
         Arguments:
-            N {integer} -- Number of initial agents in the model
-            width {integer} -- Model grid width
-            height {integer} -- Model grid height
+            N {integer} -- Number of initial agents in the model (config.total_agents if None)
+            width {integer} -- Model grid width (config.grid_width if None)
+            height {integer} -- Model grid height (config.grid_height if None)
+            collector {StatisticsCollector} -- optional collector that records statistics after each step
+            run {integer} -- index of the run, used to label the collected statistics
+            seed {integer} -- seed of the model's random number generator (picked up by mesa's Model)
+            engine {string} -- agent storage, 'object' (plain agents) or 'array' (struct-of-arrays AgentState)
+            space {string} -- grid, 'multigrid' (Mesa's MultiGrid) or 'torus' (neighbour table and occupancy index)
+            activation {string} -- 'sequential' (Mesa's random activation) or 'two-phase' (vectorised, see step)
+            tom {string} -- construction of the agents' ToM state:
+                'lazy' (on first use; the ToM order is still drawn at birth, so runs match 'eager'),
+                'eager' (at birth, as in older versions) or
+                'tom-only' (lazy, and only ToM traders draw an order; changes the random stream)
+            check_aggregates {boolean} -- debug mode, cross-check the running strategy totals against a recount after each step
+            populate {boolean} -- create the initial population, False leaves the model empty (see checkpoint.load)
+            config {SimulationConfig} -- settings of the simulation, read from ./config/config.ini if None
+            profiler {StepProfiler} -- optional per-phase timers and counters of the steps, see profiling.py
+            event_log {EventLog} -- optional log of the interactions, trades, fights, births and deaths, see eventlog.py
         """
+        if config is None:
+            config = SimulationConfig.fromFile()
+        self.config = config
+        if N is None:
+            N = config.total_agents
+        if width is None:
+            width = config.grid_width
+        if height is None:
+            height = config.grid_height
         self.num_agents = N
-        self.grid = MultiGrid(width, height, True)  # True -> toroid
+        self.collector = collector
+        self.profiler = profiler
+        self.eventLog = event_log
+        self.run = run
+        self.engine = engine
+        self.space = space
+        if space == 'multigrid':
+            self.grid = MooreMultiGrid(width, height, True)  # True -> toroid
+        elif space == 'torus':
+            self.grid = TorusGrid(width, height)
+        else:
+            raise ValueError('Unknown space: ' + str(space))
+        if activation not in ('sequential', 'two-phase'):
+            raise ValueError('Unknown activation: ' + str(activation))
+        self.activation = activation
+        if tom not in ('lazy', 'eager', 'tom-only'):
+            raise ValueError('Unknown ToM construction: ' + str(tom))
+        self.tom = tom
         self.schedule = RandomActivation(self)
         self.latest_id = N-1
         self.running = True
+        # Generator for vectorised draws, the scalar draws use self.random
+        self.np_random = np.random.default_rng(seed)
+
+        # Strategies are identified by their index in the active strategy list
+        self.strategyList = list(config.active_strategies)
+        self.strategyCode = {strategy: i for i, strategy in enumerate(self.strategyList)}
+        self.interactionTable = strategies.interactionTable(self.strategyList)
+        # Running per-strategy totals, updated in place whenever agents change
+        self.aggregates = StrategyAggregates(len(self.strategyList))
+        # Living agents of each strategy, used by natural selection
+        self.index = StrategyIndex(len(self.strategyList))
+        self.check_aggregates = check_aggregates
+        if engine == 'object':
+            self.state = None
+            self.agentClass = EvolutionaryAgent
+        elif engine == 'array':
+            self.state = AgentState(len(self.strategyList), capacity=N)
+            self.agentClass = ArrayAgent
+        else:
+            raise ValueError('Unknown engine: ' + str(engine))
 
+        if populate:
+            self.populate()
+
+    def populate(self):
+        """Create the initial population and hand out the initial property
+        """
         # Create agents based on population percentage from config file
         AGENT_ID = 0
-        for strategy in strategies.strategyList:
-            percent_agent = float(
-                CONFIG_MODEL[strategy + '_population_percent'])
+        config = self.config
+        for strategy in self.strategyList:
+            percent_agent = config.populationPercent(strategy)
             num_strategy_agents = math.floor(percent_agent * self.num_agents)
 
             for i in range(num_strategy_agents):
                 evolutionaryStrategy = strategy
                 # Initial Wealth is set from config - to a random number OR fixed amount
-                if WEALTH_TYPE == 'fixed':
-                    initialWealth = FIXED_WEALTH_VALUE
+                if config.initial_wealth_type == 'fixed':
+                    initialWealth = config.fixed_wealth_value
                 else:
-                    initialWealth = random.randrange(int(CONFIG_MODEL['initial_wealth_range_lower']), int(
-                        CONFIG_MODEL['initial_wealth_range_upper']))
-                a = EvolutionaryAgent(
+                    initialWealth = self.random.randrange(config.initial_wealth_range_lower,
+                                                          config.initial_wealth_range_upper)
+                a = self.agentClass(
                     AGENT_ID, self, evolutionaryStrategy, initialWealth, 0)
-                self.schedule.add(a)
                 AGENT_ID += 1
 
                 # Add the agent to a random grid cell
                 x = self.random.randrange(self.grid.width)
                 y = self.random.randrange(self.grid.height)
-                self.grid.place_agent(a, (x, y))
+                self.addAgent(a, (x, y))
+
+        # The rounded population percentages need not add up to N, continue
+        # numbering newborns after the last agent actually created
+        self.latest_id = AGENT_ID - 1
 
         # Make percentage of agents property owners
         num_owners = round(
-            (int(CONFIG_MODEL['percentage_of_owners']) / 100) * len(self.schedule.agents))
-        owner_agents = random.sample(self.schedule.agents, num_owners)
+            (config.percentage_of_owners / 100) * len(self.schedule.agents))
+        owner_agents = self.random.sample(self.schedule.agents, num_owners)
         # Assign property to the agents that are chosen to be owners
         for agent in owner_agents:
             agent.assignPropertyToAgent()
 
     def step(self):
         """Steps to take at each tick of the model
+
+        With sequential activation (the default) agents are activated one at
+        a time in random order; each moves and then immediately interacts
+        with whoever is on its new cell at that moment, including agents that
+        have not moved yet, and an agent can be drawn into several
+        interactions in one step.
+
+        With two-phase activation all agents first move at once (moveAll),
+        then encounters are formed per cell on the final positions
+        (interactAll). Each agent then takes part in at most one encounter per
+        step, and the random draws come from the model's NumPy generator, so
+        trajectories differ from the sequential mode for the same seed.
+
+        With a profiler attached the phases are timed, see profiling.StepProfiler.
         """
-        self.schedule.step()
+        profiler = self.profiler
+        if profiler is not None:
+            profiler.startStep()
+        if self.eventLog is not None:
+            self.eventLog.step = self.schedule.steps
+        if self.activation == 'sequential':
+            if profiler is None:
+                self.schedule.step()
+            else:
+                self.profiledSchedule(profiler)
+        else:
+            if profiler is not None:
+                start = profiler.now()
+            agents, cells = self.moveAll()
+            if profiler is not None:
+                start = profiler.stop('move', start)
+            self.interactAll(agents, cells)
+            if profiler is not None:
+                profiler.stop('interact', start)
+            self.schedule.steps += 1
+            self.schedule.time += 1
         # Natural selection
         strategies.naturalSelection(self)
+        if self.check_aggregates:
+            self.aggregates.check(*self.recountStrategyTotals())
+        # Statistics
+        if self.collector is not None:
+            if profiler is not None:
+                start = profiler.now()
+            self.collector.collect(self)
+            if profiler is not None:
+                profiler.stop('collect', start)
+        if profiler is not None:
+            profiler.endStep(self.schedule.steps)
+
+    def profiledSchedule(self, profiler):
+        """Sequential activation of the agents, like the schedule's step, timing every move and interaction
+
+        Arguments:
+            profiler {StepProfiler} -- profiler of the step
+        """
+        loopStart = profiler.now()
+        for agent in self.schedule.agent_buffer(shuffled=True):
+            start = profiler.now()
+            agent.move()
+            start = profiler.stop('move', start, span=False)
+            agent.interact()
+            profiler.stop('interact', start, span=False)
+        if profiler.spans is not None:
+            profiler.spans.append(('move+interact', loopStart, profiler.now() - loopStart))
+        self.schedule.steps += 1
+        self.schedule.time += 1
+
+    def moveAll(self):
+        """Movement phase of the two-phase step: every agent moves to a random neighbouring cell at once
+
+        Returns:
+            list -- all agents, in schedule order
+            numpy.array -- new cell id (x * height + y) of each agent
+        """
+        agents = self.schedule.agents
+        if self.state is not None:
+            slots = np.fromiter((agent.slot for agent in agents), dtype=np.int64, count=len(agents))
+            x = self.state.x[slots].astype(np.int64)
+            y = self.state.y[slots].astype(np.int64)
+        else:
+            pos = np.array([agent.pos for agent in agents], dtype=np.int64).reshape(-1, 2)
+            x, y = pos[:, 0], pos[:, 1]
+        cells = x * self.grid.height + y
+
+        # one uniformly drawn Moore offset per agent, wrapped around the torus by the table
+        neighbours, degree = self.grid.neighbourTable()
+        k = (self.np_random.random(len(cells)) * degree[cells]).astype(np.int64)
+        cells = neighbours[cells, k]
+        self.grid.relocateAll(agents, cells)
+        return agents, cells
+
+    def interactAll(self, agents, cells):
+        """Interaction phase of the two-phase step: pair up agents per cell and resolve all encounters
+
+        Arguments:
+            agents {list} -- all agents, as returned by moveAll
+            cells {numpy.array} -- cell id of each agent, as returned by moveAll
+        """
+        first, second = interactions.formEncounters(cells, self.np_random)
+        if self.state is not None:
+            slots = np.fromiter((agent.slot for agent in agents), dtype=np.int64, count=len(agents))
+            interactions.resolveEncounters(self, slots[first], slots[second])
+        else:
+            interactions.resolveEncounters(self, [agents[i] for i in first],
+                                           [agents[i] for i in second])
+
+    def addAgent(self, agent, pos):
+        """Place a new agent on the grid and in the schedule
+
+        Arguments:
+            agent {EvolutionaryAgent} -- agent to add
+            pos {tuple} -- (x, y) cell to place the agent on
+        """
+        self.addAgents([agent], [pos])
+
+    def addAgents(self, agents, positions):
+        """Place a batch of new agents on the grid and in the schedule
+
+        Arguments:
+            agents {list} -- agents to add, in order of their unique id
+            positions {list} -- (x, y) cell of each agent
+        """
+        for agent, pos in zip(agents, positions):
+            self.grid.place_agent(agent, pos)
+            self.schedule.add(agent)
+            self.index.add(agent)
+            self.aggregates.add(agent.strategyCode, agent.wealth, agent.owner)
+            agent.alive = True
+
+    def removeAgents(self, agents):
+        """Take a batch of dead agents off the grid and out of the schedule
+
+        Arguments:
+            agents {list} -- agents to remove
+        """
+        if self.profiler is not None:
+            self.profiler.count('deaths', len(agents))
+        log = self.eventLog
+        for agent in agents:
+            agent.saySomething('I am a %s%d and I am dead', agent.strategy, agent.unique_id)
+            if log is not None:
+                log.record(eventlog.DEATH, -1, agent.unique_id, -1, agent.getTotalWealth())
+            self.grid._remove_agent(agent.pos, agent)
+            self.schedule.remove(agent)
+            self.index.remove(agent)
+            self.aggregates.remove(agent.strategyCode, agent.wealth, agent.owner)
+            agent.alive = False
+            agent.releaseToM()
+            if self.state is not None:
+                self.state.release(agent.slot)
+
+    def close(self):
+        """Give the ToM state of the living agents back to the belief pool
+
+        The belief pool is shared by all the models of a process, so a model
+        that is done with must be closed or the slots and rows of its living
+        agents are never recycled. The model must not be stepped afterwards;
+        closing it again does nothing.
+        """
+        for agent in self.schedule.agents:
+            agent.releaseToM()
+        self.running = False
+
+    def strategyTotals(self):
+        """Population and total wealth of each strategy, read from the running aggregates
+
+        Returns:
+            list -- number of agents per strategy code
+            list -- total wealth (wealth + property) per strategy code
+        """
+        return self.aggregates.totals()
+
+    def recountStrategyTotals(self):
+        """Population and total wealth of each strategy, recounted from all agents
+
+        Returns:
+            list -- number of agents per strategy code
+            list -- total wealth (wealth + property) per strategy code
+        """
+        if self.state is not None:
+            return self.state.strategyTotals()
+        population = [0] * len(self.strategyList)
+        wealth = [0] * len(self.strategyList)
+        for agent in self.schedule.agents:
+            code = self.strategyCode[agent.strategy]
+            population[code] += 1
+            wealth[code] += agent.wealth + agent.owner
+        return population, wealth
+
+    def strategyAgents(self, strategy):
+        """Living agents using a strategy, in schedule order
+
+        Arguments:
+            strategy {string} -- name of the strategy
+
+        Returns:
+            list -- agents using the strategy
+        """
+        return self.index.agents(self.strategyCode[strategy])
+
+    def poorestAgents(self, strategy, k):
+        """The k agents of a strategy with the least total wealth
+
+        Arguments:
+            strategy {string} -- name of the strategy
+            k {integer} -- number of agents
+
+        Returns:
+            list -- agents ordered from poorest to richest
+        """
+        if self.state is not None:
+            return self.state.view(self.state.poorest(self.strategyCode[strategy], k))
+        return self.index.poorest(self.strategyCode[strategy], k)
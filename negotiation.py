@@ -0,0 +1,220 @@
+import time
+
+import numpy as np
+
+import ToM
+
+
+def _batchable(agent, n_deltas, n_contexts):
+    """Whether an agent can take part in a batched negotiation"""
+    return (type(agent) in (ToM.ToM0, ToM.ToM1)
+            and agent.n_deltas == n_deltas and agent.n_contexts == n_contexts)
+
+
+def bestResponses(offerSeller, offerBuyer, direction, p, possibleDeltas):
+    """Best actions of zero order agents, one per row, see ToM0.__call__
+
+    Arguments:
+        offerSeller {numpy.array} -- offer made by the seller in the previous round, per row
+        offerBuyer {numpy.array} -- offer made by the buyer in the previous round, per row
+        direction {-1 or 1} -- point of view shared by all rows
+        p {numpy.array} -- (rows, deltas) probability distributions of the opponents' deltas
+        possibleDeltas {numpy.array} -- the delta template
+
+    Returns:
+        numpy.array -- index of the delta maximising the expected value, per row
+    """
+    sellerOffers = offerSeller[:, None] - possibleDeltas
+    buyerOffers = offerBuyer[:, None] + possibleDeltas
+    # V of every row, penalised where the seller asks more than the buyer offers
+    v = np.where(sellerOffers[:, :, None] > buyerOffers[:, None, :],
+                 ToM.PENALTY, direction * buyerOffers[:, None, :])
+    if direction < 0:
+        v = v.transpose(0, 2, 1)
+    # U of every row
+    u = np.matmul(v, p[:, :, None])[:, :, 0]
+    return np.argmax(u, axis=1)
+
+
+def decide(direction, orders, offerSeller, offerBuyer, p, possibleDeltas):
+    """Offers of the ToM0/ToM1 agents on one side of the trades, see ToM0.__call__ and ToM1.__call__
+
+    Arguments:
+        direction {-1 or 1} -- direction of the agents (1 for the sellers, -1 for the buyers)
+        orders {numpy.array} -- theory of mind order of each agent (0 or 1)
+        offerSeller {numpy.array} -- offer made by the seller in the previous round, per agent
+        offerBuyer {numpy.array} -- offer made by the buyer in the previous round, per agent
+        p {numpy.array} -- (agents, deltas) normalised beliefs of each agent in the current context
+        possibleDeltas {numpy.array} -- the delta template
+
+    Returns:
+        numpy.array -- offer made by each agent
+        numpy.array -- index of the delta bin used by each agent
+    """
+    actions = np.empty(len(orders), dtype=np.int64)
+
+    # Zero order decisions: the ToM0 agents themselves and the ToM0 models
+    # ToM1 agents hold of their opponents, which take the opposite direction
+    modelDirection = np.where(orders == 0, direction, -direction)
+    for e in (1, -1):
+        rows = np.flatnonzero(modelDirection == e)
+        if len(rows):
+            actions[rows] = bestResponses(offerSeller[rows], offerBuyer[rows], e, p[rows], possibleDeltas)
+
+    # First order decisions: best offer against the predicted opponent offer
+    rows = np.flatnonzero(orders == 1)
+    if len(rows):
+        e = -direction
+        predicted = (offerSeller[rows] if e > 0 else offerBuyer[rows]) - e * possibleDeltas[actions[rows]]
+        if direction > 0:
+            sellerOffers = possibleDeltas - offerSeller[rows, None]
+            buyerOffers = predicted[:, None]
+        else:
+            buyerOffers = possibleDeltas + offerBuyer[rows, None]
+            sellerOffers = predicted[:, None]
+        values = np.where(sellerOffers > buyerOffers, ToM.PENALTY,
+                          np.broadcast_to(direction * buyerOffers, (len(rows), len(possibleDeltas))))
+        actions[rows] = np.argmax(values, axis=1)
+
+    offers = (offerSeller if direction > 0 else offerBuyer) - direction * possibleDeltas[actions]
+    return offers, actions
+
+
+def negotiate(agents, opponents, maxRounds=None):
+    """Play many trades at once, in lock step, like agents[k].play(opponents[k]) for every k
+
+    The beliefs of all ToM0/ToM1 agents are gathered from the belief pool
+    into (trades, contexts, deltas) tensors, every round the decisions of all
+    trades that are still running are evaluated together and finished trades
+    are masked out. The agents learn and the prices come out exactly as with
+    ToMAgent.play, including the round budget.
+    Trades involving other kinds of ToM agents are played one by one.
+
+    When the negotiations are recorded (see ToM.recordNegotiations) every
+    batched trade is recorded with an equal share of the batch's time.
+
+    The trades must be disjoint (no ToM agent in more than one trade) and
+    the agents must use the default context function.
+
+    Arguments:
+        agents {list} -- ToM agent starting each trade
+        opponents {list} -- ToM agent it trades with
+        maxRounds {integer} -- round budget of every trade (ToM.MAX_ROUNDS if None)
+
+    Returns:
+        list -- concluded price of each trade (None if the trading was not successfull)
+
+    Raises:
+        ValueError -- if a ToM agent takes part in more than one trade
+    """
+    n = len(agents)
+    if len({id(agent) for agent in agents} | {id(agent) for agent in opponents}) != 2 * n:
+        raise ValueError('A ToM agent takes part in more than one trade')
+    prices = [None] * n
+    if n == 0:
+        return prices
+
+    n_deltas, n_contexts = agents[0].n_deltas, agents[0].n_contexts
+    sellers, buyers, batch = [], [], []
+    for k, (agent, opponent) in enumerate(zip(agents, opponents)):
+        if not (_batchable(agent, n_deltas, n_contexts) and _batchable(opponent, n_deltas, n_contexts)):
+            prices[k] = agent.play(opponent, maxRounds)
+            continue
+        # the agent owning property is the seller and handles the trade
+        agent.setDirection(1 if agent.outer.owner > 0 else -1, opponent)
+        opponent.setDirection(-1 * agent.direction, agent)
+        seller, buyer = (agent, opponent) if agent.direction > 0 else (opponent, agent)
+        sellers.append(seller)
+        buyers.append(buyer)
+        batch.append(k)
+    if not batch:
+        return prices
+    if maxRounds is None:
+        maxRounds = ToM.MAX_ROUNDS
+    start = time.perf_counter()
+
+    possibleDeltas = sellers[0].possibleDeltas
+    sellerOrders = np.array([type(agent) is ToM.ToM1 for agent in sellers], dtype=np.int64)
+    buyerOrders = np.array([type(agent) is ToM.ToM1 for agent in buyers], dtype=np.int64)
+    # gather the belief tables from the pool
+    pool = ToM.beliefPool(n_deltas, n_contexts)
+    sellerSlots = np.array([agent.baseBeliefs().slot for agent in sellers], dtype=np.int64)
+    buyerSlots = np.array([agent.baseBeliefs().slot for agent in buyers], dtype=np.int64)
+    sellerRows, buyerRows = pool.rowSlot[sellerSlots], pool.rowSlot[buyerSlots]
+    sellerCounts, sellerTotals = pool.counts[sellerRows], pool.totals[sellerRows]
+    buyerCounts, buyerTotals = pool.counts[buyerRows], pool.totals[buyerRows]
+    seen = np.zeros([len(sellers), n_contexts], dtype=bool)
+
+    m = len(batch)
+    sellerOffer = np.ones(m)
+    buyerOffer = np.zeros(m)
+    rounds = np.zeros(m, dtype=np.int64)
+    failed = np.zeros(m, dtype=bool)
+    outOfRounds = np.zeros(m, dtype=bool)
+    active = np.arange(m)
+    while len(active):
+        exhausted = rounds[active] == maxRounds
+        outOfRounds[active[exhausted]] = True
+        active = active[~exhausted]
+        if not len(active):
+            break
+        offerSeller, offerBuyer = sellerOffer[active], buyerOffer[active]
+
+        # Get binned context
+        context = np.floor((offerSeller - offerBuyer) * (n_contexts - 1)).astype(np.int64)
+
+        # Compute next offers for agents
+        buyerNew, deltaBuyer = decide(
+            -1, buyerOrders[active], offerSeller, offerBuyer,
+            buyerCounts[active, context] / buyerTotals[active, context][:, None], possibleDeltas)
+        sellerNew, deltaSeller = decide(
+            1, sellerOrders[active], offerSeller, offerBuyer,
+            sellerCounts[active, context] / sellerTotals[active, context][:, None], possibleDeltas)
+
+        invalid = (offerBuyer >= 1) | (offerBuyer < 0) | (offerSeller <= 0) | (offerSeller > 1)
+        failed[active[invalid]] = True
+        valid = ~invalid
+        rows, context = active[valid], context[valid]
+        deltaBuyer, deltaSeller = deltaBuyer[valid], deltaSeller[valid]
+
+        # Learn, see ToM0.learn: the zero order beliefs of a seller (and of
+        # the model a buyer ToM1 keeps of its seller) observe the buyer delta
+        observed = np.where(sellerOrders[rows] == 0, deltaBuyer, n_deltas - 1 - deltaSeller)
+        sellerCounts[rows, context, observed] += 1
+        sellerTotals[rows, context] += 1
+        seen[rows, context] = True
+        observed = np.where(buyerOrders[rows] == 0, n_deltas - 1 - deltaSeller, deltaBuyer)
+        buyerCounts[rows, context, observed] += 1
+        buyerTotals[rows, context] += 1
+        rounds[rows] += 1
+
+        # Update offer values
+        buyerOffer[rows] = buyerNew[valid]
+        sellerOffer[rows] = sellerNew[valid]
+        active = rows[sellerOffer[rows] > buyerOffer[rows]]
+
+    # scatter the observed rows back, both sides of a trade observe the same contexts
+    for j, context in zip(*np.nonzero(seen)):
+        for slot, counts, totals in ((sellerSlots[j], sellerCounts, sellerTotals),
+                                     (buyerSlots[j], buyerCounts, buyerTotals)):
+            row = pool.materialise(slot, context)
+            pool.counts[row] = counts[j, context]
+            pool.totals[row] = totals[j, context]
+            pool.clean[row] = False
+
+    stats = ToM.negotiationStats
+    seconds = (time.perf_counter() - start) / m
+    for j, k in enumerate(batch):
+        if failed[j]:
+            outcome = ToM.INVALID
+        elif outOfRounds[j]:
+            outcome = ToM.OUT_OF_ROUNDS
+        # No exchange if the buyer's offer is below the seller's minimum price
+        elif buyerOffer[j] * buyers[j].outer.wealth <= sellers[j].outer.owner:
+            outcome = ToM.REJECTED
+        else:
+            outcome = ToM.AGREED
+            prices[k] = buyerOffer[j]
+        if stats is not None:
+            stats.record(sellers[j].order, buyers[j].order, int(rounds[j]), seconds, outcome)
+    return prices
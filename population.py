@@ -0,0 +1,152 @@
+import heapq
+import numpy as np
+
+
+# Running per-strategy totals of the living agents
+class StrategyAggregates:
+    """Count, total wealth and total property of every strategy, kept up to date in place."""
+
+    def __init__(self, n_strategies):
+        """StrategyAggregates constructor
+
+        Arguments:
+            n_strategies {integer} -- number of strategy codes in use
+        """
+        self.count = [0] * n_strategies
+        self.wealth = [0] * n_strategies
+        self.property = [0] * n_strategies
+
+    def add(self, code, wealth, owner):
+        """Register a living agent
+
+        Arguments:
+            code {integer} -- strategy code of the agent
+            wealth {number} -- money owned by the agent
+            owner {number} -- property value owned by the agent
+        """
+        self.count[code] += 1
+        self.wealth[code] += wealth
+        self.property[code] += owner
+
+    def remove(self, code, wealth, owner):
+        """Unregister a dead agent
+
+        Arguments:
+            code {integer} -- strategy code of the agent
+            wealth {number} -- money owned by the agent
+            owner {number} -- property value owned by the agent
+        """
+        self.count[code] -= 1
+        self.wealth[code] -= wealth
+        self.property[code] -= owner
+
+    def change(self, code, dwealth, downer):
+        """Account for a change of a living agent's resources
+
+        Arguments:
+            code {integer} -- strategy code of the agent
+            dwealth {number} -- change of the agent's money
+            downer {number} -- change of the agent's property value
+        """
+        self.wealth[code] += dwealth
+        self.property[code] += downer
+
+    def changeMany(self, codes, dwealth, downer):
+        """Account for changes of the resources of many living agents
+
+        Arguments:
+            codes {numpy.array} -- strategy code of each agent
+            dwealth {numpy.array} -- change of each agent's money
+            downer {numpy.array} -- change of each agent's property value
+        """
+        n = len(self.count)
+        dwealth = np.bincount(codes, weights=dwealth, minlength=n)
+        downer = np.bincount(codes, weights=downer, minlength=n)
+        for code in range(n):
+            self.wealth[code] += dwealth[code].item()
+            self.property[code] += downer[code].item()
+
+    def totals(self):
+        """Population and total wealth of each strategy
+
+        Returns:
+            list -- number of agents per strategy code
+            list -- total wealth (wealth + property) per strategy code
+        """
+        return list(self.count), [w + p for w, p in zip(self.wealth, self.property)]
+
+    def check(self, population, wealth, tolerance=1e-9):
+        """Cross-check the running totals against a full recount
+
+        Arguments:
+            population {list} -- recounted number of agents per strategy code
+            wealth {list} -- recounted total wealth per strategy code
+            tolerance {float} -- relative tolerance for the accumulated rounding of the wealth totals
+
+        Raises:
+            AssertionError -- if the running totals drifted from the recount
+        """
+        count, total = self.totals()
+        for code in range(len(count)):
+            if count[code] != population[code]:
+                raise AssertionError('Strategy %d: counted %d agents, recount gives %d'
+                                     % (code, count[code], population[code]))
+            if abs(total[code] - wealth[code]) > tolerance * max(1.0, abs(wealth[code])):
+                raise AssertionError('Strategy %d: total wealth %r, recount gives %r'
+                                     % (code, total[code], wealth[code]))
+
+
+# Index from strategy to its living agents
+class StrategyIndex:
+    """Living agents of every strategy code, in the order they were added (schedule order)."""
+
+    def __init__(self, n_strategies):
+        """StrategyIndex constructor
+
+        Arguments:
+            n_strategies {integer} -- number of strategy codes in use
+        """
+        self.buckets = [{} for _ in range(n_strategies)]
+
+    def add(self, agent):
+        """Add a living agent to its strategy's bucket
+
+        Arguments:
+            agent {EvolutionaryAgent} -- agent to add
+        """
+        self.buckets[agent.strategyCode][agent.unique_id] = agent
+
+    def remove(self, agent):
+        """Remove a dead agent from its strategy's bucket
+
+        Arguments:
+            agent {EvolutionaryAgent} -- agent to remove
+        """
+        del self.buckets[agent.strategyCode][agent.unique_id]
+
+    def agents(self, code):
+        """Living agents of a strategy
+
+        Arguments:
+            code {integer} -- strategy code
+
+        Returns:
+            list -- agents in schedule order
+        """
+        return list(self.buckets[code].values())
+
+    def poorest(self, code, k):
+        """The k agents of a strategy with the least total wealth
+
+        Uses a partial heap selection, ties are kept in schedule order just
+        like a stable full sort would.
+
+        Arguments:
+            code {integer} -- strategy code
+            k {integer} -- number of agents to select
+
+        Returns:
+            list -- agents ordered from poorest to richest
+        """
+        return heapq.nsmallest(k, self.buckets[code].values(),
+                               key=lambda agent: agent.wealth + agent.owner)
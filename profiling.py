@@ -0,0 +1,199 @@
+import argparse
+import json
+import time
+
+import numpy as np
+import pandas as pd
+
+# Timed phases of a step. They don't overlap: interact excludes the
+# negotiations of the ToM traders, selection is split in kill and replicate
+PHASES = ('move', 'interact', 'negotiate', 'kill', 'replicate', 'collect')
+
+# Events counted per step:
+#   encounters -- owner/intruder encounters (one agent owns property, the other doesn't)
+#   fights -- hawk vs hawk encounters
+#   trades -- trades between traders who can afford the price, negotiated ones included whether they conclude or not
+#   births -- offspring of natural selection
+#   deaths -- agents killed in fights or by natural selection
+COUNTERS = ('encounters', 'fights', 'trades', 'births', 'deaths')
+
+
+# Opt-in instrumentation of EvolutionaryModel.step
+class StepProfiler:
+    """Seconds spent per phase and event counts, per step of a model.
+
+    Attach it to a model (EvolutionaryModel(profiler=...) or by setting
+    model.profiler) before stepping. Without a profiler the model only pays
+    a None check per phase, the agents' sequential loop is the plain Mesa
+    one. With a profiler every phase is timed with perf_counter and the
+    contiguous ones (a step, the sequential agent loop, the two-phase move
+    and interact, kill, replicate and collect) are also kept as spans for a
+    Chrome trace.
+    """
+
+    def __init__(self, trace=True):
+        """StepProfiler constructor
+
+        Arguments:
+            trace {boolean} -- keep the spans for toChromeTrace
+        """
+        self.steps = []
+        self.seconds = {phase: [] for phase in PHASES}
+        self.counts = {name: [] for name in COUNTERS}
+        # (name, start, duration) of every span, None when not tracing
+        self.spans = [] if trace else None
+        self._seconds = dict.fromkeys(PHASES, 0.0)
+        self._counts = dict.fromkeys(COUNTERS, 0)
+        self._stepStart = None
+        self._origin = time.perf_counter()
+
+    @staticmethod
+    def now():
+        """Start of a timed section, see stop
+
+        Returns:
+            float -- perf_counter seconds
+        """
+        return time.perf_counter()
+
+    def stop(self, phase, start, span=True):
+        """Add the time since start to a phase of the current step
+
+        Arguments:
+            phase {string} -- one of PHASES
+            start {float} -- start of the section, from now
+            span {boolean} -- also keep the section as a span of the trace
+
+        Returns:
+            float -- end of the section, can be used as the start of the next one
+        """
+        end = time.perf_counter()
+        self._seconds[phase] += end - start
+        if span and self.spans is not None:
+            self.spans.append((phase, start, end - start))
+        return end
+
+    def count(self, name, n=1):
+        """Count events of the current step
+
+        Arguments:
+            name {string} -- one of COUNTERS
+            n {integer} -- number of events
+        """
+        self._counts[name] += n
+
+    def startStep(self):
+        """Start timing a step
+        """
+        self._stepStart = time.perf_counter()
+
+    def endStep(self, step):
+        """Close the current step and record its timings and counts
+
+        Arguments:
+            step {integer} -- step number (the model's schedule.steps after the step)
+        """
+        end = time.perf_counter()
+        if self.spans is not None and self._stepStart is not None:
+            self.spans.append(('step %d' % step, self._stepStart, end - self._stepStart))
+        self.steps.append(step)
+        # the negotiations run inside the interaction phase, report them apart
+        self._seconds['interact'] -= self._seconds['negotiate']
+        for phase in PHASES:
+            self.seconds[phase].append(self._seconds[phase])
+            self._seconds[phase] = 0.0
+        for name in COUNTERS:
+            self.counts[name].append(self._counts[name])
+            self._counts[name] = 0
+        self._stepStart = None
+
+    def toDataFrame(self):
+        """Per-step table of the timings and counts
+
+        Returns:
+            pandas.DataFrame -- step, seconds of every phase ('<phase>_seconds') and every count
+        """
+        data = {'step': np.array(self.steps, dtype=np.int64)}
+        for phase in PHASES:
+            data[phase + '_seconds'] = np.array(self.seconds[phase])
+        for name in COUNTERS:
+            data[name] = np.array(self.counts[name], dtype=np.int64)
+        return pd.DataFrame(data)
+
+    def toCSV(self, path):
+        """Write the per-step table to a csv file
+
+        Arguments:
+            path {string} -- csv file
+        """
+        self.toDataFrame().to_csv(path, index=False)
+
+    def toChromeTrace(self, path, pid=0):
+        """Write the spans and per-step counts as a Chrome trace (chrome://tracing, Perfetto)
+
+        Arguments:
+            path {string} -- JSON file
+            pid {integer} -- process id shown in the trace, e.g. the run
+        """
+        events = []
+        for name, start, duration in self.spans or ():
+            events.append({'name': name, 'cat': 'step' if name.startswith('step') else 'phase',
+                           'ph': 'X', 'pid': pid, 'tid': 0,
+                           'ts': (start - self._origin) * 1e6, 'dur': duration * 1e6})
+        # the counts of every step, as a counter track at the end of the step
+        ends = [start + duration for name, start, duration in self.spans or () if name.startswith('step')]
+        for k, end in enumerate(ends):
+            events.append({'name': 'events', 'ph': 'C', 'pid': pid, 'tid': 0,
+                           'ts': (end - self._origin) * 1e6,
+                           'args': {name: self.counts[name][k] for name in COUNTERS}})
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+
+    def summary(self):
+        """Share of the profiled time per phase and mean counts per step
+
+        Returns:
+            dictionary -- 'seconds' (total per phase), 'share' (fraction per phase) and 'per_step' (mean count per counter)
+        """
+        totals = {phase: float(sum(self.seconds[phase])) for phase in PHASES}
+        overall = sum(totals.values())
+        return {'seconds': totals,
+                'share': {phase: (totals[phase] / overall if overall else 0.0) for phase in PHASES},
+                'per_step': {name: (float(np.mean(self.counts[name])) if self.steps else 0.0)
+                             for name in COUNTERS}}
+
+
+if __name__ == '__main__':
+    from collector import StatisticsCollector
+    from model import EvolutionaryModel
+    from simconfig import SimulationConfig
+
+    parser = argparse.ArgumentParser(description='Profile the phases of the model steps')
+    parser.add_argument('--steps', type=int, default=50, help='steps to profile')
+    parser.add_argument('--agents', type=int, help='initial agents (default: from the config)')
+    parser.add_argument('--size', type=int, help='grid width and height (default: from the config)')
+    parser.add_argument('--seed', type=int, default=1, help='seed of the model')
+    parser.add_argument('--engine', default='object', choices=['object', 'array'], help='agent engine')
+    parser.add_argument('--activation', default='sequential', choices=['sequential', 'two-phase'],
+                        help='activation of the agents')
+    parser.add_argument('--config', default='./config/config.ini', help='config file')
+    parser.add_argument('--csv', help='per-step csv file to write')
+    parser.add_argument('--trace', help='Chrome trace JSON file to write')
+    args = parser.parse_args()
+
+    config = SimulationConfig.fromFile(args.config)
+    profiler = StepProfiler(trace=args.trace is not None)
+    model = EvolutionaryModel(args.agents, args.size, args.size, seed=args.seed, engine=args.engine,
+                              activation=args.activation, config=config,
+                              collector=StatisticsCollector(config.active_strategies), profiler=profiler)
+    for _ in range(args.steps):
+        model.step()
+
+    summary = profiler.summary()
+    for phase in PHASES:
+        print('%-10s %10.4f s %6.1f%%' % (phase, summary['seconds'][phase], 100 * summary['share'][phase]))
+    print(', '.join('%.1f %s' % (summary['per_step'][name], name) for name in COUNTERS) + ' per step')
+    if args.csv:
+        profiler.toCSV(args.csv)
+    if args.trace:
+        profiler.toChromeTrace(args.trace)
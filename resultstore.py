@@ -0,0 +1,207 @@
+import argparse
+import json
+import os
+import struct
+
+import numpy as np
+import pandas as pd
+
+from collector import COLUMNS
+
+# File signature and layout version
+MAGIC = b'EVRESULT'
+VERSION = 1
+
+# On-disk type of every column, little endian; the strategy column holds
+# codes into the strategy dictionary stored in the header
+DTYPES = {
+    'run': np.dtype('<i4'),
+    'step': np.dtype('<i4'),
+    'strategy': np.dtype('<i2'),
+    'wealth': np.dtype('<f8'),
+    'population': np.dtype('<i8'),
+}
+
+_LENGTH = struct.Struct('<Q')
+
+
+# Append-only columnar result file, written chunk by chunk
+class ResultWriter:
+    """Streams statistics rows to a typed, chunked binary file.
+
+    The file starts with a header (signature, a JSON description of the
+    columns and the strategy dictionary). Every chunk is a row count followed
+    by the raw little endian array of each column, in COLUMNS order. Chunks
+    are flushed and fsynced as they are written, so after a crash the file
+    holds every complete chunk and readers skip a truncated last one.
+    """
+
+    def __init__(self, path, strategyList):
+        """ResultWriter constructor, creates (or truncates) the file
+
+        Arguments:
+            path {string} -- result file
+            strategyList {list} -- strategy dictionary, the strategy column holds indices into it
+        """
+        self.path = path
+        self.strategies = list(strategyList)
+        self.rows = 0
+        self.chunks = 0
+        header = json.dumps({
+            'version': VERSION,
+            'columns': [[name, DTYPES[name].str] for name in COLUMNS],
+            'strategies': self.strategies,
+        }).encode()
+        self.file = open(path, 'wb')
+        self.file.write(MAGIC + _LENGTH.pack(len(header)) + header)
+        self._sync()
+
+    def _sync(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def write(self, columns):
+        """Append one chunk
+
+        Arguments:
+            columns {tuple} -- run, step, strategy, wealth and population arrays, see StatisticsCollector.columns
+        """
+        n = len(columns[0])
+        if n == 0:
+            return
+        self.file.write(_LENGTH.pack(n))
+        for name, column in zip(COLUMNS, columns):
+            self.file.write(np.ascontiguousarray(column, dtype=DTYPES[name]).tobytes())
+        self._sync()
+        self.rows += n
+        self.chunks += 1
+
+    def close(self):
+        """Close the file
+        """
+        if not self.file.closed:
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def reopenResults(path, strategyList, step):
+    """Open a result file again to append to it, dropping its rows from a step on
+
+    A run resumed from a checkpoint appends to the result file it streamed
+    to before the interruption; the rows written after the checkpoint are
+    produced again, so they are dropped. The kept rows are copied chunk by
+    chunk to a new file that is renamed into place.
+
+    Arguments:
+        path {string} -- result file, a new file is started if it doesn't exist
+        strategyList {list} -- strategy dictionary, the one of the existing file
+        step {integer} -- first step whose rows are dropped
+
+    Returns:
+        ResultWriter -- writer appending to the file
+    """
+    if not os.path.exists(path) or step == 0:
+        return ResultWriter(path, strategyList)
+    temporary = path + '.tmp'
+    writer = ResultWriter(temporary, strategyList)
+    for chunk in ResultReader(path).chunks():
+        keep = chunk[1] < step
+        writer.write(tuple(column[keep] for column in chunk))
+    os.replace(temporary, path)
+    writer.path = path
+    return writer
+
+
+# Lazy reader of the files written by ResultWriter
+class ResultReader:
+    """Reads a result file one chunk at a time."""
+
+    def __init__(self, path):
+        """ResultReader constructor, reads the header
+
+        Arguments:
+            path {string} -- result file
+
+        Raises:
+            ValueError -- if the file is not a result file of a supported version
+        """
+        self.path = path
+        with open(path, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(path + ' is not a result file')
+            length, = _LENGTH.unpack(f.read(_LENGTH.size))
+            header = json.loads(f.read(length))
+            self.start = f.tell()
+        if header['version'] != VERSION:
+            raise ValueError('Unsupported result file version: ' + str(header['version']))
+        self.columns = [(name, np.dtype(dtype)) for name, dtype in header['columns']]
+        self.strategies = header['strategies']
+        self.rowSize = sum(dtype.itemsize for name, dtype in self.columns)
+
+    def chunks(self):
+        """Iterate over the chunks, only one of them is held in memory at a time
+
+        Returns:
+            generator -- run, step, strategy (codes), wealth and population arrays of every chunk
+        """
+        with open(self.path, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            end = f.tell()
+            f.seek(self.start)
+            while True:
+                position = f.tell()
+                if end - position < _LENGTH.size:
+                    return
+                n, = _LENGTH.unpack(f.read(_LENGTH.size))
+                if end - position - _LENGTH.size < n * self.rowSize:
+                    # truncated by an interrupted write
+                    return
+                yield tuple(np.fromfile(f, dtype=dtype, count=n) for name, dtype in self.columns)
+
+    def frames(self):
+        """Iterate over the chunks as DataFrames, with the strategy names decoded
+
+        Returns:
+            generator -- a pandas.DataFrame with COLUMNS as columns per chunk
+        """
+        for chunk in self.chunks():
+            data = dict(zip(COLUMNS, chunk))
+            data['strategy'] = pd.Categorical.from_codes(data['strategy'], categories=self.strategies)
+            yield pd.DataFrame(data, columns=COLUMNS)
+
+    def toDataFrame(self):
+        """Read the whole file into one DataFrame
+
+        Returns:
+            pandas.DataFrame -- all rows with COLUMNS as columns
+        """
+        frames = list(self.frames())
+        if not frames:
+            return pd.DataFrame({name: pd.Series(dtype=dtype) for name, dtype in self.columns})
+        return pd.concat(frames, ignore_index=True)
+
+    def toCSV(self, path):
+        """Convert the file to csv, chunk by chunk
+
+        Arguments:
+            path {string} -- csv file to write
+        """
+        first = True
+        for frame in self.frames():
+            frame.to_csv(path, mode='w' if first else 'a', header=first, index=False)
+            first = False
+        if first:
+            pd.DataFrame(columns=COLUMNS).to_csv(path, index=False)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Convert a result file to csv')
+    parser.add_argument('results', help='result file written by the simulation')
+    parser.add_argument('csv', help='csv file to write')
+    args = parser.parse_args()
+    ResultReader(args.results).toCSV(args.csv)
@@ -0,0 +1,212 @@
+import configparser
+import dataclasses
+from dataclasses import dataclass
+
+import strategies
+
+# Values of the game_type option
+GAME_TYPES = ('prisoners-dilema', 'chicken-game', 'no-predefined-game-type')
+
+# Values of the initial_wealth_type option
+WEALTH_TYPES = ('fixed', 'random')
+
+# Options of the [results] section, all other options belong to [model]
+RESULTS_OPTIONS = ('total_runs', 'processes', 'seed', 'output_folder', 'chunk_rows',
+                   'checkpoint_every', 'checkpoint_folder', 'verbose', 'event_log')
+
+POPULATION_PERCENT_SUFFIX = '_population_percent'
+
+
+# Settings of a simulation, as read from config/config.ini
+@dataclass(frozen=True)
+class SimulationConfig:
+    """Typed, validated and immutable settings of a simulation.
+
+    The fields are the options of config/config.ini; the population
+    percentages are gathered in population_percent, a sorted tuple of
+    (strategy, percentage) pairs with lower case strategy names (see
+    populationPercent). Use dataclasses.replace to derive a changed config,
+    it is validated again.
+    """
+
+    # [model]
+    game_type: str = 'prisoners-dilema'
+    grid_height: int = 20
+    grid_width: int = 20
+    steps: int = 1000
+    total_agents: int = 300
+    initial_wealth_type: str = 'fixed'
+    fixed_wealth_value: int = 1000
+    fixed_property_value: int = 500
+    percentage_of_owners: int = 50
+    initial_wealth_range_lower: int = 100
+    initial_wealth_range_upper: int = 200
+    property_buy_price_percentage: float = 0.12
+    max_negotiation_rounds: int = 100
+    active_strategies: tuple = ('hawk', 'dove', 'possessor', 'trader', 'traderToM0', 'traderToM1')
+    population_percent: tuple = (('dove', 0.17), ('hawk', 0.17), ('possessor', 0.17),
+                                 ('trader', 0.17), ('tradertom0', 0.17), ('tradertom1', 0.17))
+    # [results]
+    total_runs: int = 10
+    processes: int = 0
+    seed: int = None
+    output_folder: str = 'dmas_results'
+    chunk_rows: int = 65536
+    checkpoint_every: int = 0
+    checkpoint_folder: str = 'checkpoints'
+    verbose: bool = False
+    event_log: bool = False
+
+    def __post_init__(self):
+        for field in dataclasses.fields(self):
+            value = getattr(self, field.name)
+            if field.type is int and not (isinstance(value, int) and not isinstance(value, bool)):
+                if not (field.name == 'seed' and value is None):
+                    raise TypeError('%s must be an integer, got %r' % (field.name, value))
+            if field.type is float and not isinstance(value, (int, float)):
+                raise TypeError('%s must be a number, got %r' % (field.name, value))
+            if field.type in (str, bool, tuple) and not isinstance(value, field.type):
+                raise TypeError('%s must be a %s, got %r' % (field.name, field.type.__name__, value))
+
+        if self.game_type not in GAME_TYPES:
+            raise ValueError('Unknown game_type: ' + self.game_type)
+        if self.initial_wealth_type not in WEALTH_TYPES:
+            raise ValueError('Unknown initial_wealth_type: ' + self.initial_wealth_type)
+        for name in ('grid_height', 'grid_width', 'total_runs', 'chunk_rows', 'max_negotiation_rounds'):
+            if getattr(self, name) < 1:
+                raise ValueError('%s must be at least 1' % name)
+        for name in ('steps', 'total_agents', 'processes', 'checkpoint_every'):
+            if getattr(self, name) < 0:
+                raise ValueError('%s must not be negative' % name)
+        if not 0 <= self.percentage_of_owners <= 100:
+            raise ValueError('percentage_of_owners must be between 0 and 100')
+        if self.property_buy_price_percentage < 0:
+            raise ValueError('property_buy_price_percentage must not be negative')
+        if (self.initial_wealth_type == 'random'
+                and self.initial_wealth_range_lower >= self.initial_wealth_range_upper):
+            raise ValueError('initial_wealth_range_lower must be below initial_wealth_range_upper')
+
+        if not self.active_strategies:
+            raise ValueError('active_strategies must not be empty')
+        if len(set(self.active_strategies)) != len(self.active_strategies):
+            raise ValueError('active_strategies lists a strategy twice')
+        percents = dict(self.population_percent)
+        for strategy in self.active_strategies:
+            # raises ValueError for unknown strategies
+            strategies.strategyRole(strategy)
+            if strategy.lower() not in percents:
+                raise ValueError('No ' + strategy + POPULATION_PERCENT_SUFFIX + ' for an active strategy')
+        for strategy, percent in self.population_percent:
+            if not 0 <= percent <= 1:
+                raise ValueError(strategy + POPULATION_PERCENT_SUFFIX + ' must be between 0 and 1')
+
+    def populationPercent(self, strategy):
+        """Share of the initial population using a strategy
+
+        Arguments:
+            strategy {string} -- strategy name
+
+        Returns:
+            float -- the share, between 0 and 1
+        """
+        return dict(self.population_percent)[strategy.lower()]
+
+    def modelOptions(self):
+        """Options of the [model] section, everything that can change the outcome of a run
+
+        Returns:
+            dictionary -- option values keyed by field name
+        """
+        return {name: value for name, value in self.toDict().items() if name not in RESULTS_OPTIONS}
+
+    def toDict(self):
+        """Plain (JSON serialisable) copy of the config, see fromDict
+
+        Returns:
+            dictionary -- field values keyed by field name
+        """
+        values = dataclasses.asdict(self)
+        values['active_strategies'] = list(self.active_strategies)
+        values['population_percent'] = dict(self.population_percent)
+        return values
+
+    @classmethod
+    def fromDict(cls, values):
+        """Config from the output of toDict
+
+        Arguments:
+            values {dictionary} -- field values keyed by field name
+
+        Returns:
+            SimulationConfig -- the config
+        """
+        values = dict(values)
+        values['active_strategies'] = tuple(values['active_strategies'])
+        values['population_percent'] = tuple(sorted(
+            (strategy.lower(), percent) for strategy, percent in values['population_percent'].items()))
+        return cls(**values)
+
+    @classmethod
+    def fromSections(cls, model, results):
+        """Config from the options of a config file, as strings
+
+        Arguments:
+            model {dictionary} -- options of the [model] section
+            results {dictionary} -- options of the [results] section
+
+        Returns:
+            SimulationConfig -- the config
+
+        Raises:
+            ValueError -- if an option is missing or invalid
+        """
+        model = {key.lower(): value for key, value in model.items()}
+        results = {key.lower(): value for key, value in results.items()}
+        try:
+            return cls(
+                game_type=model['game_type'],
+                grid_height=int(model['grid_height']),
+                grid_width=int(model['grid_width']),
+                steps=int(model['steps']),
+                total_agents=int(model['total_agents']),
+                initial_wealth_type=model['initial_wealth_type'],
+                fixed_wealth_value=int(model['fixed_wealth_value']),
+                fixed_property_value=int(model['fixed_property_value']),
+                percentage_of_owners=int(model['percentage_of_owners']),
+                initial_wealth_range_lower=int(model['initial_wealth_range_lower']),
+                initial_wealth_range_upper=int(model['initial_wealth_range_upper']),
+                property_buy_price_percentage=float(model['property_buy_price_percentage']),
+                max_negotiation_rounds=int(model['max_negotiation_rounds']),
+                active_strategies=tuple(model['active_strategies'].split(',')),
+                population_percent=tuple(sorted(
+                    (key[:-len(POPULATION_PERCENT_SUFFIX)], float(value))
+                    for key, value in model.items() if key.endswith(POPULATION_PERCENT_SUFFIX))),
+                total_runs=int(results['total_runs']),
+                processes=int(results['processes']),
+                seed=int(results['seed']) if results['seed'] else None,
+                output_folder=results['output_folder'],
+                chunk_rows=int(results['chunk_rows']),
+                checkpoint_every=int(results['checkpoint_every']),
+                checkpoint_folder=results['checkpoint_folder'],
+                verbose=results['verbose_mode'] == 'on',
+                event_log=results['event_log'] == 'on')
+        except KeyError as error:
+            raise ValueError('Missing config option: ' + error.args[0])
+
+    @classmethod
+    def fromFile(cls, path='./config/config.ini'):
+        """Config read from a config file
+
+        Arguments:
+            path {string} -- config file
+
+        Returns:
+            SimulationConfig -- the config
+
+        Raises:
+            ValueError -- if the file cannot be read, or an option is missing or invalid
+        """
+        parser = configparser.ConfigParser()
+        if not parser.read(path):
+            raise ValueError('Cannot read config file ' + path)
+        return cls.fromSections(parser['model'], parser['results'])
@@ -1,105 +1,63 @@
-import configparser
 import os
-import pandas as pd
-import numpy as np
-import matplotlib.pyplot as plt
 
-from model import EvolutionaryModel
+from executor import makeSeeds, persistedRootSeed, removeStaleRuns, runSimulations
+from collector import StatisticsCollector
+from resultstore import ResultWriter
+from aggregation import aggregateResults
+from simconfig import SimulationConfig
 
 # Load the configuration file
-CONFIG = configparser.ConfigParser()
-CONFIG.read("./config/config.ini")
-CONFIG_MODEL = CONFIG['model']
-CONFIG_RESULTS = CONFIG['results']
-
-n_steps = int(CONFIG_MODEL['steps'])
-n_agents = int(CONFIG_MODEL['total_agents'])
-grid_height = int(CONFIG_MODEL['grid_height'])
-grid_width = int(CONFIG_MODEL['grid_width'])
-strategyList = CONFIG_MODEL['active_strategies'].split(',')
-
-# Repeat entire simluation based on config file
-num_simulations = int(CONFIG_RESULTS['total_runs'])
-working_directory = os.getcwd()
-output_folder = os.path.join(
-    working_directory, CONFIG_RESULTS['output_folder'])
-if not os.path.exists(output_folder):
-    os.mkdir(output_folder)
-
-output_df = pd.DataFrame(
-    columns=['run', 'step', 'strategy', 'wealth', 'population'])
-
-for sim_run in range(num_simulations):
-    model = EvolutionaryModel(n_agents, grid_width, grid_height)
-
-    for i in range(n_steps):
-        model.step()
-        
-        # create statistics
-        for strategy in strategyList:
-            strategy_agents = list(
-                filter(lambda agent: agent.strategy == strategy, model.schedule.agents))
-            population = len(strategy_agents)
-            wealth = sum(agent.getTotalWealth() for agent in strategy_agents)
-            output_df = output_df.append(pd.Series(
-                [sim_run, i, strategy, wealth, population], index=output_df.columns), ignore_index=True)
-
-output_df.to_csv(output_folder + '/simulation_results.csv', index=False)
-
-# Create aggregated plots
-grouped_data = output_df.groupby(['step', 'strategy'])
-grouped_data_dict = {}
-for strategy in strategyList:
-    population_key = 'population_' + strategy
-    wealth_key = 'wealth_' + strategy
-    grouped_data_dict[population_key] = []
-    grouped_data_dict[wealth_key] = []
-
-for step in range(n_steps):
-    for strategy in strategyList:
-        grouped_data_dict['population_' + strategy].append(
-            grouped_data.get_group((step, strategy))['population'].mean())
-        grouped_data_dict['wealth_' + strategy].append(
-            grouped_data.get_group((step, strategy))['wealth'].mean())
-
-# 1. Strategy population over time
-plt.figure()
-for strategy in strategyList:
-    plt.plot(grouped_data_dict['population_' + strategy], label=(strategy))
-plt.ylabel('Population')
-plt.xlabel('Simulation Steps')
-plt.title("Strategy population at each step")
-plt.legend()
-plt.tight_layout()
-plt.savefig(os.path.join(output_folder,  'aggregated_population_plot.png'))
-plt.close()
-
-# 2. Strategy wealth over time
-plt.figure()
-for strategy in strategyList:
-    plt.plot(grouped_data_dict['wealth_' + strategy], label=(strategy))
-plt.ylabel('Wealth')
-plt.xlabel('Simulation Steps')
-plt.title("Strategy wealth accumulated at each step")
-plt.legend()
-plt.tight_layout()
-plt.savefig(os.path.join(output_folder,  'aggregated_wealth_plot.png'))
-plt.close()
-
-# 3. Population histogram
-final_populations = []
-final_strategies = []
-for strategy in strategyList:
-    final_strategies.append(strategy)
-    final_populations.append(grouped_data.get_group(
-        (n_steps - 1, strategy))['population'].mean())
-y_pos = np.arange(len(final_strategies))
-plt.figure()
-plt.bar(y_pos, final_populations, align='center', alpha=0.5)
-plt.xticks(y_pos, final_strategies)
-plt.ylabel('Population')
-plt.xlabel('Strategies')
-plt.title('Population composition - end of simulation')
-plt.tight_layout()
-plt.savefig(os.path.join(output_folder,  'aggregated_histogram_plot.png'))
-plt.close()
\ No newline at end of file
+config = SimulationConfig.fromFile()
+
+# Guard the script so worker processes can import it on spawn-based platforms
+if __name__ == '__main__':
+    working_directory = os.getcwd()
+    output_folder = os.path.join(
+        working_directory, config.output_folder)
+    if not os.path.exists(output_folder):
+        os.mkdir(output_folder)
+
+    checkpoint_folder = os.path.join(output_folder, config.checkpoint_folder)
+    if config.checkpoint_every and not os.path.exists(checkpoint_folder):
+        os.mkdir(checkpoint_folder)
+
+    # Structured log of the events of every run, one file per run
+    event_folder = None
+    if config.event_log:
+        event_folder = os.path.join(output_folder, 'events')
+        if not os.path.exists(event_folder):
+            os.mkdir(event_folder)
+
+    # Every run gets its own seed, results only depend on the seeds
+    # (an empty root seed draws a fresh one, kept with the checkpoints so an
+    # interrupted job resumes with the same seeds, as long as the model
+    # settings are the same; a run may be resumed for more steps)
+    root_seed = config.seed
+    if root_seed is None and config.checkpoint_every:
+        settings = dict(config.modelOptions(), steps=None)
+        root_seed = persistedRootSeed(os.path.join(checkpoint_folder, 'root_seed'), settings)
+    seeds = makeSeeds(config.total_runs, root_seed)
+    # Every run streams its statistics to its own result file as it goes
+    run_folder = os.path.join(output_folder, 'runs')
+    if not os.path.exists(run_folder):
+        os.mkdir(run_folder)
+    # Checkpoints, events and results of runs with other seeds belong to earlier jobs
+    if config.checkpoint_every:
+        removeStaleRuns(checkpoint_folder, seeds)
+    if event_folder is not None:
+        removeStaleRuns(event_folder, seeds)
+    removeStaleRuns(run_folder, seeds)
+    # The result files of the runs are merged in run order, chunk by chunk
+    results_path = os.path.join(output_folder, 'simulation_results.bin')
+    with ResultWriter(results_path, config.active_strategies) as writer:
+        collector = StatisticsCollector(config.active_strategies, capacity=config.chunk_rows,
+                                        chunk_size=config.chunk_rows, sink=writer)
+        # Runs are independent, spread them over worker processes (0 -> all cores)
+        runSimulations(config.total_runs, config, seeds=seeds, processes=config.processes or None,
+                       collector=collector, checkpoint_every=config.checkpoint_every,
+                       checkpoint_folder=checkpoint_folder, event_folder=event_folder,
+                       result_folder=run_folder)
+        collector.flush()
+
+    # Mean, std and confidence interval over the runs, with the plots
+    aggregateResults(results_path, output_folder)
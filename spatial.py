@@ -0,0 +1,317 @@
+import numpy as np
+from mesa.space import MultiGrid, accept_tuple_argument
+
+
+def mooreNeighbourTable(width, height):
+    """Precompute the Moore neighbourhood (radius 1, without the centre) of every cell of a torus
+
+    The neighbours of a cell are listed in the same order as
+    MultiGrid.get_neighborhood(pos, moore=True, include_center=False) returns
+    them, so picking a random neighbour draws the same cell.
+
+    Arguments:
+        width {integer} -- grid width
+        height {integer} -- grid height
+
+    Returns:
+        numpy.array -- (width * height, 8) table of neighbour cell ids, padded with -1
+        numpy.array -- number of distinct neighbours of each cell (8 unless the grid is narrower than 3)
+    """
+    n_cells = width * height
+    offsets = [(dx, dy) for dy in (-1, 0, 1) for dx in (-1, 0, 1) if dx != 0 or dy != 0]
+    x = np.arange(width)[:, None]
+    y = np.arange(height)[None, :]
+    table = np.stack([(((x + dx) % width) * height + (y + dy) % height).reshape(-1)
+                      for dx, dy in offsets], axis=1)
+    degree = np.full(n_cells, 8, dtype=np.int64)
+
+    if width < 3 or height < 3:
+        # on narrow grids offsets wrap onto the same cell, keep the first occurrence
+        for cell in range(n_cells):
+            seen = []
+            for neighbour in table[cell]:
+                if neighbour not in seen:
+                    seen.append(neighbour)
+            table[cell] = -1
+            table[cell, :len(seen)] = seen
+            degree[cell] = len(seen)
+    return np.ascontiguousarray(table, dtype=np.int64), degree
+
+
+# Mesa's MultiGrid with the fast-path API of TorusGrid
+class MooreMultiGrid(MultiGrid):
+    """MultiGrid offering randomNeighbour/randomCellmate on top of the generic Mesa methods."""
+
+    @property
+    def empties(self):
+        # Mesa keeps a list of the empty cells up to date on every move, which
+        # scans the list (O(cells) per move); it is computed on demand instead
+        return [(x, y) for x in range(self.width) for y in range(self.height) if not self.grid[x][y]]
+
+    @empties.setter
+    def empties(self, value):
+        # assigned by Grid.__init__, there is no list to keep
+        pass
+
+    def _place_agent(self, pos, agent):
+        x, y = pos
+        self.grid[x][y].add(agent)
+
+    def _remove_agent(self, pos, agent):
+        x, y = pos
+        self.grid[x][y].remove(agent)
+
+    def neighbourTable(self):
+        """Moore neighbour table of the grid, built on first use
+
+        Returns:
+            numpy.array -- (width * height, 8) table of neighbour cell ids, see mooreNeighbourTable
+            numpy.array -- number of distinct neighbours of each cell
+        """
+        if not hasattr(self, '_neighbourTable'):
+            self._neighbourTable = mooreNeighbourTable(self.width, self.height)
+        return self._neighbourTable
+
+    def relocateAll(self, agents, cells):
+        """Move every agent on the grid, one Mesa move at a time
+
+        Arguments:
+            agents {list} -- all agents on the grid
+            cells {numpy.array} -- new cell id (x * height + y) of each agent
+        """
+        x, y = np.divmod(cells, self.height)
+        for agent, ax, ay in zip(agents, x.tolist(), y.tolist()):
+            self.move_agent(agent, (ax, ay))
+
+    def randomNeighbour(self, pos, rng):
+        """Random cell of the Moore neighbourhood of a position
+
+        Arguments:
+            pos {tuple} -- (x, y) position
+            rng {random.Random} -- random number generator
+
+        Returns:
+            tuple -- (x, y) of the chosen neighbour
+        """
+        return rng.choice(self.get_neighborhood(pos, moore=True, include_center=False))
+
+    def randomCellmate(self, agent, rng):
+        """Random other agent on the agent's cell, if it shares the cell with at least two others
+
+        Arguments:
+            agent {Agent} -- agent looking for a cellmate
+            rng {random.Random} -- random number generator
+
+        Returns:
+            Agent -- the chosen cellmate or None
+        """
+        cellmates = self.get_cell_list_contents([agent.pos])
+        # don't fight against yourself
+        cellmates.remove(agent)
+        if len(cellmates) > 1:
+            # grid cells are unordered sets, sort them so runs are reproducible
+            cellmates.sort(key=lambda other: other.unique_id)
+            return rng.choice(cellmates)
+        return None
+
+
+# Array-backed toroidal grid
+class TorusGrid:
+    """Toroidal grid with a precomputed neighbour table and a cell occupancy index.
+
+    Cells are numbered x * height + y. Every occupied cell maps to the list of
+    its agents ordered by unique id, so a move or a random cellmate costs time
+    in the order of the (small) cell occupancy instead of the grid size, and
+    the draws match MooreMultiGrid for the same random stream.
+    """
+
+    def __init__(self, width, height, torus=True):
+        """TorusGrid constructor
+
+        Arguments:
+            width {integer} -- grid width
+            height {integer} -- grid height
+            torus {boolean} -- must be True, the grid always wraps
+        """
+        if not torus:
+            raise ValueError('TorusGrid always wraps around')
+        self.width = width
+        self.height = height
+        self.torus = True
+        self.neighbours, self.degree = mooreNeighbourTable(width, height)
+        # flat views for fast scalar lookups from Python
+        self._neighbours = memoryview(self.neighbours.reshape(-1))
+        self._degree = memoryview(self.degree)
+        self.cells = {}
+
+    def cell(self, pos):
+        """Cell id of a position
+
+        Arguments:
+            pos {tuple} -- (x, y) position
+
+        Returns:
+            integer -- cell id
+        """
+        x, y = pos
+        return (x % self.width) * self.height + y % self.height
+
+    def position(self, cell):
+        """Position of a cell id
+
+        Arguments:
+            cell {integer} -- cell id
+
+        Returns:
+            tuple -- (x, y) position
+        """
+        return divmod(cell, self.height)
+
+    def _place(self, cell, agent):
+        occupants = self.cells.get(cell)
+        if occupants is None:
+            self.cells[cell] = [agent]
+            return
+        # keep the occupants ordered by unique id
+        i = len(occupants)
+        while i > 0 and occupants[i - 1].unique_id > agent.unique_id:
+            i -= 1
+        occupants.insert(i, agent)
+
+    def _remove(self, cell, agent):
+        occupants = self.cells[cell]
+        if len(occupants) == 1:
+            del self.cells[cell]
+        else:
+            occupants.remove(agent)
+
+    def place_agent(self, agent, pos):
+        """Position an agent on the grid, and set its pos variable
+
+        Arguments:
+            agent {Agent} -- agent to place
+            pos {tuple} -- (x, y) position
+        """
+        self._place(self.cell(pos), agent)
+        agent.pos = pos
+
+    def move_agent(self, agent, pos):
+        """Move an agent from its current position to a new position
+
+        Arguments:
+            agent {Agent} -- agent to move
+            pos {tuple} -- (x, y) position, wrapped around the torus
+        """
+        cell = self.cell(pos)
+        self._remove(self.cell(agent.pos), agent)
+        self._place(cell, agent)
+        agent.pos = self.position(cell)
+
+    def _remove_agent(self, pos, agent):
+        self._remove(self.cell(pos), agent)
+
+    def remove_agent(self, agent):
+        """Remove the agent from the grid and set its pos variable to None
+
+        Arguments:
+            agent {Agent} -- agent to remove
+        """
+        self._remove(self.cell(agent.pos), agent)
+        agent.pos = None
+
+    def is_cell_empty(self, pos):
+        return self.cell(pos) not in self.cells
+
+    def get_neighborhood(self, pos, moore=True, include_center=False, radius=1):
+        """Moore neighbourhood of a position, read from the neighbour table
+
+        Arguments:
+            pos {tuple} -- (x, y) position
+            moore {boolean} -- must be True
+            include_center {boolean} -- also return the position itself
+            radius {integer} -- must be 1
+
+        Returns:
+            list -- (x, y) positions of the neighbouring cells
+        """
+        if not moore or radius != 1:
+            raise NotImplementedError('TorusGrid only holds the radius 1 Moore neighbourhood')
+        cell = self.cell(pos)
+        start = 8 * cell
+        neighbourhood = [self.position(c) for c in self._neighbours[start:start + self._degree[cell]]]
+        if include_center:
+            neighbourhood.append(self.position(cell))
+        return neighbourhood
+
+    @accept_tuple_argument
+    def iter_cell_list_contents(self, cell_list):
+        for pos in cell_list:
+            yield from self.cells.get(self.cell(pos), ())
+
+    @accept_tuple_argument
+    def get_cell_list_contents(self, cell_list):
+        return list(self.iter_cell_list_contents(cell_list))
+
+    def neighbourTable(self):
+        """Moore neighbour table of the grid
+
+        Returns:
+            numpy.array -- (width * height, 8) table of neighbour cell ids, see mooreNeighbourTable
+            numpy.array -- number of distinct neighbours of each cell
+        """
+        return self.neighbours, self.degree
+
+    def relocateAll(self, agents, cells):
+        """Move every agent on the grid at once, rebuilding the occupancy index
+
+        Arguments:
+            agents {list} -- all agents on the grid, in order of their unique id
+            cells {numpy.array} -- new cell id of each agent
+        """
+        # a stable sort by cell keeps the occupants of a cell in unique id order
+        order = np.argsort(cells, kind='stable')
+        sortedCells = cells[order]
+        starts = np.concatenate([[0], np.flatnonzero(np.diff(sortedCells)) + 1]).tolist()
+        ends = starts[1:] + [len(order)]
+        order = order.tolist()
+        self.cells = {}
+        for start, end in zip(starts, ends):
+            self.cells[int(sortedCells[start])] = [agents[i] for i in order[start:end]]
+        x, y = np.divmod(cells, self.height)
+        for agent, ax, ay in zip(agents, x.tolist(), y.tolist()):
+            agent.pos = (ax, ay)
+
+    def randomNeighbour(self, pos, rng):
+        """Random cell of the Moore neighbourhood of a position
+
+        Arguments:
+            pos {tuple} -- (x, y) position
+            rng {random.Random} -- random number generator
+
+        Returns:
+            tuple -- (x, y) of the chosen neighbour
+        """
+        cell = self.cell(pos)
+        # randrange(n) draws the same index as choice() on a list of length n
+        k = rng.randrange(self._degree[cell])
+        return self.position(self._neighbours[8 * cell + k])
+
+    def randomCellmate(self, agent, rng):
+        """Random other agent on the agent's cell, if it shares the cell with at least two others
+
+        Arguments:
+            agent {Agent} -- agent looking for a cellmate
+            rng {random.Random} -- random number generator
+
+        Returns:
+            Agent -- the chosen cellmate or None
+        """
+        occupants = self.cells[self.cell(agent.pos)]
+        n = len(occupants) - 1
+        if n > 1:
+            # index into the occupants without the agent itself
+            k = rng.randrange(n)
+            if k >= occupants.index(agent):
+                k += 1
+            return occupants[k]
+        return None
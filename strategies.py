@@ -1,21 +1,8 @@
 import random
-import statistics
 import math
-import configparser
-import io
-import os
-
-# Load the configuration file
-CONFIG = configparser.ConfigParser()
-CONFIG.read('./config/config.ini')
-CONFIG_MODEL = CONFIG['model']
-PROPERTY_INFLATION_PRICE = float(CONFIG_MODEL['property_buy_price_percentage'])
-
-# List of available strategies
-strategyList = CONFIG_MODEL['active_strategies'].split(',')
-
-# Type of game
-ACTIVE_GAME_TYPE = CONFIG_MODEL['game_type']
+import numpy as np
+import negotiation
+import eventlog
 
 
 def emulateHawkDoveStrategy(hawk, dove):
@@ -29,7 +16,7 @@ def emulateHawkDoveStrategy(hawk, dove):
     if dove.owner > 0:
         hawk.owner = dove.owner
         dove.owner = 0
-    hawk.saySomething('I am hawk. I gained ' + str(hawk.owner))
+    hawk.saySomething('I am hawk. I gained %s', hawk.owner)
     # dove loses resource
     dove.saySomething('I am dove. I lost')
 
@@ -42,12 +29,12 @@ def emulateHawkHawkStrategy(hawkO, hawkNO):
         hawkNO {Agent} -- Hawk Intruder Agent
     """
     owner = hawkO.owner
-    h = getFightCost(owner)
+    h = getFightCost(owner, hawkO.random, hawkO.model.config.game_type)
 
     # if wealth/2 > h its the prisoners dilemma, otherwise its the chicken game
     # one of both will win while the other looses
     player = [hawkO, hawkNO]
-    winner = random.choice(player)
+    winner = hawkO.random.choice(player)
     player.remove(winner)
     looser = player[0]
     # the winner is the (new) owner
@@ -57,6 +44,8 @@ def emulateHawkHawkStrategy(hawkO, hawkNO):
     winner.owner = owner
     looser.wealth -= h
     looser.owner = 0
+    if hawkO.model.eventLog is not None:
+        hawkO.model.eventLog.record(eventlog.FIGHT, HAWK_HAWK, winner.unique_id, looser.unique_id, h)
 
     # Die if wealth is negative
     if looser.wealth < 0:
@@ -75,18 +64,15 @@ def emulateDoveDoveStrategy(doveO, doveNO):
     owner = doveO.owner
     player = [doveO, doveNO]
     # random dove retreats
-    winner = random.choice(player)
+    winner = doveO.random.choice(player)
     player.remove(winner)
     looser = player[0]
     # the winner takes it all
     winner.owner = owner
     looser.owner = 0
-    winner.saySomething('I am dove ' +
-                        str(winner.unique_id) +
-                        '. I gained ' +
-                        str(owner))
+    winner.saySomething('I am dove %d. I gained %s', winner.unique_id, owner)
     # the other dove doesn't gain anything
-    looser.saySomething('I am dove ' + str(looser.unique_id) + ". I retreated")
+    looser.saySomething('I am dove %d. I retreated', looser.unique_id)
 
 
 def emulateTradersStrategy(owner, intruder):
@@ -97,12 +83,14 @@ def emulateTradersStrategy(owner, intruder):
         intruder {Agent} -- Trader Intruder Agent
     """
     estimated_buying_price = owner.owner + \
-        (PROPERTY_INFLATION_PRICE * owner.owner)
+        (owner.model.config.property_buy_price_percentage * owner.owner)
     x = owner.owner + round((estimated_buying_price - owner.owner) / 2)
     owner.owner = 0
     owner.wealth += x
     intruder.owner = x
     intruder.wealth -= x
+    if owner.model.eventLog is not None:
+        owner.model.eventLog.record(eventlog.TRADE, TRADE, owner.unique_id, intruder.unique_id, x)
     owner.saySomething('We are trading')
 
 
@@ -113,12 +101,14 @@ def emulateTraderToMStrategy(owner, intruder):
     # owner sells the property for x = (V + v) / 4
     # x = round((0.8 * intruder.wealth + owner.owner) / 2)
     v = owner.owner
-    estimated_buying_price = v + (PROPERTY_INFLATION_PRICE * v)
+    estimated_buying_price = v + (owner.model.config.property_buy_price_percentage * v)
     x = round((estimated_buying_price - v) / 4)
     owner.owner = 0
     owner.wealth += v + x
     intruder.owner = v + 3 * x
     intruder.wealth -= v + 3 * x
+    if owner.model.eventLog is not None:
+        owner.model.eventLog.record(eventlog.TRADE, TRADER_TOM, owner.unique_id, intruder.unique_id, v + 3 * x)
     owner.saySomething('We are trading')
 
 
@@ -129,78 +119,282 @@ def emulateToMTraderStrategy(owner, intruder):
     # owner sells the property for x = (V + v) / 4
     # x = round((0.8 * intruder.wealth + owner.owner) / 2)
     v = owner.owner
-    estimated_buying_price = v + (PROPERTY_INFLATION_PRICE * v)
+    estimated_buying_price = v + (owner.model.config.property_buy_price_percentage * v)
     x = round((estimated_buying_price - v) / 4)
 
     owner.owner = 0
     owner.wealth += v + 3 * x
     intruder.owner = v + x
     intruder.wealth -= v + x
+    if owner.model.eventLog is not None:
+        owner.model.eventLog.record(eventlog.TRADE, TOM_TRADER, owner.unique_id, intruder.unique_id, v + x)
 
     owner.saySomething('We are trading')
 
 
 # Trader with ToM0 or ToM1 vs Trader with ToM0 or ToM1
 def emulateToMToMStrategy(owner, intruder):
-    # v = owner.owner
-    # estimated_buying_price = v + (PROPERTY_INFLATION_PRICE * v)
-    #print("initial property owner:", owner.owner, "\t \t initial wealth owner:", owner.wealth)
-    #print("initial property intruder:", intruder.owner, "\t \t initial wealth intruder:", intruder.wealth)
-    p = owner.ToMAgent.play(intruder.ToMAgent)
+    profiler = owner.model.profiler
+    if profiler is not None:
+        start = profiler.now()
+    p = owner.ToMAgent.play(intruder.ToMAgent, owner.model.config.max_negotiation_rounds)
+    if profiler is not None:
+        profiler.stop('negotiate', start, span=False)
     if p != None:
         x = p * intruder.wealth
-        #print("excess paied:",x)
 
         owner.owner = 0
         owner.wealth += x
         intruder.owner = x
         intruder.wealth -= x
+        if owner.model.eventLog is not None:
+            owner.model.eventLog.record(eventlog.TRADE, TOM_TOM, owner.unique_id, intruder.unique_id, x)
+
+
+def emulateToMToMStrategies(owners, intruders, maxRounds):
+    """ToM vs ToM trades of many disjoint owner/intruder pairs, negotiated together
+
+    Arguments:
+        owners {list} -- owner agent of each trade
+        intruders {list} -- intruder agent of each trade
+        maxRounds {integer} -- round budget of every negotiation
+    """
+    profiler = owners[0].model.profiler if len(owners) else None
+    if profiler is not None:
+        start = profiler.now()
+    prices = negotiation.negotiate([owner.ToMAgent for owner in owners],
+                                   [intruder.ToMAgent for intruder in intruders],
+                                   maxRounds)
+    if profiler is not None:
+        profiler.stop('negotiate', start)
+    log = owners[0].model.eventLog if len(owners) else None
+    for owner, intruder, p in zip(owners, intruders, prices):
+        if p != None:
+            x = p * intruder.wealth
+
+            owner.owner = 0
+            owner.wealth += x
+            intruder.owner = x
+            intruder.wealth -= x
+            if log is not None:
+                log.record(eventlog.TRADE, TOM_TOM, owner.unique_id, intruder.unique_id, x)
+
+
+# Dove-Hawk strategy seen from the owner's side
+def emulateDoveHawkStrategy(dove, hawk):
+    """Dove owner meets Hawk intruder
+
+    Arguments:
+        dove {Agent} -- the dove agent (owner)
+        hawk {Agent} -- the hawkish agent (intruder)
+    """
+    emulateHawkDoveStrategy(hawk, dove)
+
+
+# Interaction kinds, the cells of the owner x intruder dispatch table
+NO_INTERACTION = 0
+HAWK_DOVE = 1
+DOVE_HAWK = 2
+HAWK_HAWK = 3
+DOVE_DOVE = 4
+TRADE = 5
+TRADER_TOM = 6
+TOM_TRADER = 7
+TOM_TOM = 8
+
+# Emulation of each interaction kind, called as emulate(owner, intruder)
+INTERACTIONS = [
+    None,
+    emulateHawkDoveStrategy,
+    emulateDoveHawkStrategy,
+    emulateHawkHawkStrategy,
+    emulateDoveDoveStrategy,
+    emulateTradersStrategy,
+    emulateTraderToMStrategy,
+    emulateToMTraderStrategy,
+    emulateToMToMStrategy]
+
+# Trades only happen if the intruder can afford the estimated buying price
+TRADES = (TRADE, TRADER_TOM, TOM_TRADER, TOM_TOM)
+
+# How each strategy behaves in an owner/intruder interaction
+STRATEGY_ROLES = {
+    'hawk': 'hawk',
+    'dove': 'dove',
+    'possessor': 'possessor',
+    'trader': 'trader',
+    'traderToM0': 'tom',
+    'traderToM1': 'tom'}
+
+
+def tomOrder(strategy):
+    """Theory of mind order of a ToM trader strategy (traderToM0, traderToM1, traderToM2, ...)
+
+    Arguments:
+        strategy {string} -- strategy name
+
+    Returns:
+        integer -- the order k of a traderToMk strategy, None for other strategies
+    """
+    prefix = 'traderToM'
+    if strategy.startswith(prefix) and strategy[len(prefix):].isdigit():
+        return int(strategy[len(prefix):])
+    return None
+
 
-        #print("final property owner:", owner.owner, "\t \tfinal wealth owner:", owner.wealth)
-        #print("final property intruder:", intruder.owner, "\t \tfinal wealth intruder:", intruder.wealth)
-        #print("____________________________________________________________________________________")
+def strategyRole(strategy):
+    """How a strategy behaves in an owner/intruder interaction
+
+    Arguments:
+        strategy {string} -- strategy name
+
+    Returns:
+        string -- the role, a key of ROLE_INTERACTIONS
+    """
+    if strategy in STRATEGY_ROLES:
+        return STRATEGY_ROLES[strategy]
+    # every traderToMk negotiates like the ToM traders
+    if tomOrder(strategy) is not None:
+        return 'tom'
+    raise ValueError('Unknown strategy: ' + str(strategy))
+
+# Interaction kind for each (owner role, intruder role)
+ROLE_INTERACTIONS = {
+    # dove owner
+    ('dove', 'dove'): DOVE_DOVE,
+    ('dove', 'hawk'): DOVE_HAWK,
+    ('dove', 'possessor'): DOVE_DOVE,
+    ('dove', 'trader'): DOVE_DOVE,
+    ('dove', 'tom'): DOVE_DOVE,
+    # hawk owner
+    ('hawk', 'dove'): HAWK_DOVE,
+    ('hawk', 'hawk'): HAWK_HAWK,
+    ('hawk', 'possessor'): HAWK_DOVE,
+    ('hawk', 'trader'): HAWK_DOVE,
+    ('hawk', 'tom'): HAWK_DOVE,
+    # possessor owner
+    ('possessor', 'dove'): HAWK_DOVE,
+    ('possessor', 'hawk'): HAWK_HAWK,
+    ('possessor', 'possessor'): HAWK_DOVE,
+    ('possessor', 'trader'): HAWK_DOVE,
+    ('possessor', 'tom'): HAWK_DOVE,
+    # trader owner
+    ('trader', 'dove'): HAWK_DOVE,
+    ('trader', 'hawk'): HAWK_HAWK,
+    ('trader', 'possessor'): HAWK_DOVE,
+    ('trader', 'trader'): TRADE,
+    ('trader', 'tom'): TRADER_TOM,
+    # trader with ToM owner
+    ('tom', 'dove'): HAWK_DOVE,
+    ('tom', 'hawk'): HAWK_HAWK,
+    ('tom', 'possessor'): HAWK_DOVE,
+    ('tom', 'trader'): TOM_TRADER,
+    ('tom', 'tom'): TOM_TOM}
+
+
+def interactionTable(strategyList):
+    """Build the owner x intruder dispatch table for a list of strategies
+
+    Arguments:
+        strategyList {list} -- strategy names, the index of a strategy is its code
+
+    Returns:
+        numpy.array -- interaction kind, indexed by [owner code, intruder code]
+    """
+    roles = [strategyRole(strategy) for strategy in strategyList]
+    table = np.zeros([len(roles), len(roles)], dtype=np.int8)
+    for i, ownerRole in enumerate(roles):
+        for j, intruderRole in enumerate(roles):
+            table[i, j] = ROLE_INTERACTIONS[(ownerRole, intruderRole)]
+    return table
+
+
+def emulateInteraction(kind, owner, intruder):
+    """Emulate one owner/intruder interaction of the given kind
+
+    Arguments:
+        kind {integer} -- interaction kind from the dispatch table
+        owner {Agent} -- Owner of the cell
+        intruder {Agent} -- Agent intruding the cell
+    """
+    profiler = owner.model.profiler
+    if profiler is not None:
+        profiler.count('encounters')
+    if kind == NO_INTERACTION:
+        return
+    if kind in TRADES:
+        estimated_buying_price = owner.owner + (owner.model.config.property_buy_price_percentage * owner.owner)
+        if not estimated_buying_price < intruder.wealth:
+            return
+        if profiler is not None:
+            profiler.count('trades')
+    elif kind == HAWK_HAWK and profiler is not None:
+        profiler.count('fights')
+    if owner.model.eventLog is not None:
+        owner.model.eventLog.record(eventlog.INTERACTION, kind, owner.unique_id, intruder.unique_id, owner.owner)
+    INTERACTIONS[kind](owner, intruder)
 
 
 # Get cost of interaction or fight
-def getFightCost(V):
+def getFightCost(V, rng=random, gameType='prisoners-dilema'):
     """Get cost of interaction or fight
 
     Arguments:
         V {integer} -- Value of property being fought
+        rng {random.Random} -- random number generator to draw the cost from
+        gameType {string} -- type of game (prisoners-dilema, chicken-game or no-predefined-game-type)
 
     Returns:
         integer -- cost of the fight
     """
     h = 0
-    if ACTIVE_GAME_TYPE == 'prisoners-dilema':
-        h = round(random.uniform(0, V / 2))
-    elif ACTIVE_GAME_TYPE == 'chicken-game':
-        h = round(random.uniform(V/2, V))
-    elif ACTIVE_GAME_TYPE == 'no-predefined-game-type':
-        h = round(random.uniform(0, V))
+    if gameType == 'prisoners-dilema':
+        h = round(rng.uniform(0, V / 2))
+    elif gameType == 'chicken-game':
+        h = round(rng.uniform(V/2, V))
+    elif gameType == 'no-predefined-game-type':
+        h = round(rng.uniform(0, V))
     return h
 
 
+def getFightCosts(V, rng, gameType):
+    """Vectorised getFightCost for a batch of fights
+
+    Arguments:
+        V {numpy.array} -- Values of the properties being fought
+        rng {numpy.random.Generator} -- random number generator to draw the costs from
+        gameType {string} -- type of game, see getFightCost
+
+    Returns:
+        numpy.array -- cost of each fight
+    """
+    V = np.asarray(V, dtype=np.float64)
+    if gameType == 'prisoners-dilema':
+        return np.round(rng.uniform(0, V / 2))
+    elif gameType == 'chicken-game':
+        return np.round(rng.uniform(V / 2, V))
+    elif gameType == 'no-predefined-game-type':
+        return np.round(rng.uniform(0, V))
+    return np.zeros_like(V)
+
+
 def naturalSelection(model):
     """Kill agents with bad performing strategies and replicate the good strategies
 
     Arguments:
         model {Model} -- Mesa model object
     """
-    all_agents = model.schedule.agents
-    agent_wealths = [agent.owner + agent.wealth for agent in all_agents]
-    average_wealth = statistics.mean(agent_wealths)
-
-    for strategy in strategyList:
-        # get fresh list of agents after each iteration
-        all_agents = model.schedule.agents
-        strategy_specific_agents = [
-            agent for agent in all_agents if agent.strategy == strategy]
-        if len(strategy_specific_agents) == 0:
+    profiler = model.profiler
+    if profiler is not None:
+        start = profiler.now()
+    population, wealth = model.strategyTotals()
+    average_wealth = sum(wealth) / sum(population)
+    agents_to_kill = []
+
+    for code, strategy in enumerate(model.strategyList):
+        if population[code] == 0:
             continue
-        strategy_specific_wealth = [
-            agent.wealth + agent.owner for agent in strategy_specific_agents]
-        strategy_average_wealth = statistics.mean(strategy_specific_wealth)
+        strategy_average_wealth = wealth[code] / population[code]
 
         # If this is a loosing strategy - kill weakest agents using this strategy
         # No. of agents to kill is proportional to how less the average
@@ -209,22 +403,24 @@ def naturalSelection(model):
             percentage_to_kill = (
                                          average_wealth - strategy_average_wealth) / average_wealth
             num_agents_to_kill = math.floor(
-                percentage_to_kill * len(strategy_specific_agents))
-            agents_to_kill = sorted(strategy_specific_agents, key=lambda agent: agent.wealth + agent.owner)[
-                             :num_agents_to_kill]
-            for agent in agents_to_kill:
-                agent.die()
-
-    for strategy in strategyList:
-        # get fresh list of agents after each iteration
-        all_agents = model.schedule.agents
-        strategy_specific_agents = [
-            agent for agent in all_agents if agent.strategy == strategy]
-        if len(strategy_specific_agents) == 0:
+                percentage_to_kill * population[code])
+            agents_to_kill.extend(model.poorestAgents(strategy, num_agents_to_kill))
+
+    # the kills of one strategy don't affect the others, apply them in one batch
+    model.removeAgents(agents_to_kill)
+    if profiler is not None:
+        start = profiler.stop('kill', start)
+
+    # get fresh totals after the kills
+    population, wealth = model.strategyTotals()
+    births = []
+    birth_positions = []
+    birth_owners = []
+
+    for code, strategy in enumerate(model.strategyList):
+        if population[code] == 0:
             continue
-        strategy_specific_wealth = [
-            agent.wealth + agent.owner for agent in strategy_specific_agents]
-        strategy_average_wealth = statistics.mean(strategy_specific_wealth)
+        strategy_average_wealth = wealth[code] / population[code]
 
         # If this is a winning strategy - replicate more agents with this strategy
         # No. of replications is proportional to how high the average strategy
@@ -233,17 +429,29 @@ def naturalSelection(model):
             percentage_to_replicate = (
                                               strategy_average_wealth - average_wealth) / average_wealth
             num_agents_to_replicate = math.floor(
-                percentage_to_replicate * len(strategy_specific_agents))
-            agents_to_replicate = random.sample(
+                percentage_to_replicate * population[code])
+            strategy_specific_agents = model.strategyAgents(strategy)
+            agents_to_replicate = model.random.sample(
                 strategy_specific_agents, num_agents_to_replicate)
 
             # Give property to a defined percentage of agents
             num_owners = round(
-                (int(CONFIG_MODEL['percentage_of_owners']) / 100) * num_agents_to_replicate)
-            owner_agents = random.sample(agents_to_replicate, num_owners)
+                (model.config.percentage_of_owners / 100) * num_agents_to_replicate)
+            owner_agents = set(model.random.sample(agents_to_replicate, num_owners))
 
-            # reproduce agents with property
+            # offspring are created now (drawing from the model's random stream
+            # in the same order as before) but added to the model in one batch
             for agent in agents_to_replicate:
-                reborn = agent.reproduce()
-                if agent in owner_agents:
-                    reborn.assignPropertyToAgent()
\ No newline at end of file
+                births.append(agent.spawn())
+                # the reproduced agent will stay on the same position as the parent
+                birth_positions.append(agent.pos)
+                birth_owners.append(agent in owner_agents)
+
+    model.addAgents(births, birth_positions)
+    # reproduce agents with property
+    for reborn, owner in zip(births, birth_owners):
+        if owner:
+            reborn.assignPropertyToAgent()
+    if profiler is not None:
+        profiler.count('births', len(births))
+        profiler.stop('replicate', start)
@@ -0,0 +1,193 @@
+import argparse
+import configparser
+import hashlib
+import itertools
+import json
+import multiprocessing
+import os
+
+import numpy as np
+import pandas as pd
+
+from executor import persistedRootSeed, runSimulation
+from simconfig import SimulationConfig
+
+# Bumped whenever the cached results of a job change meaning
+CACHE_VERSION = 2
+
+
+def readConfig(path='./config/config.ini'):
+    """Read a config file into plain dictionaries
+
+    Arguments:
+        path {string} -- config file
+
+    Returns:
+        dictionary -- the [model] and [results] sections, each a dictionary of strings
+    """
+    config = configparser.ConfigParser()
+    if not config.read(path):
+        raise ValueError('Cannot read config file ' + path)
+    return {section: dict(config[section]) for section in ('model', 'results')}
+
+
+def expandGrid(grid):
+    """Cartesian product of a parameter grid
+
+    Every grid entry maps a [model] option to the list of values to sweep.
+    A value may also be a dictionary of options that are set together (e.g. a
+    population mix), the entry's name is then only a label.
+
+    Arguments:
+        grid {dictionary} -- list of values per option (or label)
+
+    Returns:
+        list -- one dictionary of [model] overrides per grid point
+    """
+    names = list(grid)
+    points = []
+    for values in itertools.product(*(grid[name] for name in names)):
+        point = {}
+        for name, value in zip(names, values):
+            if isinstance(value, dict):
+                point.update(value)
+            else:
+                point[name] = value
+        points.append({key.lower(): str(value) for key, value in point.items()})
+    return points
+
+
+def jobKey(model, seed):
+    """Content address of a job: hash of its complete model options and seed
+
+    Arguments:
+        model {dictionary} -- model options of the job, see SimulationConfig.modelOptions
+        seed {integer} -- seed of the run
+
+    Returns:
+        string -- hexadecimal sha256 digest
+    """
+    content = json.dumps({'version': CACHE_VERSION, 'model': model, 'seed': seed}, sort_keys=True)
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+def cachePath(cache_folder, key):
+    """File holding the results of a job, spread over subfolders by key prefix"""
+    return os.path.join(cache_folder, key[:2], key + '.npz')
+
+
+def _runJob(job):
+    """Run one job in a worker process, see runSweep"""
+    config, run, seed, path = job
+    columns = runSimulation(run, seed, config)
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary = path + '.tmp'
+    with open(temporary, 'wb') as f:
+        np.savez(f, **dict(zip(('run', 'step', 'strategy', 'wealth', 'population'), columns)),
+                 strategies=np.array(config.active_strategies),
+                 config=np.array(json.dumps(config.modelOptions(), sort_keys=True)))
+    os.replace(temporary, path)
+    return path
+
+
+def summarise(path):
+    """Final step statistics of a cached job
+
+    Arguments:
+        path {string} -- cached results of the job
+
+    Returns:
+        dictionary -- steps run, and the population and wealth of every strategy at the last step
+    """
+    with np.load(path, allow_pickle=False) as data:
+        strategies = data['strategies'].tolist()
+        step = data['step']
+        row = {'steps': int(step.max()) + 1 if len(step) else 0}
+        last = step == step.max() if len(step) else step.astype(bool)
+        for code, population, wealth in zip(data['strategy'][last], data['population'][last],
+                                            data['wealth'][last]):
+            row['population_' + strategies[code]] = int(population)
+            row['wealth_' + strategies[code]] = float(wealth)
+    return row
+
+
+def runSweep(grid, runs=1, seed=None, base='./config/config.ini', cache_folder='sweep_cache',
+             processes=None):
+    """Run a parameter sweep, reusing the cached results of jobs that already ran
+
+    The grid is expanded into points (see expandGrid), every point into runs
+    jobs with seeds derived from the root seed (the same seeds for every
+    point). A job's results are stored under the hash of its complete config
+    and seed (see jobKey), so sweeping again, or sweeping an overlapping
+    grid, only runs the jobs that are missing. Jobs run in a pool of worker
+    processes; every job carries its own SimulationConfig, so one warm
+    worker runs any number of configurations one after another. A run gives
+    its belief pool state back when it ends (see EvolutionaryModel.close),
+    so the memory of a worker does not grow with the jobs it ran.
+
+    Arguments:
+        grid {dictionary} -- list of values per [model] option, see expandGrid
+        runs {integer} -- runs (seeds) per grid point
+        seed {integer} -- root seed of the runs, None uses the one kept in the cache folder
+            (drawn on the first sweep), so sweeping again hits the cache
+        base {string} -- config file providing the options that are not swept
+        cache_folder {string} -- folder of the content-addressed result cache
+        processes {integer} -- number of worker processes, None uses all cores
+
+    Returns:
+        pandas.DataFrame -- one row per job: swept options, run, seed, key, whether it was cached and its final statistics
+
+    Raises:
+        ValueError -- if the options of a grid point are invalid, before any job runs
+    """
+    config = readConfig(base)
+    cache_folder = os.path.abspath(cache_folder)
+    if seed is None:
+        os.makedirs(cache_folder, exist_ok=True)
+        seed = persistedRootSeed(os.path.join(cache_folder, 'root_seed'))
+    seeds = [int(s) for s in np.random.SeedSequence(seed).generate_state(runs)]
+
+    rows, pending, keys = [], [], set()
+    for point in expandGrid(grid):
+        unknown = sorted(set(point) - {key.lower() for key in config['model']})
+        if unknown:
+            raise ValueError('Unknown [model] options: ' + ', '.join(unknown))
+        pointConfig = SimulationConfig.fromSections(dict(config['model'], **point), config['results'])
+        for run, runSeed in enumerate(seeds):
+            key = jobKey(pointConfig.modelOptions(), runSeed)
+            path = cachePath(cache_folder, key)
+            cached = os.path.exists(path)
+            rows.append(dict(point, run=run, seed=runSeed, key=key, cached=cached, path=path))
+            if not cached and key not in keys:
+                keys.add(key)
+                pending.append((pointConfig, run, runSeed, path))
+
+    if pending:
+        context = multiprocessing.get_context('spawn')
+        with context.Pool(processes) as pool:
+            for _ in pool.imap_unordered(_runJob, pending):
+                pass
+
+    for row in rows:
+        row.update(summarise(row.pop('path')))
+    return pd.DataFrame(rows)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Sweep config options over a parameter grid')
+    parser.add_argument('grid', help='json file mapping [model] options to lists of values')
+    parser.add_argument('--runs', type=int, default=1, help='runs (seeds) per grid point')
+    parser.add_argument('--seed', type=int, help='root seed of the runs (default: the one kept in the cache)')
+    parser.add_argument('--config', default='./config/config.ini', help='config file with the options that are not swept')
+    parser.add_argument('--cache', default='sweep_cache', help='folder of the result cache')
+    parser.add_argument('--processes', type=int, help='number of worker processes (default: all cores)')
+    parser.add_argument('--output', default='sweep_summary.csv', help='summary table to write')
+    args = parser.parse_args()
+
+    with open(args.grid) as f:
+        grid = json.load(f)
+    summary = runSweep(grid, args.runs, args.seed, args.config, args.cache, args.processes)
+    summary.to_csv(args.output, index=False)
+    print('%d jobs, %d run, %d from the cache, summary written to %s'
+          % (len(summary), (~summary['cached']).sum(), summary['cached'].sum(), args.output))
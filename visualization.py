@@ -1,17 +1,11 @@
 from mesa.visualization.modules import CanvasGrid
 from mesa.visualization.ModularVisualization import ModularServer
 
-import configparser
-
 from model import EvolutionaryModel
+from simconfig import SimulationConfig
 
 # Load the configuration file
-CONFIG = configparser.ConfigParser()
-CONFIG.read("./config/config.ini")
-CONFIG_MODEL = CONFIG['model']
-n_agents = int(CONFIG_MODEL['total_agents'])
-grid_height = int(CONFIG_MODEL['grid_height'])
-grid_width = int(CONFIG_MODEL['grid_width'])
+config = SimulationConfig.fromFile()
 
 
 def agent_portrayal(agent):
@@ -33,14 +27,18 @@ def agent_portrayal(agent):
         portrayal["Color"] = "#9467bd"
     elif agent.strategy == 'traderToM1':
         portrayal["Color"] = "#8c564b"
+    elif agent.strategy == 'traderToM2':
+        portrayal["Color"] = "#e377c2"
+    elif agent.strategy == 'traderToM3':
+        portrayal["Color"] = "#7f7f7f"
 
     return portrayal
 
 
-grid = CanvasGrid(agent_portrayal, grid_width, grid_height, 500, 500)
+grid = CanvasGrid(agent_portrayal, config.grid_width, config.grid_height, 500, 500)
 server = ModularServer(EvolutionaryModel,
                        [grid],
                        "Evolutionary Model",
-                       {"N": n_agents, "width": grid_width, "height": grid_height})
+                       {"config": config})
 server.port = 8521  # The default
 server.launch()